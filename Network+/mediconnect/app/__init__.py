@@ -1,43 +1,96 @@
+import click
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-
-from app.models import db
 
 
 def create_app(config_name='development'):
     """Application factory function"""
     app = Flask(__name__, template_folder='templates', static_folder='static')
     
+    # Models, extensions and blueprints are imported here rather than at
+    # module level, and CLI-only modules (Flask-Migrate/Alembic, the admin
+    # commands) only when the app is loaded by the flask command.
+    from app.models import db
+    cli = click.get_current_context(silent=True) is not None
+    
     # Load configuration
-    if config_name == 'production':
-        from config import ProductionConfig
-        app.config.from_object(ProductionConfig)
-    else:
-        from config import DevelopmentConfig
-        app.config.from_object(DevelopmentConfig)
+    from config import config
+    app.config.from_object(config.get(config_name, config['default']))
     
     # Initialize extensions
+    from app.pool import configure_engine
+    from app.replicas import replica_bind_keys, pin_after_write
+    configure_engine(app)
+    replica_bind_keys(app)
     db.init_app(app)
-    migrate = Migrate(app, db)
     
-    # Create tables within app context
-    with app.app_context():
-        db.create_all()
+    # Registered first so that its after_request hook runs last
+    from app.instrumentation import init_instrumentation
+    init_instrumentation(app)
+    app.after_request(pin_after_write)
+    
+    from app.cache import cache
+    cache.init_app(app)
+    
+    from app.templating import init_templates
+    init_templates(app)
+    
+    from app.sessions import init_sessions
+    init_sessions(app)
+    
+    if cli:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+        
+        from app.search import search_cli
+        app.cli.add_command(search_cli)
+        
+        from app.explain import explain_cli
+        app.cli.add_command(explain_cli)
+        
+        from app.stats import stats_cli
+        app.cli.add_command(stats_cli)
+        
+        from app.tasks import tasks_cli, worker_command
+        app.cli.add_command(tasks_cli)
+        app.cli.add_command(worker_command)
+        
+        from app.templating import templates_cli
+        app.cli.add_command(templates_cli)
+        
+        from app.recommendations import recommendations_cli
+        app.cli.add_command(recommendations_cli)
+        
+        from app.archive import archive_cli
+        app.cli.add_command(archive_cli)
+    
+    # Create missing tables for development and tests. Production schemas
+    # are managed by migrations (flask db upgrade), so workers start without
+    # touching the database.
+    if app.config.get('SCHEMA_AUTO_CREATE'):
+        # Register the job search index DDL before any tables are created
+        from app import search  # noqa: F401
+        with app.app_context():
+            db.create_all()
     
     # Register blueprints
     from app.auth.routes import auth_bp
     from app.doctor.routes import doctor_bp
     from app.hospital.routes import hospital_bp
     from app.admin.routes import admin_bp
+    from app.api.routes import api_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(doctor_bp)
     app.register_blueprint(hospital_bp)
     app.register_blueprint(admin_bp)
+    app.register_blueprint(api_bp)
+    
+    from app.conditional import set_cache_control
+    app.after_request(set_cache_control)
     
     # Home route
     @app.route('/')
+    @cache.cached()
     def index():
         return '''
         <h1>Welcome to MediConnect</h1>
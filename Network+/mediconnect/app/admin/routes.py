@@ -1,6 +1,15 @@
+from datetime import datetime
 from flask import Blueprint, render_template, request, session, redirect, url_for, flash
-from app.models import db, User, Doctor, Hospital, Job, JobApplication
+from app.models import db, User, Doctor, Hospital, Job, JobApplication, with_loaders
+from app.archive import close_hospital_jobs, purge_user
+from app.cache import cache
 from app.decorators import role_required
+from app.instrumentation import metrics_response, scrape_authorized
+from app.pagination import paginate_list
+from app.recommendations import refresh_job_recommendations
+from app.sessions import invalidate_user_sessions
+from app.stats import admin_dashboard_stats, report_stats
+from app.templating import render_page
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin', template_folder='../templates/admin')
 
@@ -9,35 +18,26 @@ admin_bp = Blueprint('admin', __name__, url_prefix='/admin', template_folder='..
 @role_required('admin')
 def dashboard():
     """Admin dashboard with system statistics"""
-    stats = {
-        'total_users': User.query.count(),
-        'verified_users': User.query.filter_by(is_verified=True).count(),
-        'unverified_users': User.query.filter_by(is_verified=False).count(),
-        'doctors': User.query.filter_by(role='doctor').count(),
-        'hospitals': User.query.filter_by(role='hospital').count(),
-        'total_jobs': Job.query.count(),
-        'active_jobs': Job.query.filter_by(status='active').count(),
-        'total_applications': JobApplication.query.count()
-    }
+    stats = admin_dashboard_stats()
     
-    return render_template('dashboard.html', stats=stats)
+    return render_template('admin/dashboard.html', stats=stats)
 
 
 @admin_bp.route('/users')
 @role_required('admin')
 def users():
     """Manage all users"""
-    page = request.args.get('page', 1, type=int)
     role_filter = request.args.get('role', '', type=str)
     
-    query = User.query
+    # Deactivated users are being purged; they are no longer listed
+    query = with_loaders(User.query, 'admin.users').filter(User.deleted_at.is_(None))
     
     if role_filter:
         query = query.filter_by(role=role_filter)
     
-    users_list = query.order_by(User.created_at.desc()).paginate(page=page, per_page=10)
+    users_list = paginate_list(query, User.created_at, User.id)
     
-    return render_template('users.html', users=users_list, role_filter=role_filter)
+    return render_page('users.html', users=users_list, role_filter=role_filter)
 
 
 @admin_bp.route('/user/<int:user_id>/verify', methods=['POST'])
@@ -49,6 +49,8 @@ def verify_user(user_id):
     try:
         user.is_verified = True
         db.session.commit()
+        cache.invalidate('users')
+        invalidate_user_sessions(user.id)
         flash(f'User {user.username} verified successfully', 'success')
     except Exception as e:
         db.session.rollback()
@@ -69,8 +71,16 @@ def deactivate_user(user_id):
         return redirect(url_for('admin.users'))
     
     try:
-        db.session.delete(user)
+        # Soft delete; the purge_user task removes the user and their data in batches
+        if user.deleted_at is None:
+            user.deleted_at = datetime.utcnow()
+            # Its postings go off the job board now, not when the purge gets to them
+            if user.hospital is not None:
+                close_hospital_jobs(user.hospital.id)
+            purge_user.enqueue(idempotency_key=f'purge:user:{user.id}', user_id=user.id)
         db.session.commit()
+        cache.invalidate('users', 'jobs')
+        invalidate_user_sessions(user.id)
         flash(f'User {user.username} deactivated', 'success')
     except Exception as e:
         db.session.rollback()
@@ -83,17 +93,16 @@ def deactivate_user(user_id):
 @role_required('admin')
 def jobs():
     """Manage all job postings"""
-    page = request.args.get('page', 1, type=int)
     status_filter = request.args.get('status', '', type=str)
     
-    query = Job.query
+    query = with_loaders(Job.query, 'admin.jobs')
     
     if status_filter:
         query = query.filter_by(status=status_filter)
     
-    jobs_list = query.order_by(Job.created_at.desc()).paginate(page=page, per_page=10)
+    jobs_list = paginate_list(query, Job.created_at, Job.id)
     
-    return render_template('jobs.html', jobs=jobs_list, status_filter=status_filter)
+    return render_page('jobs.html', jobs=jobs_list, status_filter=status_filter)
 
 
 @admin_bp.route('/job/<int:job_id>/close', methods=['POST'])
@@ -103,8 +112,11 @@ def close_job(job_id):
     job = Job.query.get_or_404(job_id)
     
     try:
+        if job.status != 'closed':
+            refresh_job_recommendations.enqueue(idempotency_key=f'recommendations:job:{job.id}:closed', job_id=job.id)
         job.status = 'closed'
         db.session.commit()
+        cache.invalidate('jobs')
         flash(f'Job "{job.title}" closed', 'success')
     except Exception as e:
         db.session.rollback()
@@ -117,38 +129,37 @@ def close_job(job_id):
 @role_required('admin')
 def applications():
     """View all job applications"""
-    page = request.args.get('page', 1, type=int)
     status_filter = request.args.get('status', '', type=str)
     
-    query = JobApplication.query
+    query = with_loaders(JobApplication.query, 'admin.applications')
     
     if status_filter:
         query = query.filter_by(status=status_filter)
     
-    applications_list = query.order_by(JobApplication.applied_at.desc()).paginate(page=page, per_page=10)
+    applications_list = paginate_list(query, JobApplication.applied_at, JobApplication.id)
     
-    return render_template('applications.html', applications=applications_list, status_filter=status_filter)
+    return render_page('applications.html', applications=applications_list, status_filter=status_filter)
 
 
 @admin_bp.route('/reports')
 @role_required('admin')
+@cache.cached(tags=('users', 'jobs', 'applications'), per_user=True)
 def reports():
     """View system reports"""
-    # Job statistics
-    job_stats = {
-        'by_status': db.session.query(Job.status, db.func.count(Job.id)).group_by(Job.status).all(),
-        'by_specialization': db.session.query(Job.specialization, db.func.count(Job.id)).group_by(Job.specialization).all()
-    }
-    
-    # Application statistics
-    app_stats = {
-        'by_status': db.session.query(JobApplication.status, db.func.count(JobApplication.id)).group_by(JobApplication.status).all()
-    }
-    
-    # User statistics
-    user_stats = {
-        'by_role': db.session.query(User.role, db.func.count(User.id)).group_by(User.role).all(),
-        'by_verification': db.session.query(User.is_verified, db.func.count(User.id)).group_by(User.is_verified).all()
-    }
-    
-    return render_template('reports.html', job_stats=job_stats, app_stats=app_stats, user_stats=user_stats)
+    job_stats, app_stats, user_stats = report_stats()
+    
+    return render_template('admin/reports.html', job_stats=job_stats, app_stats=app_stats, user_stats=user_stats)
+
+
+@admin_bp.route('/metrics')
+def metrics():
+    """Prometheus metrics of the worker serving the request"""
+    # Scrapers authenticate with METRICS_TOKEN instead of a session
+    if scrape_authorized():
+        return metrics_response()
+    return admin_metrics()
+
+
+@role_required('admin')
+def admin_metrics():
+    return metrics_response()
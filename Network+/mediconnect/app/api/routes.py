@@ -0,0 +1,267 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+
+from flask import Blueprint, Response, abort, g, jsonify, request, session, stream_with_context
+from werkzeug.exceptions import HTTPException
+
+from app.models import db, Doctor, Hospital, Job, JobApplication
+from app.decorators import role_required
+from app.pagination import keyset_paginate
+from app.pool import pool_stats
+from app.search import search_jobs
+from app.stats import admin_dashboard_stats, report_stats
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Selectable fields per resource; ?fields=id,title picks a subset
+JOB_FIELDS = {
+    'id': Job.id,
+    'hospital_id': Job.hospital_id,
+    'hospital_name': Hospital.hospital_name,
+    'title': Job.title,
+    'specialization': Job.specialization,
+    'description': Job.description,
+    'location': Job.location,
+    'salary_min': Job.salary_min,
+    'salary_max': Job.salary_max,
+    'experience_required': Job.experience_required,
+    'job_type': Job.job_type,
+    'status': Job.status,
+    'created_at': Job.created_at,
+    'updated_at': Job.updated_at,
+}
+
+APPLICATION_FIELDS = {
+    'id': JobApplication.id,
+    'job_id': JobApplication.job_id,
+    'job_title': Job.title,
+    'hospital_id': Job.hospital_id,
+    'doctor_id': JobApplication.doctor_id,
+    'doctor_name': Doctor.full_name,
+    'doctor_specialization': Doctor.specialization,
+    'status': JobApplication.status,
+    'cover_letter': JobApplication.cover_letter,
+    'applied_at': JobApplication.applied_at,
+    'reviewed_at': JobApplication.reviewed_at,
+}
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+EXPORT_BATCH_SIZE = 1000
+
+
+@api_bp.before_request
+def require_login():
+    """API clients authenticate with the session cookie; answer 401 instead of redirecting"""
+    if 'user_id' not in session:
+        return jsonify(error='Authentication required'), 401
+
+
+@api_bp.errorhandler(HTTPException)
+def http_error(error):
+    """Report errors as JSON"""
+    return jsonify(error=error.description), error.code
+
+
+def selected_fields(available):
+    """Parse ?fields=a,b into an ordered list of field names"""
+    requested = request.args.get('fields', '', type=str)
+    names = [name.strip() for name in requested.split(',') if name.strip()] or list(available)
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        abort(400, f'Unknown field(s): {", ".join(unknown)}. Available: {", ".join(available)}')
+    return names
+
+
+def select_columns(available, names, *required):
+    """Columns to SELECT: the requested fields plus any needed for paging"""
+    columns = [available[name].label(name) for name in names]
+    columns += [available[name].label(name) for name in required if name not in names]
+    return columns
+
+
+def serialize(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def to_dict(row, names):
+    return {name: serialize(getattr(row, name)) for name in names}
+
+
+def jobs_query(columns):
+    """Jobs visible to the current user, filtered by the query string"""
+    query = db.session.query(*columns).select_from(Job).join(Hospital, Job.hospital_id == Hospital.id)
+
+    role = session.get('role')
+    if role == 'doctor':
+        query = query.filter(Job.status == 'active')
+    elif role == 'hospital':
+        query = query.filter(Job.hospital_id == getattr(g.hospital, 'id', None))
+
+    status = request.args.get('status', '', type=str)
+    if status:
+        query = query.filter(Job.status == status)
+    hospital_id = request.args.get('hospital_id', type=int)
+    if hospital_id:
+        query = query.filter(Job.hospital_id == hospital_id)
+
+    query, _ = search_jobs(
+        query,
+        request.args.get('search', '', type=str),
+        request.args.get('specialization', '', type=str),
+        request.args.get('location', '', type=str)
+    )
+    # Results are always ordered by creation date so that cursors stay valid
+    return query.order_by(None)
+
+
+def applications_query(columns):
+    """Applications visible to the current user, filtered by the query string"""
+    query = db.session.query(*columns).select_from(JobApplication).join(
+        Job, JobApplication.job_id == Job.id
+    ).join(Doctor, JobApplication.doctor_id == Doctor.id)
+
+    role = session.get('role')
+    if role == 'doctor':
+        query = query.filter(JobApplication.doctor_id == getattr(g.doctor, 'id', None))
+    elif role == 'hospital':
+        query = query.filter(Job.hospital_id == getattr(g.hospital, 'id', None))
+
+    status = request.args.get('status', '', type=str)
+    if status:
+        query = query.filter(JobApplication.status == status)
+    job_id = request.args.get('job_id', type=int)
+    if job_id:
+        query = query.filter(JobApplication.job_id == job_id)
+    return query
+
+
+def cursor_page(query, available, names, sort_name):
+    """JSON body for one keyset page of a column query"""
+    limit = min(max(request.args.get('limit', DEFAULT_LIMIT, type=int), 1), MAX_LIMIT)
+    page = keyset_paginate(
+        query,
+        available[sort_name],
+        available['id'],
+        cursor=request.args.get('cursor', type=str) or None,
+        per_page=limit
+    )
+    return jsonify(
+        data=[to_dict(row, names) for row in page.items],
+        next_cursor=page.next_cursor,
+        prev_cursor=page.prev_cursor,
+        limit=limit
+    )
+
+
+def export(query, names, filename):
+    """Stream every row of a query as NDJSON (default) or CSV.
+
+    Rows are fetched EXPORT_BATCH_SIZE at a time through a server-side
+    cursor, so memory use does not grow with the size of the export.
+    """
+    export_format = request.args.get('format', 'ndjson', type=str)
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify(error='format must be ndjson or csv'), 400
+
+    rows = query.yield_per(EXPORT_BATCH_SIZE)
+
+    def generate_ndjson():
+        for row in rows:
+            yield json.dumps(to_dict(row, names)) + '\n'
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(names)
+        for count, row in enumerate(rows, 1):
+            writer.writerow([serialize(getattr(row, name)) for name in names])
+            if count % EXPORT_BATCH_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    if export_format == 'csv':
+        body, mimetype = generate_csv(), 'text/csv'
+    else:
+        body, mimetype = generate_ndjson(), 'application/x-ndjson'
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}.{export_format}'}
+    )
+
+
+@api_bp.route('/jobs')
+@role_required('doctor', 'hospital', 'admin')
+def jobs():
+    """List jobs, newest first, with cursor pagination"""
+    names = selected_fields(JOB_FIELDS)
+    query = jobs_query(select_columns(JOB_FIELDS, names, 'id', 'created_at'))
+    return cursor_page(query, JOB_FIELDS, names, 'created_at')
+
+
+@api_bp.route('/jobs/<int:job_id>')
+@role_required('doctor', 'hospital', 'admin')
+def job(job_id):
+    """A single job"""
+    names = selected_fields(JOB_FIELDS)
+    row = jobs_query(select_columns(JOB_FIELDS, names)).filter(Job.id == job_id).first()
+    if row is None:
+        return jsonify(error='Job not found'), 404
+    return jsonify(data=to_dict(row, names))
+
+
+@api_bp.route('/jobs/export')
+@role_required('hospital', 'admin')
+def export_jobs():
+    """Export all matching jobs"""
+    names = selected_fields(JOB_FIELDS)
+    query = jobs_query(select_columns(JOB_FIELDS, names)).order_by(Job.id)
+    return export(query, names, 'jobs')
+
+
+@api_bp.route('/applications')
+@role_required('doctor', 'hospital', 'admin')
+def applications():
+    """List applications, newest first, with cursor pagination"""
+    names = selected_fields(APPLICATION_FIELDS)
+    query = applications_query(select_columns(APPLICATION_FIELDS, names, 'id', 'applied_at'))
+    return cursor_page(query, APPLICATION_FIELDS, names, 'applied_at')
+
+
+@api_bp.route('/applications/export')
+@role_required('hospital', 'admin')
+def export_applications():
+    """Export all matching applications"""
+    names = selected_fields(APPLICATION_FIELDS)
+    query = applications_query(select_columns(APPLICATION_FIELDS, names)).order_by(JobApplication.id)
+    return export(query, names, 'applications')
+
+
+@api_bp.route('/reports')
+@role_required('admin')
+def reports():
+    """System statistics"""
+    job_stats, app_stats, user_stats = report_stats()
+    return jsonify(
+        totals=admin_dashboard_stats(),
+        jobs_by_status=dict(job_stats['by_status']),
+        jobs_by_specialization=dict(job_stats['by_specialization']),
+        applications_by_status=dict(app_stats['by_status']),
+        users_by_role=dict(user_stats['by_role']),
+        users_by_verification={str(verified).lower(): count for verified, count in user_stats['by_verification']}
+    )
+
+
+@api_bp.route('/metrics/pool')
+@role_required('admin')
+def pool_metrics():
+    """Connection pool state of the worker serving the request"""
+    return jsonify(pool_stats(db.engine))
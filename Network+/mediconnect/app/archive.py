@@ -0,0 +1,219 @@
+"""
+Archival of closed jobs and purging of deactivated users.
+
+Jobs closed for ARCHIVE_AFTER_DAYS days (counted from their last update)
+are moved with their applications to the archived_jobs and
+archived_job_applications tables, so the hot tables only hold live
+postings. `flask archive run`, scheduled daily, moves ARCHIVE_BATCH_SIZE
+jobs per transaction with set-based INSERT ... SELECT and DELETE
+statements; no row is loaded into the ORM.
+
+Deactivating a user is a soft delete: deleted_at is set, the user can no
+longer log in, their sessions end, they leave the user counts and a
+hospital's active jobs are closed (close_hospital_jobs). The purge_user
+task then deletes what they own in batches of ARCHIVE_BATCH_SIZE rows, one
+transaction each, and finally the user. Archived rows of the user go too.
+
+Stat counters are kept in step with the bulk deletes (stats.count_deleted),
+so the dashboards count live rows only.
+"""
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app.cache import cache
+from app.models import (
+    db, User, Job, JobApplication, JobRecommendation, ArchivedJob, ArchivedJobApplication
+)
+from app.recommendations import refresh_doctors, refresh_job_recommendations
+from app.stats import count_deleted, count_updated, job_keys
+from app.tasks import task
+
+
+archive_cli = AppGroup('archive', help='Archival and purge commands.')
+
+
+def _batch_size():
+    return current_app.config.get('ARCHIVE_BATCH_SIZE', 100)
+
+
+def _move(model, archive_model, condition, archived_at):
+    """Copy the rows matching a condition to their archive table, then delete them"""
+    names = [column.name for column in archive_model.__table__.columns if column.name != 'archived_at']
+    source = model.__table__
+    db.session.execute(archive_model.__table__.insert().from_select(
+        names + ['archived_at'],
+        db.select(*[source.c[name] for name in names], db.literal(archived_at, db.DateTime)).where(condition)
+    ))
+    count_deleted(model, condition)
+    return db.session.execute(db.delete(model).where(condition), execution_options={'synchronize_session': False}).rowcount
+
+
+def archive_batch(cutoff, batch_size):
+    """Archive up to batch_size jobs closed before cutoff, with their applications.
+
+    Returns (jobs, applications) archived, in the current transaction.
+    """
+    job_ids = db.session.execute(
+        db.select(Job.id).where(Job.status == 'closed', Job.updated_at < cutoff).order_by(Job.id).limit(batch_size)
+    ).scalars().all()
+    if not job_ids:
+        return 0, 0
+
+    now = datetime.utcnow()
+    applications = _move(JobApplication, ArchivedJobApplication, JobApplication.job_id.in_(job_ids), now)
+    db.session.execute(db.delete(JobRecommendation).where(JobRecommendation.job_id.in_(job_ids)),
+                       execution_options={'synchronize_session': False})
+    jobs = _move(Job, ArchivedJob, Job.id.in_(job_ids), now)
+    return jobs, applications
+
+
+def _delete_batch(model, condition, batch_size):
+    """Delete up to batch_size rows matching a condition; returns how many"""
+    ids = db.session.execute(
+        db.select(model.id).where(condition).order_by(model.id).limit(batch_size)
+    ).scalars().all()
+    if ids:
+        count_deleted(model, model.id.in_(ids))
+        db.session.execute(db.delete(model).where(model.id.in_(ids)), execution_options={'synchronize_session': False})
+    return len(ids)
+
+
+def _close_jobs(hospital_id, batch_size=None):
+    """Close up to batch_size (default all) active jobs of a hospital; returns their ids"""
+    query = db.select(Job.id, Job.specialization).where(Job.hospital_id == hospital_id, Job.status == 'active')
+    if batch_size is not None:
+        query = query.order_by(Job.id).limit(batch_size)
+    rows = db.session.execute(query).all()
+    if not rows:
+        return []
+
+    job_ids = [row.id for row in rows]
+    db.session.execute(db.update(Job).where(Job.id.in_(job_ids)).values(status='closed'),
+                       execution_options={'synchronize_session': False})
+    count_updated((job_keys(hospital_id, 'active', row.specialization),
+                   job_keys(hospital_id, 'closed', row.specialization)) for row in rows)
+    return job_ids
+
+
+def close_hospital_jobs(hospital_id):
+    """Close every active job of a deactivated hospital in the current transaction.
+
+    The worker then refills the recommendations of the doctors that had the
+    jobs. Returns the number of jobs closed.
+    """
+    job_ids = _close_jobs(hospital_id)
+    for job_id in job_ids:
+        refresh_job_recommendations.enqueue(idempotency_key=f'recommendations:job:{job_id}:closed', job_id=job_id)
+    return len(job_ids)
+
+
+def _close_jobs_batch(hospital_id, batch_size):
+    """Close up to batch_size active jobs of a hospital; their doctors get new recommendations"""
+    job_ids = _close_jobs(hospital_id, batch_size)
+    if not job_ids:
+        return 0
+
+    doctor_ids = db.session.execute(
+        db.select(JobRecommendation.doctor_id).where(JobRecommendation.job_id.in_(job_ids)).distinct()
+    ).scalars().all()
+    db.session.execute(db.delete(JobRecommendation).where(JobRecommendation.job_id.in_(job_ids)),
+                       execution_options={'synchronize_session': False})
+    refresh_doctors(sorted(doctor_ids))
+    return len(job_ids)
+
+
+def purge_batch(user, batch_size):
+    """Delete the next batch of a soft-deleted user's rows, or the user itself.
+
+    Returns the number of rows deleted; 0 once the user is gone.
+    """
+    steps = []
+    if user.doctor is not None:
+        doctor_id = user.doctor.id
+        steps += [
+            lambda: _delete_batch(JobApplication, JobApplication.doctor_id == doctor_id, batch_size),
+            lambda: _delete_batch(JobRecommendation, JobRecommendation.doctor_id == doctor_id, batch_size),
+            lambda: _delete_batch(ArchivedJobApplication, ArchivedJobApplication.doctor_id == doctor_id, batch_size),
+        ]
+    if user.hospital is not None:
+        hospital_id = user.hospital.id
+        jobs = db.select(Job.id).where(Job.hospital_id == hospital_id)
+        archived_jobs = db.select(ArchivedJob.id).where(ArchivedJob.hospital_id == hospital_id)
+        steps += [
+            # Normally closed at deactivation already; any still active are closed first
+            lambda: _close_jobs_batch(hospital_id, batch_size),
+            lambda: _delete_batch(JobApplication, JobApplication.job_id.in_(jobs), batch_size),
+            lambda: _delete_batch(Job, Job.hospital_id == hospital_id, batch_size),
+            lambda: _delete_batch(ArchivedJobApplication, ArchivedJobApplication.job_id.in_(archived_jobs), batch_size),
+            lambda: _delete_batch(ArchivedJob, ArchivedJob.hospital_id == hospital_id, batch_size),
+        ]
+
+    for step in steps:
+        deleted = step()
+        if deleted:
+            return deleted
+
+    for profile in (user.doctor, user.hospital):
+        if profile is not None:
+            db.session.delete(profile)
+    db.session.flush()
+    db.session.delete(user)
+    return 0
+
+
+def purge(user_id):
+    """Purge a soft-deleted user, committing after every batch"""
+    batch_size = _batch_size()
+    deleted = 0
+    while True:
+        user = db.session.get(User, user_id)
+        # Gone already, or restored since the purge was queued
+        if user is None or user.deleted_at is None:
+            return deleted
+        count = purge_batch(user, batch_size)
+        db.session.commit()
+        deleted += count
+        if not count:
+            cache.invalidate('users', 'jobs', 'applications')
+            return deleted
+
+
+@task('purge_user')
+def purge_user(user_id):
+    purge(user_id)
+
+
+@archive_cli.command('run')
+@click.option('--days', type=int, help='Archive jobs closed this many days ago (default ARCHIVE_AFTER_DAYS).')
+def run(days):
+    """Move old closed jobs and their applications to the archive tables."""
+    days = current_app.config.get('ARCHIVE_AFTER_DAYS', 180) if days is None else days
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    batch_size = _batch_size()
+    total_jobs = total_applications = 0
+    while True:
+        jobs, applications = archive_batch(cutoff, batch_size)
+        db.session.commit()
+        total_jobs += jobs
+        total_applications += applications
+        if jobs < batch_size:
+            break
+    if total_jobs:
+        cache.invalidate('jobs', 'applications')
+    click.echo(f'Archived {total_jobs} job(s) closed before {cutoff:%Y-%m-%d} '
+               f'and {total_applications} application(s).')
+
+
+@archive_cli.command('purge-users')
+def purge_users():
+    """Purge every deactivated user now (normally done by the purge_user task)."""
+    user_ids = db.session.execute(
+        db.select(User.id).where(User.deleted_at.is_not(None)).order_by(User.id)
+    ).scalars().all()
+    for user_id in user_ids:
+        deleted = purge(user_id)
+        click.echo(f'Purged user {user_id} ({deleted} row(s)).')
+    click.echo(f'Purged {len(user_ids)} user(s).')
@@ -0,0 +1,227 @@
+"""
+ASGI serving mode.
+
+AsyncApp serves the Flask app to an ASGI server (uvicorn), for workloads
+where requests mostly wait on the database and a worker should keep many
+connections open at once:
+
+- GET/HEAD requests to the read-heavy endpoints in ASYNC_ENDPOINTS run on
+  the event loop against SQLAlchemy's asyncio engine (aiosqlite or
+  asyncpg). The views themselves are unchanged: each request runs in a
+  greenlet bridged to an AsyncSession (run_sync), so while a statement waits
+  on the database the loop serves other requests.
+- Every other request runs the regular WSGI app in a pool of ASGI_THREADS
+  threads, so forms, uploads and the API behave exactly as under gunicorn.
+
+Only database waits yield to the loop: template rendering, the cache and
+the session store still run on it, so keep their backends fast (local
+SQLite or Redis). Requests on the async path use the primary database
+(ASYNC_DATABASE_URL); read replicas are not used there.
+
+Needs uvicorn, greenlet (for SQLAlchemy's asyncio extension) and the
+asyncio driver of the database, aiosqlite or asyncpg; all are pinned in
+requirements.txt.
+"""
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.exceptions import HTTPException
+
+from app.instrumentation import instrument_engine
+from app.models import db
+from app.pool import engine_options
+
+
+# Endpoints served on the asyncio engine (GET and HEAD only)
+ASYNC_ENDPOINTS = frozenset({
+    'doctor.browse_jobs',
+    'doctor.recommended_jobs',
+    'hospital.dashboard',
+    'hospital.my_jobs',
+    'admin.dashboard',
+    'admin.users',
+    'admin.jobs',
+    'admin.applications',
+    'admin.reports',
+})
+
+# asyncio driver for each backend of DATABASE_URL
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg'}
+
+
+def async_database_url(config):
+    """ASYNC_DATABASE_URL, or the database URL with the asyncio driver of its backend"""
+    url = make_url(config.get('ASYNC_DATABASE_URL') or config['SQLALCHEMY_DATABASE_URI'])
+    backend = url.get_backend_name()
+    if url.get_driver_name() == ASYNC_DRIVERS.get(backend):
+        return url
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No asyncio driver for {backend!r}; set ASYNC_DATABASE_URL')
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+
+def create_engine(config):
+    """The asyncio engine, with the engine profile of the sync one"""
+    url = async_database_url(config)
+    options = engine_options(config, url.render_as_string(hide_password=False))
+    # The metered pool is a sync pool; the asyncio engine uses its own
+    options.pop('poolclass', None)
+    engine = create_async_engine(url, echo=config.get('SQLALCHEMY_ECHO', False), **options)
+    instrument_engine(engine.sync_engine)
+    return engine
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP request"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def _response_start(status, headers):
+    return {
+        'type': 'http.response.start',
+        'status': int(status.split(' ', 1)[0]),
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    }
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+class AsyncApp:
+    """ASGI application serving a Flask app (see the module docstring)"""
+
+    def __init__(self, app):
+        self.app = app
+        self.engine = create_engine(app.config)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.executor = ThreadPoolExecutor(app.config.get('ASGI_THREADS', 8), thread_name_prefix='wsgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'Unsupported ASGI scope type {scope["type"]!r}')
+
+        environ = build_environ(scope, await _read_body(receive))
+        if self.is_async(environ):
+            await self._call_async(environ, send)
+        else:
+            await self._call_wsgi(environ, send)
+
+    def is_async(self, environ):
+        """Whether a request is served on the asyncio engine"""
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return False
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return False
+        return endpoint in ASYNC_ENDPOINTS
+
+    def _dispatch(self, session, environ):
+        """Run one request with db.session bound to an AsyncSession's sync session.
+
+        Called through run_sync, so the views' queries await the database
+        without blocking the loop. The body is read here too, because
+        streamed pages render (and query) while they are iterated.
+        """
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+
+        with self.app.app_context():
+            db.session.registry.set(session)
+            iterable = self.app(environ, start_response)
+            try:
+                body = b''.join(iterable)
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+        return started[0], started[1], body
+
+    async def _call_async(self, environ, send):
+        async with self.sessionmaker() as session:
+            status, headers, body = await session.run_sync(self._dispatch, environ)
+        await send(_response_start(status, headers))
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _call_wsgi(self, environ, send):
+        loop = asyncio.get_running_loop()
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            # The whole response is produced in one thread, since a streamed
+            # body carries the request context of the thread that started it
+            started = []
+
+            def start_response(status, headers, exc_info=None):
+                started[:] = [status, headers]
+
+            iterable = self.app(environ, start_response)
+            try:
+                send_from_thread(_response_start(*started))
+                for chunk in iterable:
+                    if chunk:
+                        send_from_thread({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                send_from_thread({'type': 'http.response.body', 'body': b''})
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+
+        await loop.run_in_executor(self.executor, run)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
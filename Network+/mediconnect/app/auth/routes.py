@@ -1,6 +1,9 @@
 from flask import Blueprint, render_template, request, session, redirect, url_for, flash
-from app.models import db, User, Doctor, Hospital
-from werkzeug.security import generate_password_hash
+from app.cache import cache
+from app.models import db, User, Doctor, Hospital, insert_ignore
+from app.passwords import PasswordServiceBusy, login_throttle, passwords
+from app.sessions import user_fields
+from app.stats import count_inserted, user_keys
 from datetime import datetime
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth', template_folder='../templates/auth')
@@ -26,22 +29,27 @@ def register():
             flash('Passwords do not match', 'danger')
             return redirect(url_for('auth.register'))
         
-        if User.query.filter_by(username=username).first():
-            flash('Username already exists', 'danger')
-            return redirect(url_for('auth.register'))
-        
-        if User.query.filter_by(email=email).first():
-            flash('Email already registered', 'danger')
-            return redirect(url_for('auth.register'))
-        
         try:
-            # Create user
-            user = User(username=username, email=email, role=role, is_verified=False)
-            user.set_password(password)
-            db.session.add(user)
-            db.session.commit()
+            # Create the user unless the username or email is taken; the
+            # unique constraints decide, so concurrent sign-ups cannot race
+            user = insert_ignore(User, {
+                'username': username,
+                'email': email,
+                'password_hash': passwords.hash(password),
+                'role': role,
+                'is_verified': False
+            }, User.id)
             
-            # Create role-specific profile
+            if user is None:
+                db.session.rollback()
+                if User.query.filter_by(username=username).first():
+                    flash('Username already exists', 'danger')
+                else:
+                    flash('Email already registered', 'danger')
+                return redirect(url_for('auth.register'))
+            count_inserted(user_keys(role, False))
+            
+            # Create role-specific profile in the same transaction
             if role == 'doctor':
                 doctor = Doctor(user_id=user.id, full_name='', specialization='')
                 db.session.add(doctor)
@@ -50,6 +58,7 @@ def register():
                 db.session.add(hospital)
             
             db.session.commit()
+            cache.invalidate('users')
             flash('Registration successful! Please login.', 'success')
             return redirect(url_for('auth.login'))
         
@@ -73,14 +82,31 @@ def login():
             flash('Username and password required', 'danger')
             return redirect(url_for('auth.login'))
         
-        user = User.query.filter_by(username=username).first()
+        # Refuse throttled attempts before spending a password hash on them
+        retry_after = login_throttle.retry_after(username, request.remote_addr)
+        if retry_after:
+            flash(f'Too many failed login attempts. Try again in {(retry_after + 59) // 60} minute(s).', 'danger')
+            return render_template('login.html'), 429, {'Retry-After': str(retry_after)}
+        
+        user = User.query.filter_by(username=username, deleted_at=None).first()
         
-        if user and user.check_password(password):
-            session['user_id'] = user.id
-            session['username'] = user.username
-            session['role'] = user.role
-            session['email'] = user.email
-            session['is_verified'] = user.is_verified
+        try:
+            valid = user is not None and user.check_password(password)
+        except PasswordServiceBusy:
+            flash('The server is busy. Please try again in a moment.', 'danger')
+            return render_template('login.html'), 503, {'Retry-After': '1'}
+        
+        if valid:
+            login_throttle.succeeded(username)
+            if user.password_needs_rehash():
+                # Upgrade the stored hash to the current hashing parameters
+                try:
+                    user.set_password(password)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+            
+            session.update(user_fields(user))
             
             flash(f'Welcome back, {username}!', 'success')
             
@@ -92,6 +118,7 @@ def login():
             else:  # hospital
                 return redirect(url_for('hospital.dashboard'))
         else:
+            login_throttle.failed(username, request.remote_addr)
             flash('Invalid username or password', 'danger')
             return redirect(url_for('auth.login'))
     
@@ -0,0 +1,301 @@
+"""
+Server-side caching.
+
+One backend is chosen per application through CACHE_TYPE:
+
+- ``null``: caching disabled
+- ``lru``: in-process LRU dictionary (per worker)
+- ``sqlite``: a SQLite file shared by every worker on the host
+- ``redis``: a Redis-compatible server shared by every host (needs ``redis``)
+
+Entries are grouped by tags ('jobs', 'applications', 'users'). Every tag has
+a version that is part of the keys of the entries depending on it, so
+``cache.invalidate('jobs')`` makes all of them unreachable at once; routes
+call it after committing a change. The in-process LRU only sees its own
+worker's invalidations, so run a shared backend with more than one worker.
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request, session
+
+
+class NullCache:
+    """Backend that stores nothing"""
+
+    def get_many(self, keys):
+        return [None] * len(keys)
+
+    def set(self, key, value, timeout=None):
+        pass
+
+    def add(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None or (entry[0] and entry[0] <= now):
+                    self._entries.pop(key, None)
+                    values.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    values.append(entry[1])
+        return values
+
+    def set(self, key, value, timeout=None):
+        expires = time.monotonic() + timeout if timeout else 0
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def add(self, key, value):
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (0, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache:
+    """Cache in a local SQLite file, shared between worker processes"""
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, keys):
+        rows = self._connect().execute(
+            f'SELECT key, value FROM cache WHERE key IN ({", ".join("?" * len(keys))}) '
+            'AND (expires = 0 OR expires > ?)',
+            (*keys, time.time())
+        ).fetchall()
+        found = {key: pickle.loads(value) for key, value in rows}
+        return [found.get(key) for key in keys]
+
+    def set(self, key, value, timeout=None):
+        connection = self._connect()
+        expires = time.time() + timeout if timeout else 0
+        connection.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)', (key, pickle.dumps(value), expires))
+
+        # Prune expired entries, then the oldest ones, every few hundred writes
+        self._writes += 1
+        if self._writes % 500 == 0:
+            connection.execute('DELETE FROM cache WHERE expires != 0 AND expires <= ?', (time.time(),))
+            connection.execute(
+                'DELETE FROM cache WHERE expires != 0 AND rowid IN '
+                '(SELECT rowid FROM cache ORDER BY rowid DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+    def add(self, key, value):
+        self._connect().execute('INSERT OR IGNORE INTO cache VALUES (?, ?, 0)', (key, pickle.dumps(value)))
+
+    def delete(self, key):
+        self._connect().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self):
+        self._connect().execute('DELETE FROM cache')
+
+
+class RedisCache:
+    """Cache in a Redis-compatible server"""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CACHE_TYPE = "redis" requires the redis package')
+        self.client = redis.Redis.from_url(url)
+
+    def get_many(self, keys):
+        return [None if value is None else pickle.loads(value) for value in self.client.mget(keys)]
+
+    def set(self, key, value, timeout=None):
+        self.client.set(key, pickle.dumps(value), ex=int(timeout) if timeout else None)
+
+    def add(self, key, value):
+        self.client.set(key, pickle.dumps(value), nx=True)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def clear(self):
+        for key in self.client.scan_iter(current_app.config.get('CACHE_KEY_PREFIX', '') + '*'):
+            self.client.delete(key)
+
+
+def make_backend(config):
+    """Create the backend selected by CACHE_TYPE"""
+    cache_type = config.get('CACHE_TYPE', 'null')
+    if cache_type == 'null':
+        return NullCache()
+    if cache_type == 'lru':
+        return LRUCache(config.get('CACHE_LRU_ENTRIES', 1024))
+    if cache_type == 'sqlite':
+        return SQLiteCache(config['CACHE_SQLITE_PATH'], config.get('CACHE_SQLITE_ENTRIES', 10000))
+    if cache_type == 'redis':
+        if not config.get('CACHE_REDIS_URL'):
+            raise ValueError('CACHE_TYPE = "redis" requires CACHE_REDIS_URL')
+        return RedisCache(config['CACHE_REDIS_URL'])
+    raise ValueError(f'Unknown CACHE_TYPE {cache_type!r}')
+
+
+class Cache:
+    """Tagged cache with view and function decorators"""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('CACHE_SQLITE_PATH'):
+            app.config['CACHE_SQLITE_PATH'] = os.path.join(app.instance_path, 'cache.sqlite')
+        app.extensions['cache'] = make_backend(app.config)
+
+    @property
+    def backend(self):
+        return current_app.extensions['cache']
+
+    def _key(self, *parts):
+        return current_app.config.get('CACHE_KEY_PREFIX', '') + ':'.join(str(part) for part in parts)
+
+    def _versioned(self, key, tags):
+        """Prefix a key with the current version of each of its tags"""
+        parts = key if isinstance(key, tuple) else (key,)
+        if not tags:
+            return self._key(*parts)
+        tag_keys = [self._key('tag', tag) for tag in tags]
+        versions = self.backend.get_many(tag_keys)
+        for index, version in enumerate(versions):
+            if version is None:
+                # A new (or evicted) tag starts at a unique version, so entries
+                # stored under an older version can never match again
+                self.backend.add(tag_keys[index], time.time_ns())
+                versions[index] = self.backend.get_many([tag_keys[index]])[0]
+        return self._key(*versions, *parts)
+
+    def get(self, key, tags=()):
+        return self.backend.get_many([self._versioned(key, tags)])[0]
+
+    def set(self, key, value, timeout=None, tags=()):
+        if timeout is None:
+            timeout = current_app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+        self.backend.set(self._versioned(key, tags), value, timeout)
+
+    def get_or_set(self, key, compute, timeout=None, tags=()):
+        """Return the cached value of key, computing and storing it on a miss"""
+        versioned = self._versioned(key, tags)
+        value = self.backend.get_many([versioned])[0]
+        if value is None:
+            value = compute()
+            if timeout is None:
+                timeout = current_app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+            self.backend.set(versioned, value, timeout)
+        return value
+
+    def invalidate(self, *tags):
+        """Drop every entry stored under any of the tags"""
+        for tag in tags:
+            self.backend.set(self._key('tag', tag), time.time_ns())
+
+    def clear(self):
+        self.backend.clear()
+
+    def memoize(self, timeout=None, tags=()):
+        """Cache a function's return value per combination of arguments.
+
+        Arguments must have a stable repr; the return value must be
+        picklable for shared backends and must not be None.
+        """
+        def decorator(f):
+            name = f'{f.__module__}.{f.__qualname__}'
+
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                digest = hashlib.sha1(repr((args, sorted(kwargs.items()))).encode()).hexdigest()
+                return self.get_or_set(('memo', name, digest), lambda: f(*args, **kwargs), timeout, tags)
+            decorated_function.uncached = f
+            return decorated_function
+        return decorator
+
+    def cached(self, timeout=None, tags=(), per_user=False):
+        """Cache the response of a GET view.
+
+        Keys include the path and query string, plus the user id when the
+        page shows per-user content (per_user). Responses are not cached
+        when flashed messages are waiting to be shown.
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if request.method != 'GET' or '_flashes' in session:
+                    return f(*args, **kwargs)
+
+                query = '&'.join(f'{key}={value}' for key, value in sorted(request.args.items(multi=True)))
+                key = ('view', request.path, query, session.get('user_id') if per_user else '')
+                versioned = self._versioned(key, tags)
+                hit = self.backend.get_many([versioned])[0]
+                if hit is not None:
+                    body, status, mimetype = hit
+                    return current_app.response_class(body, status=status, mimetype=mimetype)
+
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code == 200 and not response.direct_passthrough and not response.is_streamed:
+                    self.backend.set(versioned, (response.get_data(), response.status_code, response.mimetype),
+                                     timeout if timeout is not None
+                                     else current_app.config.get('CACHE_DEFAULT_TIMEOUT', 300))
+                return response
+            return decorated_function
+        return decorator
+
+
+cache = Cache()
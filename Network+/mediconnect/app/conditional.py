@@ -0,0 +1,86 @@
+"""
+HTTP conditional requests and Cache-Control.
+
+Pages rendered with render_conditional() carry an ETag computed from the
+data they display (rows, pagination state, filters and the viewing user).
+A request whose If-None-Match still matches gets a 304 before the template
+is rendered. No Last-Modified is sent: the newest row on a list page can get
+older (a job closes and drops off it) and counts change without touching
+updated_at, so a date would let If-Modified-Since match stale pages.
+
+set_cache_control() marks anonymous pages as publicly cacheable for
+HTTP_CACHE_MAX_AGE seconds, so a reverse proxy can serve them, and
+logged-in pages as private and always revalidated.
+"""
+import hashlib
+
+from flask import current_app, make_response, render_template, request, session
+from werkzeug.http import is_resource_modified
+
+
+# Pagination attributes that affect what a list page displays
+PAGE_ATTRIBUTES = ('mode', 'page', 'pages', 'total', 'prev_cursor', 'next_cursor', 'has_prev', 'has_next')
+
+
+def page_state(pagination):
+    """The pagination state of a page, for use in validators"""
+    return tuple(getattr(pagination, name, None) for name in PAGE_ATTRIBUTES)
+
+
+def row_state(obj):
+    """The column values of a model instance, for use in validators"""
+    return tuple((column.key, getattr(obj, column.key)) for column in obj.__table__.columns)
+
+
+def compute_etag(template_name, validators):
+    """ETag of a page rendered for the current user from the given data"""
+    data = repr((
+        current_app.config.get('ETAG_SALT', ''),
+        template_name,
+        session.get('user_id'),
+        session.get('role'),
+        validators,
+    ))
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+def render_conditional(template_name, validators, **context):
+    """Render a template, or answer 304 Not Modified if the client's copy is current.
+
+    ``validators`` must capture everything on the page that can change
+    (rows, pagination state, filters); its repr is hashed into the ETag.
+    Pages with flashed messages waiting are always rendered.
+    """
+    if '_flashes' in session:
+        return render_template(template_name, **context)
+
+    etag = compute_etag(template_name, validators)
+    if not is_resource_modified(request.environ, etag=etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render_template(template_name, **context))
+
+    # The ETag is derived from the data, not the bytes, hence weak
+    response.set_etag(etag, weak=True)
+    return response
+
+
+def set_cache_control(response):
+    """after_request hook: default Cache-Control for HTML pages"""
+    if 'Cache-Control' in response.headers or request.method not in ('GET', 'HEAD'):
+        return response
+    if response.status_code not in (200, 304) or not response.mimetype == 'text/html':
+        return response
+
+    if 'user_id' in session:
+        # Per-user content: browsers may keep it but must revalidate
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    elif '_flashes' not in session:
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config.get('HTTP_CACHE_MAX_AGE', 0)
+        # Visitors with a session cookie may see something else
+        response.vary.add('Cookie')
+    else:
+        response.cache_control.no_store = True
+    return response
@@ -1,5 +1,48 @@
-from flask import session, redirect, url_for, abort
+from flask import g, session, redirect, url_for, abort
 from functools import wraps
+from sqlalchemy.orm import joinedload
+
+from app.models import db, User
+
+
+# Profile relationship loaded along with the user, by role
+PROFILE_RELATIONSHIPS = {
+    'doctor': User.doctor,
+    'hospital': User.hospital,
+}
+
+
+def load_current_user(refresh=False):
+    """
+    Load the logged-in user and its role profile once per request.
+    
+    The user and its Doctor/Hospital row are fetched in a single joined
+    query and kept on flask.g as g.user and g.profile (also g.doctor or
+    g.hospital), so route handlers and ownership checks do not query them
+    again. Returns None when nobody is logged in or the user no longer exists
+    (or was deactivated).
+    
+    role_required passes refresh=True: an application context (and its g)
+    outlives a single request in CLI commands and tests.
+    """
+    if 'user' in g and not refresh:
+        return g.user
+    
+    user = None
+    if 'user_id' in session:
+        relationship = PROFILE_RELATIONSHIPS.get(session.get('role'))
+        options = [joinedload(relationship)] if relationship is not None else []
+        user = db.session.get(User, session['user_id'], options=options)
+        if user is not None and user.deleted_at is not None:
+            user = None
+    
+    g.user = user
+    g.profile = None
+    for role in PROFILE_RELATIONSHIPS:
+        profile = getattr(user, role) if user is not None and user.role == role else None
+        setattr(g, role, profile)
+        g.profile = g.profile or profile
+    return user
 
 
 def role_required(*roles):
@@ -29,6 +72,13 @@ def role_required(*roles):
             if user_role not in roles:
                 abort(403)  # Forbidden
             
+            # Resolve the user and profile for handlers of profile roles; the
+            # account may have been deleted since the session was issued.
+            # Other handlers call load_current_user() if they need the user.
+            if user_role in PROFILE_RELATIONSHIPS and load_current_user(refresh=True) is None:
+                session.clear()
+                return redirect(url_for('auth.login'))
+            
             return f(*args, **kwargs)
         return decorated_function
     return decorator
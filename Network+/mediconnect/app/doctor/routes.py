@@ -1,6 +1,13 @@
-from flask import Blueprint, render_template, request, session, redirect, url_for, flash
-from app.models import db, User, Doctor, Job, JobApplication
+from flask import Blueprint, abort, g, render_template, request, redirect, url_for, flash
+from app.models import db, User, Doctor, Job, JobApplication, JobRecommendation, insert_ignore, with_loaders
+from app.cache import cache
+from app.conditional import page_state, render_conditional, row_state
 from app.decorators import role_required
+from app.pagination import PageSnapshot, page_position, paginate_at, paginate_list
+from app.recommendations import refresh_doctor_recommendations, rescore_applications, score
+from app.search import search_jobs
+from app.stats import application_keys, count_inserted
+from app.templating import render_page
 
 doctor_bp = Blueprint('doctor', __name__, url_prefix='/doctor', template_folder='../templates/doctor')
 
@@ -9,59 +16,88 @@ doctor_bp = Blueprint('doctor', __name__, url_prefix='/doctor', template_folder=
 @role_required('doctor')
 def browse_jobs():
     """Browse available job listings"""
-    page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '', type=str)
     specialization = request.args.get('specialization', '', type=str)
     location = request.args.get('location', '', type=str)
     
-    query = Job.query.filter_by(status='active')
+    jobs = active_jobs_page(search, specialization, location, page_position())
     
-    if search:
-        query = query.filter(Job.title.ilike(f'%{search}%'))
-    
-    if specialization:
-        query = query.filter(Job.specialization.ilike(f'%{specialization}%'))
-    
-    if location:
-        query = query.filter(Job.location.ilike(f'%{location}%'))
-    
-    jobs = query.paginate(page=page, per_page=10)
-    
-    return render_template('browse_jobs.html', jobs=jobs, search=search)
+    return render_conditional(
+        'doctor/browse_jobs.html',
+        (search, specialization, location, page_state(jobs), jobs.items),
+        jobs=jobs, search=search, specialization=specialization, location=location
+    )
+
+
+def job_summary(job):
+    """The fields of a job shown in the listing, detached from the session"""
+    return {
+        'id': job.id,
+        'title': job.title,
+        'specialization': job.specialization,
+        'location': job.location,
+        'job_type': job.job_type,
+        'salary_min': job.salary_min,
+        'salary_max': job.salary_max,
+        'experience_required': job.experience_required,
+        'description': job.description,
+        'updated_at': job.updated_at,
+        'hospital': {'hospital_name': job.hospital.hospital_name},
+    }
+
+
+@cache.memoize(tags=('jobs',))
+def active_jobs_page(search, specialization, location, position):
+    """One page of active jobs matching the filters, cached until jobs change"""
+    query = with_loaders(Job.query, 'doctor.browse_jobs').filter_by(status='active')
+    query, ranked = search_jobs(query, search, specialization, location)
+    
+    if ranked:
+        # Search results are ordered by relevance, so they page by number
+        jobs = query.paginate(page=position.page or 1, per_page=10)
+    else:
+        jobs = paginate_at(query, Job.created_at, Job.id, position)
+    
+    return PageSnapshot(jobs, job_summary)
 
 
 @doctor_bp.route('/apply-job/<int:job_id>', methods=['POST'])
 @role_required('doctor')
 def apply_job(job_id):
     """Apply for a job"""
-    job = Job.query.get_or_404(job_id)
-    doctor = Doctor.query.filter_by(user_id=session['user_id']).first()
+    doctor = g.doctor
     
     if not doctor:
         flash('Doctor profile not found', 'danger')
         return redirect(url_for('doctor.browse_jobs'))
     
-    # Check if already applied
-    existing_application = JobApplication.query.filter_by(
-        job_id=job_id, 
-        doctor_id=doctor.id
+    job = db.session.query(Job.hospital_id, Job.specialization, Job.experience_required, Job.location).filter(
+        Job.id == job_id
     ).first()
-    
-    if existing_application:
-        flash('You have already applied for this job', 'warning')
-        return redirect(url_for('doctor.browse_jobs'))
+    if job is None:
+        abort(404)
     
     cover_letter = request.form.get('cover_letter', '')
     
     try:
-        application = JobApplication(
-            job_id=job_id,
-            doctor_id=doctor.id,
-            cover_letter=cover_letter,
-            status='pending'
-        )
-        db.session.add(application)
+        # The unique (job_id, doctor_id) constraint rejects a second
+        # application atomically, including from concurrent requests
+        application = insert_ignore(JobApplication, {
+            'job_id': job_id,
+            'doctor_id': doctor.id,
+            'cover_letter': cover_letter,
+            'status': 'pending',
+            'match_score': round(score(doctor, job), 4)
+        }, JobApplication.id)
+        
+        if application is None:
+            db.session.rollback()
+            flash('You have already applied for this job', 'warning')
+            return redirect(url_for('doctor.browse_jobs'))
+        
+        count_inserted(application_keys(job.hospital_id, 'pending'))
         db.session.commit()
+        cache.invalidate('applications')
         flash('Application submitted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -74,25 +110,41 @@ def apply_job(job_id):
 @role_required('doctor')
 def my_applications():
     """View doctor's job applications"""
-    doctor = Doctor.query.filter_by(user_id=session['user_id']).first()
+    doctor = g.doctor
+    
+    if not doctor:
+        flash('Doctor profile not found', 'danger')
+        return redirect(url_for('doctor.browse_jobs'))
+    
+    query = with_loaders(JobApplication.query, 'doctor.my_applications').filter_by(doctor_id=doctor.id)
+    applications = paginate_list(query, JobApplication.applied_at, JobApplication.id)
+    
+    return render_page('applied_jobs.html', applications=applications)
+
+
+@doctor_bp.route('/recommended-jobs')
+@role_required('doctor')
+def recommended_jobs():
+    """Best matching active jobs for the doctor"""
+    doctor = g.doctor
     
     if not doctor:
         flash('Doctor profile not found', 'danger')
         return redirect(url_for('doctor.browse_jobs'))
     
-    page = request.args.get('page', 1, type=int)
-    applications = JobApplication.query.filter_by(
-        doctor_id=doctor.id
-    ).order_by(JobApplication.applied_at.desc()).paginate(page=page, per_page=10)
+    recommendations = with_loaders(JobRecommendation.query, 'doctor.recommended_jobs').filter(
+        JobRecommendation.doctor_id == doctor.id,
+        JobRecommendation.job.has(Job.status == 'active')
+    ).order_by(JobRecommendation.score.desc(), JobRecommendation.job_id.desc()).all()
     
-    return render_template('applied_jobs.html', applications=applications)
+    return render_template('recommended_jobs.html', recommendations=recommendations)
 
 
 @doctor_bp.route('/profile', methods=['GET', 'POST'])
 @role_required('doctor')
 def profile():
     """View and edit doctor profile"""
-    doctor = Doctor.query.filter_by(user_id=session['user_id']).first()
+    doctor = g.doctor
     
     if not doctor:
         flash('Doctor profile not found', 'danger')
@@ -100,6 +152,7 @@ def profile():
     
     if request.method == 'POST':
         try:
+            matching = (doctor.specialization, doctor.experience_years, doctor.location)
             doctor.full_name = request.form.get('full_name', doctor.full_name)
             doctor.specialization = request.form.get('specialization', doctor.specialization)
             doctor.experience_years = request.form.get('experience_years', doctor.experience_years, type=int)
@@ -107,7 +160,11 @@ def profile():
             doctor.location = request.form.get('location', doctor.location)
             doctor.bio = request.form.get('bio', doctor.bio)
             
+            if (doctor.specialization, doctor.experience_years, doctor.location) != matching:
+                rescore_applications(doctor)
+                refresh_doctor_recommendations.enqueue(doctor_id=doctor.id)
             db.session.commit()
+            cache.invalidate('users')
             flash('Profile updated successfully!', 'success')
         except Exception as e:
             db.session.rollback()
@@ -115,4 +172,4 @@ def profile():
         
         return redirect(url_for('doctor.profile'))
     
-    return render_template('profile.html', doctor=doctor)
+    return render_conditional('doctor/profile.html', row_state(doctor), doctor=doctor)
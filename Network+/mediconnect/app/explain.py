@@ -0,0 +1,162 @@
+"""
+Query plan checks for the list routes.
+
+Drives every list route through the test client, captures the SQL each one
+runs and EXPLAINs it, failing when a hot table is read with a full scan
+instead of an index. Routes that filter (by role, status, owner or job)
+must also look their rows up through the index: walking a whole index in
+order, which is how the unfiltered lists are served, counts as a full scan
+for them. Run it against a scratch database, e.g.:
+
+    FLASK_ENV=testing flask explain routes --seed
+"""
+import json
+import re
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event
+
+from app.models import db, User, Hospital, Doctor, Job
+
+
+explain_cli = AppGroup('explain', help='Query plan checks.')
+
+# Tables that grow with usage and must never be scanned by a list route
+HOT_TABLES = {'users', 'doctors', 'hospitals', 'jobs', 'job_applications', 'job_recommendations'}
+
+
+def list_routes():
+    """(endpoint, role, url, filtered) for every list route, in keyset and filtered modes"""
+    hospital = db.session.query(Hospital).join(Job).first()
+    job = Job.query.filter_by(hospital_id=hospital.id).first()
+    return [
+        ('admin.users', 'admin', '/admin/users?cursor=', False),
+        ('admin.users', 'admin', '/admin/users?role=doctor&cursor=', True),
+        ('admin.jobs', 'admin', '/admin/jobs?cursor=', False),
+        ('admin.jobs', 'admin', '/admin/jobs?status=active&cursor=', True),
+        ('admin.applications', 'admin', '/admin/applications?cursor=', False),
+        ('admin.applications', 'admin', '/admin/applications?status=pending&cursor=', True),
+        # Served by walking the partial index of active jobs
+        ('doctor.browse_jobs', 'doctor', '/doctor/browse-jobs?cursor=', False),
+        ('doctor.my_applications', 'doctor', '/doctor/my-applications?cursor=', True),
+        ('doctor.recommended_jobs', 'doctor', '/doctor/recommended-jobs', True),
+        ('hospital.my_jobs', hospital.user_id, '/hospital/my-jobs?cursor=', True),
+        ('hospital.applicants', hospital.user_id, f'/hospital/job/{job.id}/applicants?cursor=', True),
+        ('hospital.applicants', hospital.user_id, f'/hospital/job/{job.id}/applicants?status=pending&min_match=50&cursor=', True),
+        ('hospital.applicants', hospital.user_id, f'/hospital/job/{job.id}/applicants?sort=recent&cursor=', True),
+    ]
+
+
+def login_as(client, role_or_user_id):
+    """Put a user into the test client's session without a password check"""
+    if isinstance(role_or_user_id, int):
+        user = db.session.get(User, role_or_user_id)
+    elif role_or_user_id == 'doctor':
+        user = db.session.query(User).join(Doctor).first()
+    else:
+        user = User.query.filter_by(role=role_or_user_id).first()
+
+    with client.session_transaction() as session:
+        session['user_id'] = user.id
+        session['username'] = user.username
+        session['role'] = user.role
+        session['email'] = user.email
+        session['is_verified'] = user.is_verified
+
+
+def capture_statements(client, url):
+    """Run a GET and return the (statement, parameters) of every SELECT it issued"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    if response.status_code != 200:
+        raise click.ClickException(f'GET {url} returned {response.status_code}')
+    return statements
+
+
+def full_scans(statement, parameters, filtered=False):
+    """Return the hot tables a statement reads with a full table scan.
+
+    With filtered=True, reading a whole index (an index scan without an
+    index condition) also counts.
+    """
+    connection = db.session.connection()
+
+    if connection.dialect.name == 'postgresql':
+        # Planner costs on a small seeded dataset favour sequential scans;
+        # disabling them reveals whether a usable index exists at all.
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        scans, nodes = set(), [plan[0]['Plan']]
+        while nodes:
+            node = nodes.pop()
+            whole_index = node['Node Type'] in ('Index Scan', 'Index Only Scan') and 'Index Cond' not in node
+            scanned = node['Node Type'] == 'Seq Scan' or (filtered and whole_index)
+            if scanned and node.get('Relation Name') in HOT_TABLES:
+                scans.add(node['Relation Name'])
+            nodes.extend(node.get('Plans', []))
+        return scans
+
+    # SQLite reports "SCAN <table>" for a full scan, "SCAN <table> USING
+    # [COVERING] INDEX ..." for a walk of a whole index and "SEARCH ..." for
+    # an index lookup.
+    scans = set()
+    for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters):
+        detail = row[-1]
+        if detail.startswith('SCAN ') and (filtered or 'USING' not in detail):
+            # Strip SQLAlchemy alias suffixes such as hospitals_1
+            table = re.sub(r'_\d+$', '', detail.split()[1])
+            if table in HOT_TABLES:
+                scans.add(table)
+    return scans
+
+
+def check_routes():
+    """EXPLAIN every list route; returns a list of (endpoint, url, tables) failures"""
+    failures = []
+    for endpoint, who, url, filtered in list_routes():
+        client = current_app.test_client()
+        login_as(client, who)
+        for statement, parameters in capture_statements(client, url):
+            scans = full_scans(statement, parameters, filtered)
+            if scans:
+                failures.append((endpoint, url, sorted(scans), statement))
+        db.session.rollback()
+    return failures
+
+
+@explain_cli.command('routes')
+@click.option('--seed/--no-seed', default=False, help='Seed a synthetic dataset first.')
+@click.option('--verbose', is_flag=True, help='Print the offending statements.')
+def routes(seed, verbose):
+    """Check that every list route is served by index scans"""
+    if seed:
+        from app.seed import seed_dataset
+        counts = seed_dataset()
+        click.echo('Seeded ' + ', '.join(f'{count} {name}' for name, count in counts.items()))
+
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(db.text('ANALYZE'))
+    failures = check_routes()
+
+    for endpoint, url, tables, statement in failures:
+        click.echo(f'FULL SCAN  {endpoint:<24} {url}  ({", ".join(tables)})')
+        if verbose:
+            click.echo(f'    {statement}')
+    if failures:
+        raise click.ClickException(f'{len(failures)} statement(s) scan a hot table')
+    click.echo('All list routes use index scans')
@@ -1,40 +1,41 @@
-from flask import Blueprint, render_template, request, session, redirect, url_for, flash
-from app.models import db, User, Hospital, Job, JobApplication, Doctor
+from datetime import datetime
+from flask import Blueprint, g, jsonify, render_template, request, redirect, url_for, flash
+from app.models import db, User, Hospital, Job, JobApplication, Doctor, with_loaders
+from app.cache import cache
+from app.conditional import page_state, render_conditional, row_state
 from app.decorators import role_required
+from app.notifications import queue_status_notifications
+from app.pagination import paginate_list
+from app.recommendations import refresh_job_recommendations
+from app.stats import application_keys, count_updated, hospital_dashboard_stats
+from app.templating import render_page
 
 hospital_bp = Blueprint('hospital', __name__, url_prefix='/hospital', template_folder='../templates/hospital')
 
+REVIEW_STATUSES = ('reviewed', 'accepted', 'rejected')
+BULK_REVIEW_LIMIT = 500
+
 
 @hospital_bp.route('/dashboard')
 @role_required('hospital')
 def dashboard():
     """Hospital dashboard"""
-    hospital = Hospital.query.filter_by(user_id=session['user_id']).first()
+    hospital = g.hospital
     
     if not hospital:
         flash('Hospital profile not found', 'danger')
         return redirect(url_for('auth.login'))
     
-    stats = {
-        'total_jobs': Job.query.filter_by(hospital_id=hospital.id).count(),
-        'active_jobs': Job.query.filter_by(hospital_id=hospital.id, status='active').count(),
-        'total_applications': db.session.query(JobApplication).join(Job).filter(
-            Job.hospital_id == hospital.id
-        ).count(),
-        'pending_applications': db.session.query(JobApplication).join(Job).filter(
-            Job.hospital_id == hospital.id,
-            JobApplication.status == 'pending'
-        ).count()
-    }
+    stats = hospital_dashboard_stats(hospital.id)
     
-    return render_template('dashboard.html', hospital=hospital, stats=stats)
+    return render_template('hospital/dashboard.html', hospital=hospital, stats=stats)
 
 
 @hospital_bp.route('/post-job', methods=['GET', 'POST'])
 @role_required('hospital')
 def post_job():
     """Post a new job"""
-    hospital = Hospital.query.filter_by(user_id=session['user_id']).first()
+    hospital = g.hospital
     
     if not hospital:
         flash('Hospital profile not found', 'danger')
@@ -55,7 +56,10 @@ def post_job():
                 status='active'
             )
             db.session.add(job)
+            db.session.flush()
+            refresh_job_recommendations.enqueue(idempotency_key=f'recommendations:job:{job.id}:active', job_id=job.id)
             db.session.commit()
+            cache.invalidate('jobs')
             flash('Job posted successfully!', 'success')
             return redirect(url_for('hospital.my_jobs'))
         except Exception as e:
@@ -70,18 +74,21 @@ def post_job():
 @role_required('hospital')
 def my_jobs():
     """View hospital's job postings"""
-    hospital = Hospital.query.filter_by(user_id=session['user_id']).first()
+    hospital = g.hospital
     
     if not hospital:
         flash('Hospital profile not found', 'danger')
         return redirect(url_for('auth.login'))
     
-    page = request.args.get('page', 1, type=int)
-    jobs = Job.query.filter_by(hospital_id=hospital.id).order_by(
-        Job.created_at.desc()
-    ).paginate(page=page, per_page=10)
+    query = with_loaders(Job.query, 'hospital.my_jobs').filter_by(hospital_id=hospital.id)
+    jobs = paginate_list(query, Job.created_at, Job.id)
     
-    return render_template('my_jobs.html', jobs=jobs)
+    rows = [(job.id, job.updated_at, job.application_count) for job in jobs.items]
+    return render_conditional(
+        'hospital/my_jobs.html',
+        (page_state(jobs), rows),
+        jobs=jobs
+    )
 
 
 @hospital_bp.route('/job/<int:job_id>/applicants')
@@ -91,16 +98,25 @@ def applicants(job_id):
     job = Job.query.get_or_404(job_id)
     
     # Verify hospital owns this job
-    if job.hospital_id != Hospital.query.filter_by(user_id=session['user_id']).first().id:
+    if job.hospital_id != getattr(g.hospital, 'id', None):
         flash('Unauthorized access', 'danger')
         return redirect(url_for('hospital.my_jobs'))
     
-    page = request.args.get('page', 1, type=int)
-    applications = JobApplication.query.filter_by(job_id=job_id).order_by(
-        JobApplication.applied_at.desc()
-    ).paginate(page=page, per_page=10)
+    sort = request.args.get('sort', 'match', type=str)
+    status_filter = request.args.get('status', '', type=str)
+    min_match = request.args.get('min_match', 0, type=int)  # percent
+    
+    query = with_loaders(JobApplication.query, 'hospital.applicants').filter_by(job_id=job_id)
+    if status_filter:
+        query = query.filter_by(status=status_filter)
+    if min_match:
+        query = query.filter(JobApplication.match_score >= min_match / 100)
+    
+    sort_column = JobApplication.applied_at if sort == 'recent' else JobApplication.match_score
+    applications = paginate_list(query, sort_column, JobApplication.id)
     
-    return render_template('applicants.html', job=job, applications=applications)
+    return render_page('applicants.html', job=job, applications=applications,
+                       sort=sort, status_filter=status_filter, min_match=min_match)
 
 
 @hospital_bp.route('/application/<int:app_id>/review', methods=['POST'])
@@ -111,7 +127,7 @@ def review_application(app_id):
     status = request.form.get('status')  # 'reviewed', 'accepted', 'rejected'
     
     # Verify hospital owns the job
-    if application.job.hospital_id != Hospital.query.filter_by(user_id=session['user_id']).first().id:
+    if application.job.hospital_id != getattr(g.hospital, 'id', None):
         flash('Unauthorized access', 'danger')
         return redirect(url_for('hospital.my_jobs'))
     
@@ -120,9 +136,9 @@ def review_application(app_id):
         return redirect(url_for('hospital.applicants', job_id=application.job_id))
     
     try:
-        application.status = status
-        application.reviewed_at = db.func.now()
+        review_applications(g.hospital.id, {application.id: status})
         db.session.commit()
+        cache.invalidate('applications')
         flash(f'Application marked as {status}', 'success')
     except Exception as e:
         db.session.rollback()
@@ -131,11 +147,130 @@ def review_application(app_id):
     return redirect(url_for('hospital.applicants', job_id=application.job_id))
 
 
+def review_applications(hospital_id, changes):
+    """Set the status of many applications at once.
+
+    ``changes`` maps application ids to new statuses. Ownership is checked
+    with one join and every permitted change is written by a single UPDATE,
+    which only matches applications still in the status read before it, so
+    a concurrent review of the same application (a double submit) is never
+    counted or notified twice. Applications already in the requested status
+    are left alone. Returns one result per id: 'updated', 'invalid_status',
+    'not_found' or 'forbidden'.
+    """
+    results = {}
+    for app_id, status in changes.items():
+        if status not in REVIEW_STATUSES:
+            results[app_id] = 'invalid_status'
+    
+    requested = [app_id for app_id in changes if app_id not in results]
+    rows = db.session.query(JobApplication.id, JobApplication.status, Job.hospital_id).join(
+        Job, JobApplication.job_id == Job.id
+    ).filter(JobApplication.id.in_(requested)).all() if requested else []
+    
+    current = {}
+    for app_id, status, owner_id in rows:
+        if owner_id == hospital_id:
+            current[app_id] = status
+        else:
+            results[app_id] = 'forbidden'
+    for app_id in requested:
+        results.setdefault(app_id, 'not_found' if app_id not in current else 'updated')
+    
+    pending = {app_id: status for app_id, status in current.items() if status != changes[app_id]}
+    while pending:
+        written = db.session.execute(
+            db.update(JobApplication).where(
+                JobApplication.id.in_(pending),
+                JobApplication.status == db.case(pending, value=JobApplication.id)
+            ).values(
+                status=db.case({app_id: changes[app_id] for app_id in pending}, value=JobApplication.id),
+                status_version=JobApplication.status_version + 1,
+                reviewed_at=datetime.utcnow()
+            ).returning(JobApplication.id, JobApplication.status_version),
+            execution_options={'synchronize_session': False}
+        ).all()
+        count_updated(
+            (application_keys(hospital_id, pending[app_id]), application_keys(hospital_id, changes[app_id]))
+            for app_id, _ in written
+        )
+        queue_status_notifications((app_id, changes[app_id], version) for app_id, version in written)
+        # Applications another request changed in the meantime are read again
+        stale = set(pending).difference(app_id for app_id, _ in written)
+        pending = {app_id: status for app_id, status in db.session.execute(
+            db.select(JobApplication.id, JobApplication.status).where(JobApplication.id.in_(stale))
+        ) if status != changes[app_id]} if stale else {}
+    return {app_id: results[app_id] for app_id in changes}
+
+
+@hospital_bp.route('/applications/review', methods=['POST'])
+@role_required('hospital')
+def bulk_review():
+    """Review many applications in one request.
+
+    Accepts a form with application_ids and one status, or JSON of the form
+    {"items": [{"id": 1, "status": "accepted"}, ...]}, which is answered
+    with per-item results.
+    """
+    hospital = g.hospital
+    
+    if request.is_json:
+        items = (request.get_json(silent=True) or {}).get('items')
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            return jsonify(error='Expected {"items": [{"id": ..., "status": ...}, ...]}'), 400
+        try:
+            changes = {int(item['id']): item.get('status') for item in items}
+        except (KeyError, TypeError, ValueError):
+            return jsonify(error='Every item needs an integer id'), 400
+    else:
+        status = request.form.get('status')
+        changes = {app_id: status for app_id in request.form.getlist('application_ids', type=int)}
+    
+    if len(changes) > BULK_REVIEW_LIMIT:
+        message = f'At most {BULK_REVIEW_LIMIT} applications can be reviewed at once'
+        if request.is_json:
+            return jsonify(error=message), 400
+        flash(message, 'danger')
+        return redirect(request.referrer or url_for('hospital.my_jobs'))
+    
+    try:
+        results = review_applications(getattr(hospital, 'id', None), changes)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        if request.is_json:
+            return jsonify(error=f'Error updating applications: {str(e)}'), 500
+        flash(f'Error updating applications: {str(e)}', 'danger')
+        return redirect(request.referrer or url_for('hospital.my_jobs'))
+    
+    updated = sum(1 for result in results.values() if result == 'updated')
+    if updated:
+        cache.invalidate('applications')
+    
+    if request.is_json:
+        return jsonify(
+            updated=updated,
+            results=[{'id': app_id, 'status': changes[app_id], 'result': result}
+                     for app_id, result in results.items()]
+        )
+    
+    if not changes:
+        flash('No applications selected', 'warning')
+    elif updated == len(changes):
+        flash(f'{updated} application(s) marked as {status}', 'success')
+    else:
+        flash(f'{updated} of {len(changes)} application(s) updated', 'warning')
+    job_id = request.form.get('job_id', type=int)
+    if job_id:
+        return redirect(url_for('hospital.applicants', job_id=job_id))
+    return redirect(url_for('hospital.my_jobs'))
+
+
 @hospital_bp.route('/profile', methods=['GET', 'POST'])
 @role_required('hospital')
 def profile():
     """View and edit hospital profile"""
-    hospital = Hospital.query.filter_by(user_id=session['user_id']).first()
+    hospital = g.hospital
     
     if not hospital:
         flash('Hospital profile not found', 'danger')
@@ -152,6 +287,8 @@ def profile():
             hospital.description = request.form.get('description', hospital.description)
             
             db.session.commit()
+            # The hospital name is shown in the job listings
+            cache.invalidate('users', 'jobs')
             flash('Profile updated successfully!', 'success')
         except Exception as e:
             db.session.rollback()
@@ -159,4 +296,4 @@ def profile():
         
         return redirect(url_for('hospital.profile'))
     
-    return render_template('profile.html', hospital=hospital)
+    return render_conditional('hospital/profile.html', row_state(hospital), hospital=hospital)
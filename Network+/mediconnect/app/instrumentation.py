@@ -0,0 +1,262 @@
+"""
+Request and SQL instrumentation.
+
+For every request this records the wall time, the number of SQL statements
+and the time spent in them, per endpoint. The totals are exported in the
+Prometheus text format by /admin/metrics and sent to the browser in a
+Server-Timing header (SERVER_TIMING).
+
+Statements are also grouped by shape (the SQL text with IN lists
+collapsed). A shape executed N_PLUS_ONE_THRESHOLD times or more within one
+request is logged as a likely N+1 pattern, and any statement slower than
+SLOW_QUERY_MS is logged with the types of its bound parameters (never their
+values).
+
+Metrics are kept per process; with several gunicorn workers each scrape
+sees the worker that served it.
+"""
+import hmac
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from app.models import db
+from app.pool import WAIT_BUCKETS, pool_stats
+
+
+# Upper bounds (seconds) of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_IN_LIST = re.compile(r'\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    """The SQL text with whitespace normalized and IN lists collapsed"""
+    return _IN_LIST.sub('(...)', _WHITESPACE.sub(' ', statement).strip())
+
+
+def parameter_shape(parameters):
+    """Type names of bound parameters, e.g. (int, str)"""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            return [parameter_shape(parameters[0]), f'x{len(parameters)}']
+        return tuple(type(value).__name__ for value in parameters)
+    return type(parameters).__name__
+
+
+class RequestStats:
+    """SQL activity of the current request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.statements = 0
+        self.db_time = 0.0
+        self.shapes = Counter()
+
+
+class Metrics:
+    """Per-endpoint request and SQL totals of this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()  # (endpoint, method, status)
+        self.duration_buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+        self.duration_sum = Counter()
+        self.duration_count = Counter()
+        self.statements = Counter()
+        self.db_time = Counter()
+        self.n_plus_one = Counter()
+        self.slow_queries = 0
+
+    def record(self, endpoint, method, status, duration, stats, n_plus_one):
+        with self._lock:
+            self.requests[(endpoint, method, status)] += 1
+            self.duration_sum[endpoint] += duration
+            self.duration_count[endpoint] += 1
+            buckets = self.duration_buckets[endpoint]
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    buckets[index] += 1
+            self.statements[endpoint] += stats.statements
+            self.db_time[endpoint] += stats.db_time
+            if n_plus_one:
+                self.n_plus_one[endpoint] += 1
+
+    def slow_query(self):
+        with self._lock:
+            self.slow_queries += 1
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_label(value)}"' for name, value in labels.items()) + '}'
+
+
+def render_metrics(metrics, engines):
+    """Prometheus text exposition of the metrics and connection pools"""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for suffix, labels, value in samples:
+            lines.append(f'{name}{suffix}{_labels(**labels) if labels else ""} {value}')
+
+    with metrics._lock:
+        metric('mediconnect_requests_total', 'counter', 'Requests by endpoint, method and status.', [
+            ('', {'endpoint': endpoint, 'method': method, 'status': status}, count)
+            for (endpoint, method, status), count in sorted(metrics.requests.items())
+        ])
+
+        samples = []
+        for endpoint in sorted(metrics.duration_count):
+            for bound, count in zip(DURATION_BUCKETS, metrics.duration_buckets[endpoint]):
+                samples.append(('_bucket', {'endpoint': endpoint, 'le': bound}, count))
+            samples.append(('_bucket', {'endpoint': endpoint, 'le': '+Inf'}, metrics.duration_count[endpoint]))
+            samples.append(('_sum', {'endpoint': endpoint}, round(metrics.duration_sum[endpoint], 6)))
+            samples.append(('_count', {'endpoint': endpoint}, metrics.duration_count[endpoint]))
+        metric('mediconnect_request_duration_seconds', 'histogram', 'Request wall time by endpoint.', samples)
+
+        metric('mediconnect_sql_statements_total', 'counter', 'SQL statements executed by endpoint.', [
+            ('', {'endpoint': endpoint}, count) for endpoint, count in sorted(metrics.statements.items())
+        ])
+        metric('mediconnect_sql_duration_seconds_total', 'counter', 'Time spent in SQL statements by endpoint.', [
+            ('', {'endpoint': endpoint}, round(seconds, 6)) for endpoint, seconds in sorted(metrics.db_time.items())
+        ])
+        metric('mediconnect_n_plus_one_requests_total', 'counter',
+               'Requests that repeated a statement shape N_PLUS_ONE_THRESHOLD times or more.', [
+                   ('', {'endpoint': endpoint}, count) for endpoint, count in sorted(metrics.n_plus_one.items())
+               ])
+        metric('mediconnect_slow_queries_total', 'counter', 'Statements slower than SLOW_QUERY_MS.', [
+            ('', {}, metrics.slow_queries)
+        ])
+
+    pools = [(bind or 'default', pool_stats(engine)) for bind, engine in sorted(engines.items(), key=lambda item: item[0] or '')]
+    metric('mediconnect_db_pool_checked_out', 'gauge', 'Connections in use.', [
+        ('', {'bind': bind}, stats['checked_out']) for bind, stats in pools if 'checked_out' in stats
+    ])
+    samples = []
+    for bind, stats in pools:
+        if 'checkout_wait_buckets' not in stats:
+            continue
+        for bound, count in zip(WAIT_BUCKETS, stats['checkout_wait_buckets'].values()):
+            samples.append(('_bucket', {'bind': bind, 'le': bound}, count))
+        samples.append(('_bucket', {'bind': bind, 'le': '+Inf'}, stats['checkouts']))
+        samples.append(('_sum', {'bind': bind}, stats['checkout_wait_seconds_total']))
+        samples.append(('_count', {'bind': bind}, stats['checkouts']))
+    metric('mediconnect_db_pool_wait_seconds', 'histogram', 'Time spent waiting for a pooled connection.', samples)
+    return '\n'.join(lines) + '\n'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._instrument_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - context._instrument_start
+
+    if has_request_context() and '_instrument' in g:
+        stats = g._instrument
+        stats.statements += 1
+        stats.db_time += duration
+        if not executemany:
+            stats.shapes[statement_shape(statement)] += 1
+
+    threshold = current_app.config.get('SLOW_QUERY_MS', 0)
+    if threshold and duration * 1000 >= threshold:
+        current_app.extensions['instrumentation'].slow_query()
+        current_app.logger.warning(
+            'Slow query (%.1f ms) in %s: %s | parameters: %s',
+            duration * 1000,
+            (request.endpoint or 'unmatched') if has_request_context() else 'background',
+            statement_shape(statement),
+            parameter_shape(parameters)
+        )
+
+
+def _start_request():
+    g._instrument = RequestStats()
+
+
+def _record(app, stats, endpoint, method, path, status):
+    """Log and record a finished request; returns its duration"""
+    duration = time.perf_counter() - stats.start
+
+    threshold = app.config.get('N_PLUS_ONE_THRESHOLD', 0)
+    repeated = [(shape, count) for shape, count in stats.shapes.most_common(3) if threshold and count >= threshold]
+    for shape, count in repeated:
+        app.logger.warning('Possible N+1 in %s: %d x %s', endpoint, count, shape)
+
+    app.extensions['instrumentation'].record(endpoint, method, status, duration, stats, bool(repeated))
+
+    if app.config.get('LOG_REQUEST_TIMING'):
+        app.logger.info('%s %s %s %.1f ms, %d queries in %.1f ms', method, path, status,
+                        duration * 1000, stats.statements, stats.db_time * 1000)
+    return duration
+
+
+def _finish_request(response):
+    stats = g.get('_instrument')
+    if stats is None:
+        return response
+    app = current_app._get_current_object()
+    request_info = (request.endpoint or 'unmatched', request.method, request.full_path.rstrip('?'), response.status_code)
+
+    if response.is_streamed:
+        # A streamed body renders, and queries, while it is sent, so the
+        # request is recorded once the stream is closed. g._instrument stays
+        # set to count those queries. No Server-Timing: the headers go first.
+        response.call_on_close(lambda: _record(app, stats, *request_info))
+        return response
+
+    del g._instrument
+    duration = _record(app, stats, *request_info)
+    if app.config.get('SERVER_TIMING'):
+        response.headers.add(
+            'Server-Timing',
+            f'app;dur={duration * 1000:.1f}, db;dur={stats.db_time * 1000:.1f};desc="{stats.statements} queries"'
+        )
+    return response
+
+
+def instrument_engine(engine):
+    """Count and time the statements of an engine"""
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def init_instrumentation(app):
+    """Register the request hooks and engine listeners (after db.init_app)"""
+    app.extensions['instrumentation'] = Metrics()
+    # Run first so that the other hooks are part of the measured time
+    app.before_request_funcs.setdefault(None, []).insert(0, _start_request)
+    app.after_request(_finish_request)
+    with app.app_context():
+        for engine in db.engines.values():
+            instrument_engine(engine)
+
+
+def scrape_authorized():
+    """Whether the request carries the METRICS_TOKEN bearer token"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        return False
+    # Constant-time comparison; bytes, as compare_digest only takes ASCII strings
+    return hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())
+
+
+def metrics_response():
+    return current_app.response_class(
+        render_metrics(current_app.extensions['instrumentation'], db.engines),
+        mimetype='text/plain; version=0.0.4'
+    )
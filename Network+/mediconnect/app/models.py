@@ -1,8 +1,13 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, undefer
 from datetime import datetime
 
-db = SQLAlchemy()
+from app.passwords import passwords
+from app.replicas import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 
 class User(db.Model):
@@ -16,23 +21,31 @@ class User(db.Model):
     role = db.Column(db.String(20), nullable=False)  # 'doctor', 'hospital', 'admin'
     is_verified = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Set when the user is deactivated; the row is purged in the background
+    # (see app/archive.py)
+    deleted_at = db.Column(db.DateTime)
     
     # Polymorphic relationships
     doctor = db.relationship('Doctor', uselist=False, back_populates='user')
     hospital = db.relationship('Hospital', uselist=False, back_populates='user')
     
-    __mapper_args__ = {
-        'polymorphic_on': role,
-        'polymorphic_identity': 'user'
-    }
+    __table_args__ = (
+        # admin.users: newest first, optionally filtered by role
+        db.Index('ix_users_created_at_id', 'created_at', 'id'),
+        db.Index('ix_users_role_created_at_id', 'role', 'created_at', 'id'),
+    )
     
     def set_password(self, password):
         """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash(password)
     
     def check_password(self, password):
         """Check if provided password matches hash"""
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """Whether the stored hash uses outdated hashing parameters"""
+        return passwords.needs_rehash(self.password_hash)
 
 
 class Doctor(db.Model):
@@ -103,6 +116,19 @@ class Job(db.Model):
     hospital = db.relationship('Hospital', back_populates='jobs')
     applications = db.relationship('JobApplication', back_populates='job', cascade='all, delete-orphan')
     
+    __table_args__ = (
+        # admin.jobs: newest first, optionally filtered by status
+        db.Index('ix_jobs_created_at_id', 'created_at', 'id'),
+        db.Index('ix_jobs_status_created_at_id', 'status', 'created_at', 'id'),
+        # doctor.browse_jobs: only active jobs are ever listed
+        db.Index('ix_jobs_active_created_at_id', 'created_at', 'id',
+                 postgresql_where=db.text("status = 'active'"),
+                 sqlite_where=db.text("status = 'active'")),
+        # hospital.my_jobs and the hospital dashboard counts
+        db.Index('ix_jobs_hospital_id_created_at_id', 'hospital_id', 'created_at', 'id'),
+        db.Index('ix_jobs_hospital_id_status', 'hospital_id', 'status'),
+    )
+    
     def __repr__(self):
         return f'<Job {self.title} at {self.hospital.hospital_name}>'
 
@@ -115,7 +141,12 @@ class JobApplication(db.Model):
     job_id = db.Column(db.Integer, db.ForeignKey('jobs.id'), nullable=False)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
     status = db.Column(db.String(20), default='pending')  # 'pending', 'reviewed', 'accepted', 'rejected'
+    # Number of status changes so far; keys the notification of each change
+    status_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     cover_letter = db.Column(db.Text)
+    # Fit of the doctor for the job (see app/recommendations.py), stored so
+    # that applicants can be ranked from an index
+    match_score = db.Column(db.Float, nullable=False, default=0, server_default='0')
     applied_at = db.Column(db.DateTime, default=datetime.utcnow)
     reviewed_at = db.Column(db.DateTime)
     
@@ -123,7 +154,212 @@ class JobApplication(db.Model):
     job = db.relationship('Job', back_populates='applications')
     doctor = db.relationship('Doctor', back_populates='applications')
     
-    __table_args__ = (db.UniqueConstraint('job_id', 'doctor_id', name='unique_job_doctor_application'),)
+    __table_args__ = (
+        db.UniqueConstraint('job_id', 'doctor_id', name='unique_job_doctor_application'),
+        # admin.applications: newest first, optionally filtered by status
+        db.Index('ix_job_applications_applied_at_id', 'applied_at', 'id'),
+        db.Index('ix_job_applications_status_applied_at_id', 'status', 'applied_at', 'id'),
+        # hospital.applicants and doctor.my_applications
+        db.Index('ix_job_applications_job_id_applied_at_id', 'job_id', 'applied_at', 'id'),
+        db.Index('ix_job_applications_doctor_id_applied_at_id', 'doctor_id', 'applied_at', 'id'),
+        # hospital.applicants ranked by match score, optionally filtered by status
+        db.Index('ix_job_applications_job_id_match_score_id', 'job_id', 'match_score', 'id'),
+        db.Index('ix_job_applications_job_id_status_match_score_id', 'job_id', 'status', 'match_score', 'id'),
+        # pending applications per job for the hospital dashboard
+        db.Index('ix_job_applications_pending_job_id', 'job_id',
+                 postgresql_where=db.text("status = 'pending'"),
+                 sqlite_where=db.text("status = 'pending'")),
+    )
+    
+    def __repr__(self):
+        return f'<JobApplication Doctor:{self.doctor_id} Job:{self.job_id}>'
+
+
+class StatCounter(db.Model):
+    """Incrementally maintained statistics counter (see app/stats.py)"""
+    __tablename__ = 'stat_counters'
+    
+    scope = db.Column(db.String(20), primary_key=True)  # 'global', 'hospital'
+    scope_id = db.Column(db.Integer, primary_key=True, default=0)  # hospital id, 0 for global
+    name = db.Column(db.String(200), primary_key=True)  # e.g. 'jobs.status.active'
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<StatCounter {self.scope}:{self.scope_id} {self.name}={self.value}>'
+
+
+class LoginAttempt(db.Model):
+    """Failed logins of a username or address in the current window (see app/passwords.py)"""
+    __tablename__ = 'login_attempts'
+    
+    key = db.Column(db.String(80), primary_key=True)  # 'user:<sha1>' or 'addr:<address>'
+    count = db.Column(db.Integer, nullable=False, default=0)
+    window_start = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<LoginAttempt {self.key}={self.count}>'
+
+
+class Task(db.Model):
+    """Queued background task (see app/tasks.py)"""
+    __tablename__ = 'tasks'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'done', 'failed'
+    idempotency_key = db.Column(db.String(200), unique=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        # workers claim the oldest due task
+        db.Index('ix_tasks_status_run_at_id', 'status', 'run_at', 'id'),
+    )
+    
+    def __repr__(self):
+        return f'<Task {self.id} {self.name} {self.status}>'
+
+
+class JobRecommendation(db.Model):
+    """Precomputed job match for a doctor (see app/recommendations.py)"""
+    __tablename__ = 'job_recommendations'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id', ondelete='CASCADE'), nullable=False)
+    job_id = db.Column(db.Integer, db.ForeignKey('jobs.id', ondelete='CASCADE'), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    job = db.relationship('Job')
+    
+    __table_args__ = (
+        db.UniqueConstraint('doctor_id', 'job_id', name='unique_doctor_job_recommendation'),
+        # doctor.recommended_jobs: best matches first
+        db.Index('ix_job_recommendations_doctor_id_score_job_id', 'doctor_id', 'score', 'job_id'),
+        # refreshes after a job is closed
+        db.Index('ix_job_recommendations_job_id', 'job_id'),
+    )
     
     def __repr__(self):
-        return f'<JobApplication Doctor:{self.doctor_id} Job:{self.job_id}>'
\ No newline at end of file
+        return f'<JobRecommendation Doctor:{self.doctor_id} Job:{self.job_id} {self.score}>'
+
+
+class ArchivedJob(db.Model):
+    """Closed job moved out of the jobs table (see app/archive.py)"""
+    __tablename__ = 'archived_jobs'
+    
+    # Ids are kept from the jobs table
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    hospital_id = db.Column(db.Integer, nullable=False, index=True)
+    title = db.Column(db.String(200), nullable=False)
+    specialization = db.Column(db.String(120), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    location = db.Column(db.String(200))
+    salary_min = db.Column(db.Float)
+    salary_max = db.Column(db.Float)
+    experience_required = db.Column(db.Integer)
+    job_type = db.Column(db.String(50))
+    status = db.Column(db.String(20))
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ArchivedJob {self.title}>'
+
+
+class ArchivedJobApplication(db.Model):
+    """Application to an archived job (see app/archive.py)"""
+    __tablename__ = 'archived_job_applications'
+    
+    # Ids are kept from the job_applications table
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    job_id = db.Column(db.Integer, nullable=False, index=True)
+    doctor_id = db.Column(db.Integer, nullable=False, index=True)
+    status = db.Column(db.String(20))
+    cover_letter = db.Column(db.Text)
+    match_score = db.Column(db.Float, nullable=False, default=0, server_default='0')
+    applied_at = db.Column(db.DateTime)
+    reviewed_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ArchivedJobApplication Doctor:{self.doctor_id} Job:{self.job_id}>'
+
+
+# Number of applications per job as a correlated subquery. Deferred so that
+# only the list views that display it pay for it (see LOADER_PROFILES).
+Job.application_count = db.column_property(
+    db.select(db.func.count(JobApplication.id))
+    .where(JobApplication.job_id == Job.id)
+    .correlate_except(JobApplication)
+    .scalar_subquery(),
+    deferred=True
+)
+
+
+# Loader options per list view, keyed by endpoint. Every relationship a list
+# template touches is loaded together with the page, so a page costs a fixed
+# number of queries regardless of how many rows it shows.
+LOADER_PROFILES = {
+    'admin.users': (),
+    'admin.jobs': (
+        joinedload(Job.hospital),
+        undefer(Job.application_count),
+    ),
+    'admin.applications': (
+        joinedload(JobApplication.doctor),
+        joinedload(JobApplication.job).joinedload(Job.hospital),
+    ),
+    'doctor.browse_jobs': (
+        joinedload(Job.hospital),
+    ),
+    'doctor.my_applications': (
+        joinedload(JobApplication.job).joinedload(Job.hospital),
+    ),
+    'doctor.recommended_jobs': (
+        joinedload(JobRecommendation.job).joinedload(Job.hospital),
+    ),
+    'hospital.my_jobs': (
+        undefer(Job.application_count),
+    ),
+    'hospital.applicants': (
+        joinedload(JobApplication.doctor),
+    ),
+}
+
+
+def with_loaders(query, profile):
+    """Apply the loader profile registered for a list view to a query"""
+    return query.options(*LOADER_PROFILES[profile])
+
+
+def insert_ignore(model, values, *returning):
+    """Insert a row unless it violates a unique constraint, in one statement.
+
+    Runs INSERT ... ON CONFLICT DO NOTHING RETURNING on PostgreSQL and
+    SQLite (a savepoint elsewhere) in the current transaction and returns
+    the ``returning`` columns of the new row, or None if it already existed.
+    The ORM flush is bypassed, so stat counters must be updated by the
+    caller (stats.count_inserted).
+    """
+    table = model.__table__
+    dialect = db.session.get_bind(mapper=model.__mapper__).dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert(table) if dialect == 'postgresql' else sqlite.insert(table)
+        statement = insert.values(**values).on_conflict_do_nothing().returning(*returning)
+        return db.session.execute(statement).first()
+
+    try:
+        with db.session.begin_nested():
+            return db.session.execute(table.insert().values(**values).returning(*returning)).first()
+    except IntegrityError:
+        return None
@@ -0,0 +1,59 @@
+"""
+Notifications to users, sent by the background worker (app/tasks.py).
+"""
+from flask import current_app
+from sqlalchemy.orm import joinedload
+
+from app.models import db, Doctor, Job, JobApplication
+from app.tasks import task
+
+
+STATUS_MESSAGES = {
+    'reviewed': 'has been reviewed',
+    'accepted': 'has been accepted',
+    'rejected': 'was not successful',
+}
+
+
+def send_notification(recipient, subject, body):
+    """Deliver a notification.
+
+    No mail service is configured yet, so notifications are written to the
+    application log.
+    """
+    current_app.logger.info('Notification to %s: %s\n%s', recipient, subject, body)
+
+
+@task('notify_application_status')
+def notify_application_status(application_id, status):
+    """Tell a doctor that the status of their application changed"""
+    application = db.session.get(JobApplication, application_id, options=[
+        joinedload(JobApplication.doctor).joinedload(Doctor.user),
+        joinedload(JobApplication.job).joinedload(Job.hospital),
+    ])
+    # Skip applications that were deleted or changed again since
+    if application is None or application.status != status:
+        return
+
+    job = application.job
+    send_notification(
+        application.doctor.user.email,
+        f'Your application for {job.title}',
+        f'Dear {application.doctor.full_name},\n\n'
+        f'Your application for {job.title} at {job.hospital.hospital_name} {STATUS_MESSAGES[status]}.'
+    )
+
+
+def queue_status_notifications(changes):
+    """Queue one notification per (application id, new status, status version).
+
+    The status version is the one the change was written with, so the same
+    change queued twice notifies once while an application that comes back
+    to an earlier status (accepted, rejected, accepted) notifies every time.
+    """
+    for application_id, status, status_version in changes:
+        notify_application_status.enqueue(
+            idempotency_key=f'application-status:{application_id}:{status_version}',
+            application_id=application_id,
+            status=status
+        )
@@ -0,0 +1,184 @@
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from flask import abort, current_app, request
+
+from app.models import db
+
+
+class KeysetPage:
+    """A page of rows fetched by keyset (cursor) pagination.
+
+    Mirrors the parts of Flask-SQLAlchemy's Pagination that the templates use
+    (items, has_prev, has_next) and adds opaque prev/next cursors.
+    """
+    mode = 'keyset'
+
+    def __init__(self, items, per_page, prev_cursor=None, next_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+        self.total = total
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(direction, value, row_id):
+    """Encode a position in a (timestamp or number, id) ordering as an opaque token"""
+    payload = json.dumps([direction, value.isoformat() if isinstance(value, datetime) else value, row_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a cursor token, returning (direction, sort value, id)"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if direction not in ('next', 'prev') or not isinstance(row_id, int):
+            raise ValueError(direction)
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        elif value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise ValueError(value)
+        return direction, value, row_id
+    except (ValueError, TypeError, UnicodeDecodeError):
+        abort(400)
+
+
+def approximate_count(query):
+    """Estimate the number of rows a query returns.
+
+    On PostgreSQL this reads the planner estimate from EXPLAIN instead of
+    running COUNT(*); other backends fall back to an exact count.
+    """
+    query = query.order_by(None)
+    if db.engine.dialect.name != 'postgresql':
+        return query.count()
+
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    plan = db.session.connection().exec_driver_sql(
+        'EXPLAIN (FORMAT JSON) ' + str(compiled), compiled.params
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def keyset_paginate(query, sort_column, id_column, cursor=None, per_page=10, with_total=False):
+    """Fetch one page of a query ordered by (sort_column, id_column) descending.
+
+    Only rows after (or before) the cursor position are read, so the cost of
+    a page does not depend on how deep into the listing it is.
+    """
+    direction, value, row_id = decode_cursor(cursor) if cursor else ('next', None, None)
+    total = approximate_count(query) if with_total else None
+
+    if row_id is not None:
+        if direction == 'next':
+            query = query.filter(db.or_(
+                sort_column < value,
+                db.and_(sort_column == value, id_column < row_id)
+            ))
+        else:
+            query = query.filter(db.or_(
+                sort_column > value,
+                db.and_(sort_column == value, id_column > row_id)
+            ))
+
+    if direction == 'next':
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column.asc(), id_column.asc())
+
+    # Fetch one extra row to learn whether another page exists
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows.reverse()
+
+    def position(row, to):
+        return encode_cursor(to, getattr(row, sort_column.key), getattr(row, id_column.key))
+
+    if direction == 'next':
+        has_prev, has_next = row_id is not None, has_more
+    else:
+        has_prev, has_next = has_more, True
+
+    return KeysetPage(
+        rows,
+        per_page,
+        prev_cursor=position(rows[0], 'prev') if rows and has_prev else None,
+        next_cursor=position(rows[-1], 'next') if rows and has_next else None,
+        total=total
+    )
+
+
+class PagePosition(namedtuple('PagePosition', 'keyset cursor page with_total')):
+    """The page a client asked for; hashable, so it can be part of a cache key"""
+
+
+def page_position():
+    """Read the requested page from the query string.
+
+    A ``cursor`` query argument (or PAGINATION_MODE = 'keyset' when no
+    ``page`` is given) selects keyset pagination; otherwise the classic
+    page-number pagination is used.
+    """
+    cursor = request.args.get('cursor', type=str)
+    keyset = cursor is not None or (
+        current_app.config.get('PAGINATION_MODE') == 'keyset' and 'page' not in request.args
+    )
+
+    if keyset:
+        with_total = request.args.get('total', type=int)
+        if with_total is None:
+            with_total = current_app.config.get('PAGINATION_APPROX_TOTAL', False)
+        return PagePosition(True, cursor or None, None, bool(with_total))
+    return PagePosition(False, None, request.args.get('page', 1, type=int), False)
+
+
+def paginate_at(query, sort_column, id_column, position, per_page=10):
+    """Fetch the page of a list at a PagePosition"""
+    if position.keyset:
+        return keyset_paginate(query, sort_column, id_column, cursor=position.cursor,
+                               per_page=per_page, with_total=position.with_total)
+    return query.order_by(sort_column.desc(), id_column.desc()).paginate(page=position.page, per_page=per_page)
+
+
+def paginate_list(query, sort_column, id_column, per_page=10):
+    """Paginate a list view in the mode requested by the client"""
+    return paginate_at(query, sort_column, id_column, page_position(), per_page=per_page)
+
+
+class PageSnapshot:
+    """A detached copy of a page that can be stored in a cache.
+
+    Keeps the pagination attributes the templates use and converts each row
+    with ``convert`` (typically to a dict of the displayed fields).
+    """
+
+    def __init__(self, pagination, convert):
+        self.mode = getattr(pagination, 'mode', None)
+        self.items = [convert(item) for item in pagination.items]
+        self.per_page = pagination.per_page
+        self.has_prev = pagination.has_prev
+        self.has_next = pagination.has_next
+        self.total = pagination.total
+        if self.mode == 'keyset':
+            self.prev_cursor = pagination.prev_cursor
+            self.next_cursor = pagination.next_cursor
+        else:
+            self.page = pagination.page
+            self.pages = pagination.pages
+            self.prev_num = pagination.prev_num
+            self.next_num = pagination.next_num
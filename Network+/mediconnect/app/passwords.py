@@ -0,0 +1,262 @@
+"""
+Password hashing and login throttling.
+
+Hashes are computed with Werkzeug using PASSWORD_HASH_METHOD, e.g.
+``pbkdf2:sha256:600000`` or ``scrypt:32768:8:1``. A stored hash made with
+other parameters still verifies, and auth.login replaces it with a hash of
+the current method (needs_rehash), so raising the cost upgrades users as
+they log in.
+
+The key derivation runs on a bounded pool of PASSWORD_HASH_WORKERS threads
+(hashlib releases the GIL while hashing) or processes per worker. At most
+PASSWORD_HASH_MAX_PENDING hashes may be queued or running; beyond that
+PasswordServiceBusy is raised at once instead of letting requests pile up
+behind the KDF. PASSWORD_HASH_WORKERS = 0 hashes on the calling thread.
+
+LoginThrottle counts failed logins per username and per client address and
+refuses further attempts, before any hashing, once LOGIN_MAX_ATTEMPTS /
+LOGIN_MAX_ATTEMPTS_PER_IP is reached within LOGIN_ATTEMPT_WINDOW seconds.
+The counters are kept apart from the page cache, so caching cannot evict
+them, in a store selected by LOGIN_THROTTLE_STORE:
+
+- ``database``: the login_attempts table, shared by every host
+- ``redis``: the Redis server of CACHE_REDIS_URL (needs ``redis``)
+
+Each failure is counted with one atomic statement (an upsert, or SET NX and
+INCR in one transaction), so concurrent attempts cannot overwrite each
+other's increments.
+"""
+import hashlib
+import math
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy.dialects import postgresql, sqlite
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+DEFAULT_METHOD = f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}'
+
+
+class PasswordServiceBusy(Exception):
+    """Raised when too many hashes are already queued"""
+
+
+def normalize_method(method):
+    """The method prefix Werkzeug writes into hashes made with ``method``"""
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        n, r, p = (args + [None] * 3)[:3]
+        return f'scrypt:{n or 2 ** 15}:{r or 8}:{p or 1}'
+    if name == 'pbkdf2':
+        hash_name, iterations = (args + [None] * 2)[:2]
+        return f'pbkdf2:{hash_name or "sha256"}:{iterations or DEFAULT_PBKDF2_ITERATIONS}'
+    return method
+
+
+def _config(name, default):
+    if has_app_context():
+        return current_app.config.get(name, default)
+    return default
+
+
+class PasswordService:
+    """Hashes and verifies passwords on a bounded worker pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._pending = None
+
+    @property
+    def method(self):
+        return _config('PASSWORD_HASH_METHOD', DEFAULT_METHOD)
+
+    def _pool(self):
+        """The executor of this process and its slot semaphore, or None to run inline"""
+        workers = _config('PASSWORD_HASH_WORKERS', 0)
+        if not workers:
+            return None
+        with self._lock:
+            # Executors do not survive a fork; each gunicorn worker makes its own
+            if self._executor is None or self._pid != os.getpid():
+                kind = ProcessPoolExecutor if _config('PASSWORD_HASH_EXECUTOR', 'thread') == 'process' \
+                    else ThreadPoolExecutor
+                self._executor = kind(max_workers=workers)
+                self._pending = threading.BoundedSemaphore(max(_config('PASSWORD_HASH_MAX_PENDING', workers), workers))
+                self._pid = os.getpid()
+            return self._executor, self._pending
+
+    def _run(self, function, *args):
+        pool = self._pool()
+        if pool is None:
+            return function(*args)
+        executor, pending = pool
+        if not pending.acquire(blocking=False):
+            raise PasswordServiceBusy('Too many password hashes in progress')
+        try:
+            future = executor.submit(function, *args)
+        except Exception:
+            pending.release()
+            raise
+        future.add_done_callback(lambda _: pending.release())
+        return future.result()
+
+    def hash(self, password):
+        """Hash a password with the configured method"""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """Check a password against a stored hash of any supported method"""
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Whether a stored hash was made with other parameters than the configured ones"""
+        return password_hash.split('$', 1)[0] != normalize_method(self.method)
+
+
+passwords = PasswordService()
+
+
+class DatabaseThrottleStore:
+    """Failure counters in the login_attempts table"""
+
+    def hit(self, keys, window):
+        """Count a failure for every key, starting a new window where the last one ended"""
+        from app.models import db, LoginAttempt
+
+        table = LoginAttempt.__table__
+        now = datetime.utcnow()
+        expired = now - timedelta(seconds=window)
+        dialect = db.session.get_bind(mapper=LoginAttempt.__mapper__).dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            insert = postgresql.insert(table) if dialect == 'postgresql' else sqlite.insert(table)
+            db.session.execute(insert.on_conflict_do_update(
+                index_elements=['key'],
+                set_={
+                    'count': db.case((table.c.window_start <= expired, 1), else_=table.c.count + 1),
+                    'window_start': db.case((table.c.window_start <= expired, now), else_=table.c.window_start),
+                }
+            ), [{'key': key, 'count': 1, 'window_start': now} for key in keys])
+        else:
+            for key in keys:
+                updated = db.session.execute(table.update().where(table.c.key == key).values(
+                    count=db.case((table.c.window_start <= expired, 1), else_=table.c.count + 1),
+                    window_start=db.case((table.c.window_start <= expired, now), else_=table.c.window_start)
+                )).rowcount
+                if not updated:
+                    db.session.execute(table.insert(), {'key': key, 'count': 1, 'window_start': now})
+        # Windows that ended are of no use any more
+        db.session.execute(table.delete().where(table.c.window_start <= expired))
+        db.session.commit()
+
+    def get_many(self, keys, window):
+        """[(failures, seconds left in the window) or None] for some keys"""
+        from app.models import db, LoginAttempt
+
+        now = datetime.utcnow()
+        rows = dict((row.key, row) for row in db.session.execute(
+            db.select(LoginAttempt.key, LoginAttempt.count, LoginAttempt.window_start).where(LoginAttempt.key.in_(keys))
+        ))
+        entries = []
+        for key in keys:
+            row = rows.get(key)
+            left = window - (now - row.window_start).total_seconds() if row is not None else 0
+            entries.append((row.count, left) if left > 0 else None)
+        return entries
+
+    def delete(self, key):
+        from app.models import db, LoginAttempt
+
+        db.session.execute(db.delete(LoginAttempt).where(LoginAttempt.key == key))
+        db.session.commit()
+
+
+class RedisThrottleStore:
+    """Failure counters in Redis, as keys that expire with their window"""
+
+    def __init__(self, url, prefix):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('LOGIN_THROTTLE_STORE = "redis" requires the redis package')
+        self.client = redis.Redis.from_url(url)
+        # Not under CACHE_KEY_PREFIX, so clearing the cache leaves them alone
+        self.prefix = f'login-throttle:{prefix}'
+
+    def hit(self, keys, window):
+        pipeline = self.client.pipeline()
+        for key in keys:
+            pipeline.set(self.prefix + key, 0, ex=window, nx=True)
+            pipeline.incr(self.prefix + key)
+        pipeline.execute()
+
+    def get_many(self, keys, window):
+        pipeline = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.get(self.prefix + key)
+            pipeline.ttl(self.prefix + key)
+        values = pipeline.execute()
+        return [(int(count), ttl) if count is not None and ttl > 0 else None
+                for count, ttl in zip(values[::2], values[1::2])]
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+def make_throttle_store(config):
+    """Create the store selected by LOGIN_THROTTLE_STORE"""
+    store = config.get('LOGIN_THROTTLE_STORE', 'database')
+    if store == 'database':
+        return DatabaseThrottleStore()
+    if store == 'redis':
+        if not config.get('CACHE_REDIS_URL'):
+            raise ValueError('LOGIN_THROTTLE_STORE = "redis" requires CACHE_REDIS_URL')
+        return RedisThrottleStore(config['CACHE_REDIS_URL'], config.get('CACHE_KEY_PREFIX', ''))
+    raise ValueError(f'Unknown LOGIN_THROTTLE_STORE {store!r}')
+
+
+class LoginThrottle:
+    """Fixed-window counters of failed logins per username and per address"""
+
+    def _keys(self, username, address):
+        return [
+            ('user:' + hashlib.sha1(username.lower().encode()).hexdigest(),
+             current_app.config.get('LOGIN_MAX_ATTEMPTS', 5)),
+            ('addr:' + (address or '')[:72],
+             current_app.config.get('LOGIN_MAX_ATTEMPTS_PER_IP', 50)),
+        ]
+
+    @property
+    def store(self):
+        if 'login_throttle' not in current_app.extensions:
+            current_app.extensions['login_throttle'] = make_throttle_store(current_app.config)
+        return current_app.extensions['login_throttle']
+
+    @property
+    def window(self):
+        return current_app.config.get('LOGIN_ATTEMPT_WINDOW', 900)
+
+    def retry_after(self, username, address):
+        """Seconds until another attempt is allowed, or 0 if it is allowed now"""
+        keys = self._keys(username, address)
+        wait = 0
+        for (_, limit), entry in zip(keys, self.store.get_many([key for key, _ in keys], self.window)):
+            if entry is not None and limit and entry[0] >= limit:
+                wait = max(wait, math.ceil(entry[1]))
+        return wait
+
+    def failed(self, username, address):
+        """Record a failed attempt"""
+        self.store.hit([key for key, _ in self._keys(username, address)], self.window)
+
+    def succeeded(self, username):
+        """Clear the failures of a username after a successful login"""
+        self.store.delete(self._keys(username, None)[0][0])
+
+
+login_throttle = LoginThrottle()
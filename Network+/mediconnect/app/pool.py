@@ -0,0 +1,132 @@
+"""
+Database engine profile and connection pool metrics.
+
+configure_engine() turns the DB_* settings of the active config into
+SQLALCHEMY_ENGINE_OPTIONS before Flask-SQLAlchemy creates the engine. Each
+gunicorn worker has its own pool, so the server opens up to
+workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+
+With DB_PGBOUNCER the engine talks to PgBouncer in transaction pooling
+mode: no startup parameters are sent (PgBouncer rejects them) and drivers
+that prepare statements have it disabled, since a prepared statement is
+tied to a server connection the next transaction may not get. Set the
+statement timeout on the database role instead:
+
+    ALTER ROLE mediconnect SET statement_timeout = '30s';
+"""
+import threading
+import time
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+
+# Upper bounds (seconds) of the checkout wait histogram buckets
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PoolMetrics:
+    """Checkout counts and wait times of one pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.buckets = [0] * len(WAIT_BUCKETS)
+
+    def record(self, wait, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            for index, bound in enumerate(WAIT_BUCKETS):
+                if wait <= bound:
+                    self.buckets[index] += 1
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except Exception:
+            self.metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record(time.perf_counter() - start)
+        return connection
+
+
+def engine_options(config, uri):
+    """SQLAlchemy engine options for the DB_* settings of a config"""
+    url = make_url(uri)
+    if url.get_backend_name() != 'postgresql':
+        # SQLite picks its own pool class (e.g. one connection for :memory:)
+        return {}
+
+    options = {
+        'poolclass': MeteredQueuePool,
+        'pool_size': config.get('DB_POOL_SIZE', 5),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', -1),
+        'pool_pre_ping': config.get('DB_POOL_PRE_PING', False),
+    }
+
+    connect_args = {}
+    driver = url.get_driver_name()
+    if config.get('DB_PGBOUNCER'):
+        if driver == 'psycopg':
+            connect_args['prepare_threshold'] = None
+        elif driver == 'asyncpg':
+            connect_args['statement_cache_size'] = 0
+            connect_args['prepared_statement_cache_size'] = 0
+    elif config.get('DB_STATEMENT_TIMEOUT'):
+        if driver == 'asyncpg':
+            connect_args['server_settings'] = {'statement_timeout': str(config['DB_STATEMENT_TIMEOUT'])}
+        else:
+            connect_args['options'] = f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}"
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+
+def configure_engine(app):
+    """Merge the engine profile into SQLALCHEMY_ENGINE_OPTIONS (before db.init_app)"""
+    options = engine_options(app.config, app.config['SQLALCHEMY_DATABASE_URI'])
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def pool_stats(engine):
+    """Current state and checkout metrics of an engine's pool"""
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+        )
+    metrics = getattr(pool, 'metrics', None)
+    if metrics is not None:
+        with metrics._lock:
+            stats.update(
+                checkouts=metrics.checkouts,
+                checkout_timeouts=metrics.timeouts,
+                checkout_wait_seconds_total=round(metrics.wait_total, 6),
+                checkout_wait_seconds_max=round(metrics.wait_max, 6),
+                checkout_wait_buckets=dict(zip((str(bound) for bound in WAIT_BUCKETS), metrics.buckets)),
+            )
+    return stats
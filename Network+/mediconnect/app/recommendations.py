@@ -0,0 +1,306 @@
+"""
+Recommended jobs.
+
+Every doctor is scored against every active job on specialization,
+experience and location, and the best RECOMMENDATIONS_PER_DOCTOR matches
+scoring at least RECOMMENDATION_MIN_SCORE are stored in the
+job_recommendations table, so the recommendations page is one indexed read.
+
+Scores are computed for a batch of doctors against RECOMMENDATION_JOB_CHUNK
+active jobs at a time, as float32 NumPy array operations when numpy is
+installed (plain Python otherwise), keeping only each doctor's best k jobs
+between chunks, so memory does not grow with the number of jobs.
+`flask recommendations refresh` rebuilds the table; after that it is kept
+current incrementally by background tasks:
+
+- a posted job is scored against every doctor and enters the lists it
+  ranks high enough in;
+- a closed job is removed and the doctors that lost it are refilled;
+- a doctor whose profile changed is scored again.
+
+The same score is stored on every job application (match_score) when it is
+created and whenever the doctor's profile changes, so hospitals can rank
+their applicants from an index.
+"""
+import heapq
+from collections import namedtuple
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from app.models import db, Doctor, Job, JobApplication, JobRecommendation
+from app.tasks import task
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+recommendations_cli = AppGroup('recommendations', help='Job recommendation commands.')
+
+# Score weights; they add up to 1
+SPECIALIZATION_WEIGHT = 0.55
+EXPERIENCE_WEIGHT = 0.25
+LOCATION_WEIGHT = 0.2
+
+# Years of missing experience at which the experience score reaches 0
+EXPERIENCE_TOLERANCE = 5
+
+# Columns that affect the scores
+DOCTOR_FEATURES = (Doctor.id, Doctor.specialization, Doctor.experience_years, Doctor.location)
+JOB_FEATURES = (Job.id, Job.specialization, Job.experience_required, Job.location)
+
+
+DoctorFeatures = namedtuple('DoctorFeatures', 'specialization experience_years location')
+
+
+def _normalize(text):
+    return (text or '').strip().lower()
+
+
+def _codes(values, vocabulary):
+    """Integer codes of text values; equal texts share a code, empty ones get -1"""
+    codes = []
+    for value in values:
+        value = _normalize(value)
+        codes.append(vocabulary.setdefault(value, len(vocabulary)) if value else -1)
+    return codes
+
+
+def _numpy_features(specializations, locations, experience, vocabulary):
+    """(specialization codes, location codes, years) as arrays"""
+    return (
+        numpy.array(_codes(specializations, vocabulary), dtype=numpy.int32),
+        numpy.array(_codes(locations, vocabulary), dtype=numpy.int32),
+        numpy.array([years or 0 for years in experience], dtype=numpy.float32),
+    )
+
+
+def _numpy_scores(doctors, jobs):
+    """Score matrix (doctors x jobs, float32) of coded features"""
+    doctor_specialization, doctor_location, doctor_experience = doctors
+    job_specialization, job_location, job_experience = jobs
+
+    shortfall = numpy.maximum(job_experience - doctor_experience[:, None], 0)
+    scores = numpy.clip(1 - shortfall / EXPERIENCE_TOLERANCE, 0, 1)
+    scores *= EXPERIENCE_WEIGHT
+    scores[(doctor_specialization[:, None] == job_specialization) & (doctor_specialization[:, None] >= 0)] \
+        += SPECIALIZATION_WEIGHT
+    scores[(doctor_location[:, None] == job_location) & (doctor_location[:, None] >= 0)] += LOCATION_WEIGHT
+    return scores
+
+
+def _best(scores, columns, k):
+    """The k highest scores of every row and their columns"""
+    if scores.shape[1] <= k:
+        return scores, columns
+    best = numpy.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return numpy.take_along_axis(scores, best, axis=1), numpy.take_along_axis(columns, best, axis=1)
+
+
+def score(doctor, job):
+    """Match score of one doctor and job, between 0 and 1"""
+    specialization = _normalize(doctor.specialization)
+    location = _normalize(doctor.location)
+    shortfall = max((job.experience_required or 0) - (doctor.experience_years or 0), 0)
+    return (
+        SPECIALIZATION_WEIGHT * bool(specialization and specialization == _normalize(job.specialization))
+        + EXPERIENCE_WEIGHT * min(max(1 - shortfall / EXPERIENCE_TOLERANCE, 0), 1)
+        + LOCATION_WEIGHT * bool(location and location == _normalize(job.location))
+    )
+
+
+def top_matches(doctors, jobs, k, min_score, job_chunk=2048):
+    """Yield (doctor id, job id, score) for the best k jobs of every doctor"""
+    if not doctors or not jobs:
+        return
+
+    if numpy is None:
+        for doctor in doctors:
+            scored = ((score(doctor, job), job.id) for job in jobs)
+            for value, job_id in heapq.nlargest(k, scored):
+                if value >= min_score:
+                    yield doctor.id, job_id, round(value, 4)
+        return
+
+    vocabulary = {}
+    doctor_features = _numpy_features((d.specialization for d in doctors), (d.location for d in doctors),
+                                      (d.experience_years for d in doctors), vocabulary)
+    job_features = _numpy_features((j.specialization for j in jobs), (j.location for j in jobs),
+                                   (j.experience_required for j in jobs), vocabulary)
+
+    # Running best k of each doctor over the chunks of jobs seen so far
+    best_scores = numpy.empty((len(doctors), 0), dtype=numpy.float32)
+    best_columns = numpy.empty((len(doctors), 0), dtype=numpy.intp)
+    for start in range(0, len(jobs), job_chunk):
+        scores = _numpy_scores(doctor_features, [feature[start:start + job_chunk] for feature in job_features])
+        columns = numpy.broadcast_to(numpy.arange(start, start + scores.shape[1]), scores.shape)
+        scores, columns = _best(scores, columns, k)
+        best_scores, best_columns = _best(numpy.concatenate((best_scores, scores), axis=1),
+                                          numpy.concatenate((best_columns, columns), axis=1), k)
+
+    job_ids = numpy.array([job.id for job in jobs])
+    # Allow for float32 rounding of scores equal to min_score
+    threshold = min_score - 1e-6
+    for doctor, row, columns in zip(doctors, best_scores, best_columns):
+        for value, column in zip(row, columns):
+            if value >= threshold:
+                yield doctor.id, int(job_ids[column]), round(float(value), 4)
+
+
+def _settings():
+    config = current_app.config
+    return (config.get('RECOMMENDATIONS_PER_DOCTOR', 20), config.get('RECOMMENDATION_MIN_SCORE', 0.5),
+            config.get('RECOMMENDATION_BATCH_SIZE', 500), config.get('RECOMMENDATION_JOB_CHUNK', 2048))
+
+
+def _batches(ids, size):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _store(matches):
+    now = datetime.utcnow()
+    rows = [{'doctor_id': doctor_id, 'job_id': job_id, 'score': value, 'computed_at': now}
+            for doctor_id, job_id, value in matches]
+    if rows:
+        db.session.execute(JobRecommendation.__table__.insert(), rows)
+    return len(rows)
+
+
+def _active_jobs():
+    return db.session.execute(db.select(*JOB_FEATURES).where(Job.status == 'active').order_by(Job.id)).all()
+
+
+def refresh_doctors(doctor_ids, jobs=None):
+    """Recompute the recommendations of some doctors in the current transaction.
+
+    Returns the number of recommendations stored.
+    """
+    k, min_score, batch_size, job_chunk = _settings()
+    jobs = _active_jobs() if jobs is None else jobs
+    stored = 0
+    for batch in _batches(doctor_ids, batch_size):
+        db.session.execute(db.delete(JobRecommendation).where(JobRecommendation.doctor_id.in_(batch)),
+                           execution_options={'synchronize_session': False})
+        doctors = db.session.execute(db.select(*DOCTOR_FEATURES).where(Doctor.id.in_(batch))).all()
+        stored += _store(top_matches(doctors, jobs, k, min_score, job_chunk))
+    return stored
+
+
+def _trim(doctor_ids, k):
+    """Keep only the best k recommendations of some doctors"""
+    ranked = db.select(
+        JobRecommendation.id,
+        db.func.row_number().over(
+            partition_by=JobRecommendation.doctor_id,
+            order_by=(JobRecommendation.score.desc(), JobRecommendation.job_id.desc())
+        ).label('position')
+    ).where(JobRecommendation.doctor_id.in_(doctor_ids)).subquery()
+    db.session.execute(
+        db.delete(JobRecommendation).where(JobRecommendation.id.in_(db.select(ranked.c.id).where(ranked.c.position > k))),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def refresh_job(job_id):
+    """Update the recommendations for a posted, changed, closed or deleted job"""
+    k, min_score, batch_size, _ = _settings()
+    previous = set(db.session.execute(
+        db.select(JobRecommendation.doctor_id).where(JobRecommendation.job_id == job_id)
+    ).scalars())
+    db.session.execute(db.delete(JobRecommendation).where(JobRecommendation.job_id == job_id),
+                       execution_options={'synchronize_session': False})
+
+    job = db.session.execute(db.select(*JOB_FEATURES).where(Job.id == job_id, Job.status == 'active')).first()
+    matched = set()
+    if job is not None:
+        doctor_ids = db.session.execute(db.select(Doctor.id).order_by(Doctor.id)).scalars().all()
+        for batch in _batches(doctor_ids, batch_size):
+            doctors = db.session.execute(db.select(*DOCTOR_FEATURES).where(Doctor.id.in_(batch))).all()
+            matches = list(top_matches(doctors, [job], 1, min_score))
+            if matches:
+                _store(matches)
+                matched.update(doctor_id for doctor_id, _, _ in matches)
+                _trim([doctor_id for doctor_id, _, _ in matches], k)
+
+    # Doctors that lost the job from their list get their next best job
+    refresh_doctors(sorted(previous - matched))
+
+
+def _store_match_scores(scores):
+    """Set match_score for many applications ({application id: score}) in one UPDATE"""
+    if scores:
+        db.session.execute(
+            db.update(JobApplication).where(JobApplication.id.in_(scores)).values(
+                match_score=db.case(scores, value=JobApplication.id)
+            ),
+            execution_options={'synchronize_session': False}
+        )
+
+
+def rescore_applications(doctor):
+    """Store the match score of every application of a doctor whose profile changed"""
+    rows = db.session.execute(
+        db.select(JobApplication.id, *JOB_FEATURES[1:]).join(Job).where(JobApplication.doctor_id == doctor.id)
+    ).all()
+    _store_match_scores({row.id: round(score(doctor, row), 4) for row in rows})
+
+
+@task('refresh_job_recommendations')
+def refresh_job_recommendations(job_id):
+    refresh_job(job_id)
+
+
+@task('refresh_doctor_recommendations')
+def refresh_doctor_recommendations(doctor_id):
+    refresh_doctors([doctor_id])
+
+
+@recommendations_cli.command('refresh')
+@click.option('--doctor', 'doctor_ids', type=int, multiple=True, help='Only this doctor (repeatable).')
+def refresh(doctor_ids):
+    """Recompute the recommendations of every doctor."""
+    _, _, batch_size, _ = _settings()
+    if not doctor_ids:
+        doctor_ids = db.session.execute(db.select(Doctor.id).order_by(Doctor.id)).scalars().all()
+    jobs = _active_jobs()
+    stored = 0
+    for batch in _batches(doctor_ids, batch_size):
+        stored += refresh_doctors(batch, jobs)
+        db.session.commit()
+    click.echo(f'Stored {stored} recommendation(s) for {len(doctor_ids)} doctor(s) '
+               f'({"numpy" if numpy is not None else "pure Python"} scoring).')
+
+
+@recommendations_cli.command('score-applications')
+def score_applications():
+    """Recompute the match score of every job application."""
+    _, _, batch_size, _ = _settings()
+    query = db.select(
+        JobApplication.id,
+        Job.specialization, Job.experience_required, Job.location,
+        Doctor.specialization.label('doctor_specialization'),
+        Doctor.experience_years.label('doctor_experience_years'),
+        Doctor.location.label('doctor_location')
+    ).join(Job, JobApplication.job_id == Job.id).join(Doctor, JobApplication.doctor_id == Doctor.id)
+
+    last_id, updated = 0, 0
+    while True:
+        rows = db.session.execute(
+            query.where(JobApplication.id > last_id).order_by(JobApplication.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        _store_match_scores({
+            row.id: round(score(DoctorFeatures(row.doctor_specialization, row.doctor_experience_years,
+                                               row.doctor_location), row), 4)
+            for row in rows
+        })
+        db.session.commit()
+        last_id, updated = rows[-1].id, updated + len(rows)
+    click.echo(f'Scored {updated} application(s).')
@@ -0,0 +1,86 @@
+"""
+Read-replica routing.
+
+When SQLALCHEMY_REPLICA_URLS is set, each replica becomes a Flask-SQLAlchemy
+bind (replica_0, replica_1, ...) and RoutingSession sends the statements of
+read-only requests (GET, HEAD, OPTIONS) to one of them, picked once per
+request. Everything else goes to the primary: other methods, flushes, DML
+statements, CLI commands and background work.
+
+A request that writes pins its user to the primary for
+DB_REPLICA_PIN_SECONDS (stored in the session cookie), so the pages they
+load right after a change read their own writes despite replication lag.
+"""
+import random
+import time
+
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+
+READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_SESSION_KEY = '_db_primary_until'
+
+
+def replica_bind_keys(app):
+    """Register the configured replicas as binds; call before db.init_app"""
+    urls = app.config.get('SQLALCHEMY_REPLICA_URLS') or []
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    keys = []
+    for index, url in enumerate(urls):
+        key = f'replica_{index}'
+        binds[key] = url
+        keys.append(key)
+    app.config['SQLALCHEMY_BINDS'] = binds
+    app.extensions['replica_bind_keys'] = keys
+    return keys
+
+
+def primary_pinned():
+    """Whether the current user wrote recently and must read from the primary"""
+    return session.get(PIN_SESSION_KEY, 0) > time.time()
+
+
+def choose_replica(engines):
+    """The replica engine for this request, or None to use the primary"""
+    if not has_request_context() or request.method not in READ_ONLY_METHODS:
+        return None
+    keys = current_app.extensions.get('replica_bind_keys')
+    if not keys or primary_pinned():
+        return None
+    if '_db_replica' not in g:
+        g._db_replica = random.choice(keys)
+    return engines[g._db_replica]
+
+
+class RoutingSession(Session):
+    """Session that reads from a replica during read-only requests"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not getattr(clause, 'is_dml', False):
+            replica = choose_replica(self._db.engines)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_write(session, flush_context):
+    if has_request_context():
+        g._db_wrote = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _mark_statement_write(orm_execute_state):
+    # INSERT/UPDATE/DELETE statements executed without a flush
+    state = orm_execute_state
+    if has_request_context() and (state.is_insert or state.is_update or state.is_delete):
+        g._db_wrote = True
+
+
+def pin_after_write(response):
+    """after_request hook: keep a user who just wrote on the primary for a while"""
+    if g.get('_db_wrote') and current_app.extensions.get('replica_bind_keys'):
+        session[PIN_SESSION_KEY] = time.time() + current_app.config.get('DB_REPLICA_PIN_SECONDS', 5)
+    return response
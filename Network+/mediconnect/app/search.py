@@ -0,0 +1,157 @@
+"""
+Full-text search over job postings.
+
+PostgreSQL keeps a weighted ``tsvector`` generated column on ``jobs`` with a
+GIN index; SQLite keeps an external-content FTS5 table that triggers update
+on insert, update and delete. Both rank matches (title > specialization >
+location > description). Other databases fall back to substring matching.
+"""
+import re
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import DDL, event
+
+from app.models import db, Job
+
+
+search_cli = AppGroup('search', help='Job search index commands.')
+
+
+POSTGRES_DDL = [
+    """ALTER TABLE jobs ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(specialization, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(location, '')), 'C') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'D')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_jobs_search_vector ON jobs USING GIN (search_vector)",
+]
+
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS jobs_fts USING fts5(
+        title, specialization, location, description,
+        content='jobs', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS jobs_fts_insert AFTER INSERT ON jobs BEGIN
+        INSERT INTO jobs_fts(rowid, title, specialization, location, description)
+        VALUES (new.id, new.title, new.specialization, new.location, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS jobs_fts_delete AFTER DELETE ON jobs BEGIN
+        INSERT INTO jobs_fts(jobs_fts, rowid, title, specialization, location, description)
+        VALUES ('delete', old.id, old.title, old.specialization, old.location, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS jobs_fts_update AFTER UPDATE OF title, specialization, location, description ON jobs BEGIN
+        INSERT INTO jobs_fts(jobs_fts, rowid, title, specialization, location, description)
+        VALUES ('delete', old.id, old.title, old.specialization, old.location, old.description);
+        INSERT INTO jobs_fts(rowid, title, specialization, location, description)
+        VALUES (new.id, new.title, new.specialization, new.location, new.description);
+    END""",
+]
+
+# Keep the search structures alongside the jobs table when it is created by
+# db.create_all() (development and tests); production uses the migration.
+for statement in POSTGRES_DDL:
+    event.listen(Job.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+for statement in SQLITE_DDL:
+    event.listen(Job.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Job.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS jobs_fts').execute_if(dialect='sqlite'))
+
+
+def _terms(text):
+    """Split user input into plain search terms"""
+    return re.findall(r'[^\W_]+', (text or '').lower())
+
+
+class PostgresJobSearch:
+    """Search through the jobs.search_vector GIN index"""
+
+    def apply(self, query, search, specialization, location):
+        # Prefix match every term; specialization and location terms only
+        # match lexemes carrying the weight of their field.
+        parts = [f'{term}:*' for term in _terms(search)]
+        parts += [f'{term}:*B' for term in _terms(specialization)]
+        parts += [f'{term}:*C' for term in _terms(location)]
+
+        tsquery = db.func.to_tsquery('english', ' & '.join(parts))
+        vector = db.literal_column('jobs.search_vector')
+        return query.filter(vector.op('@@')(tsquery)).order_by(
+            db.func.ts_rank_cd(vector, tsquery).desc(), Job.id.desc()
+        )
+
+
+class SQLiteJobSearch:
+    """Search through the jobs_fts FTS5 table"""
+
+    def apply(self, query, search, specialization, location):
+        parts = [f'"{term}"*' for term in _terms(search)]
+        parts += [f'specialization : "{term}"*' for term in _terms(specialization)]
+        parts += [f'location : "{term}"*' for term in _terms(location)]
+
+        # bm25() weights follow the PostgreSQL A-D field weights
+        matches = db.text(
+            'SELECT rowid AS job_id, bm25(jobs_fts, 10.0, 5.0, 2.0, 1.0) AS rank '
+            'FROM jobs_fts WHERE jobs_fts MATCH :match'
+        ).bindparams(match=' AND '.join(parts)).columns(
+            job_id=db.Integer, rank=db.Float
+        ).subquery('job_search')
+        return query.join(matches, matches.c.job_id == Job.id).order_by(matches.c.rank, Job.id.desc())
+
+
+class LikeJobSearch:
+    """Unindexed substring matching for databases without a search backend"""
+
+    def apply(self, query, search, specialization, location):
+        for term in _terms(search):
+            query = query.filter(db.or_(
+                Job.title.ilike(f'%{term}%'),
+                Job.description.ilike(f'%{term}%')
+            ))
+        for term in _terms(specialization):
+            query = query.filter(Job.specialization.ilike(f'%{term}%'))
+        for term in _terms(location):
+            query = query.filter(Job.location.ilike(f'%{term}%'))
+        return query.order_by(Job.created_at.desc(), Job.id.desc())
+
+
+BACKENDS = {
+    'postgresql': PostgresJobSearch,
+    'sqlite': SQLiteJobSearch,
+    'like': LikeJobSearch,
+}
+
+
+def get_backend():
+    """Return the search backend for the configured database"""
+    name = current_app.config.get('SEARCH_BACKEND') or db.engine.dialect.name
+    return BACKENDS.get(name, LikeJobSearch)()
+
+
+def search_jobs(query, search='', specialization='', location=''):
+    """Filter a Job query by search terms, ordered by relevance.
+
+    Returns the query and whether it was filtered; an unfiltered query is
+    returned unchanged so callers can keep their own ordering.
+    """
+    if not (_terms(search) or _terms(specialization) or _terms(location)):
+        return query, False
+    return get_backend().apply(query, search, specialization, location), True
+
+
+@search_cli.command('reindex')
+def reindex():
+    """Create missing search structures and rebuild the index"""
+    dialect = db.engine.dialect.name
+    with db.engine.begin() as connection:
+        if dialect == 'postgresql':
+            for statement in POSTGRES_DDL:
+                connection.exec_driver_sql(statement)
+            connection.exec_driver_sql('REINDEX INDEX ix_jobs_search_vector')
+        elif dialect == 'sqlite':
+            for statement in SQLITE_DDL:
+                connection.exec_driver_sql(statement)
+            connection.exec_driver_sql("INSERT INTO jobs_fts(jobs_fts) VALUES ('rebuild')")
+        else:
+            raise click.ClickException(f'No search index for {dialect} databases')
+    click.echo('Job search index rebuilt')
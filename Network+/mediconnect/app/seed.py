@@ -0,0 +1,137 @@
+"""
+Synthetic data for index checks and benchmarks.
+
+Rows are created through the regular models so every default, event and
+trigger (e.g. the job search index) runs exactly as it does for real data.
+"""
+import random
+from datetime import datetime, timedelta
+
+from app.models import db, User, Doctor, Hospital, Job, JobApplication
+from app.passwords import passwords
+from app.recommendations import refresh_doctors, score
+
+
+SPECIALIZATIONS = [
+    'Cardiology', 'Neurology', 'Pediatrics', 'Oncology', 'Radiology', 'Dermatology',
+    'Orthopedics', 'Psychiatry', 'Anesthesiology', 'Emergency Medicine', 'General Surgery',
+    'Internal Medicine', 'Obstetrics', 'Ophthalmology', 'Urology', 'Nephrology'
+]
+
+CITIES = [
+    'Boston', 'New York', 'Chicago', 'Houston', 'Phoenix', 'Philadelphia', 'San Antonio',
+    'San Diego', 'Dallas', 'Seattle', 'Denver', 'Atlanta', 'Miami', 'Portland'
+]
+
+TITLES = ['Consultant', 'Attending Physician', 'Resident', 'Fellow', 'Specialist', 'Head of Department']
+
+JOB_TYPES = ['full-time', 'part-time', 'contract']
+
+SEED_PASSWORD = 'password'
+
+
+def seed_dataset(hospitals=20, jobs_per_hospital=25, doctors=200, applications_per_doctor=8,
+                 admins=1, seed=42):
+    """Insert a synthetic dataset and return the created row counts.
+
+    Users are named admin0.., hospital0.. and doctor0.. and share the
+    password SEED_PASSWORD. Applications are skewed towards a small set of
+    popular jobs, as they are in production.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    # Hashing once keeps seeding fast; every seeded user gets the same hash
+    password_hash = passwords.hash(SEED_PASSWORD)
+
+    def when(max_days):
+        return now - timedelta(days=rng.uniform(0, max_days))
+
+    def user(username, role):
+        return User(username=username, email=f'{username}@example.org', password_hash=password_hash,
+                    role=role, is_verified=rng.random() < 0.8, created_at=when(365))
+
+    for i in range(admins):
+        db.session.add(user(f'admin{i}', 'admin'))
+
+    hospital_rows = []
+    for i in range(hospitals):
+        city = rng.choice(CITIES)
+        hospital_rows.append(Hospital(
+            user=user(f'hospital{i}', 'hospital'),
+            hospital_name=f'{city} General Hospital {i}',
+            city=city,
+            state='NA',
+            description='Synthetic hospital',
+            created_at=when(365)
+        ))
+    db.session.add_all(hospital_rows)
+
+    doctor_rows = []
+    for i in range(doctors):
+        doctor_rows.append(Doctor(
+            user=user(f'doctor{i}', 'doctor'),
+            full_name=f'Doctor {i}',
+            specialization=rng.choice(SPECIALIZATIONS),
+            experience_years=rng.randint(0, 30),
+            location=rng.choice(CITIES),
+            bio='Synthetic doctor',
+            created_at=when(365)
+        ))
+    db.session.add_all(doctor_rows)
+    db.session.flush()
+
+    job_rows = []
+    for hospital in hospital_rows:
+        for _ in range(jobs_per_hospital):
+            specialization = rng.choice(SPECIALIZATIONS)
+            salary_min = rng.randrange(80, 300) * 1000
+            created_at = when(180)
+            job_rows.append(Job(
+                hospital_id=hospital.id,
+                title=f'{specialization} {rng.choice(TITLES)}',
+                specialization=specialization,
+                description=f'{specialization} position at {hospital.hospital_name} in {hospital.city}.',
+                location=rng.choice([hospital.city, hospital.city, rng.choice(CITIES)]),
+                salary_min=salary_min,
+                salary_max=salary_min + rng.randrange(10, 100) * 1000,
+                experience_required=rng.randint(0, 15),
+                job_type=rng.choice(JOB_TYPES),
+                status='active' if rng.random() < 0.7 else 'closed',
+                created_at=created_at,
+                updated_at=created_at
+            ))
+    db.session.add_all(job_rows)
+    db.session.flush()
+
+    # Zipf-like popularity: a few jobs attract most of the applications
+    weights = [1.0 / (rank + 1) for rank in range(len(job_rows))]
+    applications = 0
+    for doctor in doctor_rows:
+        picked = set()
+        target = min(applications_per_doctor, len(job_rows))
+        while len(picked) < target:
+            picked.add(rng.choices(range(len(job_rows)), weights=weights)[0])
+        for index in picked:
+            job = job_rows[index]
+            db.session.add(JobApplication(
+                job_id=job.id,
+                doctor_id=doctor.id,
+                status=rng.choice(['pending', 'pending', 'reviewed', 'accepted', 'rejected']),
+                cover_letter='Synthetic application',
+                match_score=round(score(doctor, job), 4),
+                applied_at=job.created_at + timedelta(days=rng.uniform(0, 30))
+            ))
+            applications += 1
+
+    db.session.commit()
+
+    recommendations = refresh_doctors([doctor.id for doctor in doctor_rows])
+    db.session.commit()
+    return {
+        'admins': admins,
+        'hospitals': hospitals,
+        'doctors': doctors,
+        'jobs': len(job_rows),
+        'applications': applications,
+        'recommendations': recommendations,
+    }
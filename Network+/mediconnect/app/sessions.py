@@ -0,0 +1,199 @@
+"""
+Server-side sessions.
+
+The session cookie only carries a random session id; the session data is
+kept in a store selected by SESSION_TYPE:
+
+- ``sqlite``: a SQLite file shared by every worker on the host
+- ``redis``: a Redis-compatible server shared by every host (needs ``redis``)
+- ``memory``: an in-process dictionary (single process, tests)
+- ``cookie``: Flask's signed cookie sessions
+
+Sessions read from a shared store are kept in an in-process LRU for
+SESSION_LRU_TTL seconds, so a busy client usually costs no store read at
+all. The price is that a change made by another worker (a logout, an
+invalidation) can take that long to be seen.
+
+Every session of a user records the user's session generation. Admin
+changes to a user bump it (invalidate_user_sessions), and the next time
+one of the user's sessions is read from the store its copy of the user's
+fields is reloaded from the database, or the session is dropped if the user
+no longer exists or was deactivated.
+"""
+import hashlib
+import os
+import re
+import secrets
+import time
+
+from flask import current_app
+from flask.sessions import SecureCookieSession, SessionInterface
+
+from app.cache import LRUCache, RedisCache, SQLiteCache
+from app.models import db, User
+
+
+SESSION_ID = re.compile(r'[A-Za-z0-9_-]{43}')
+
+
+def user_fields(user):
+    """The fields of a user kept in their session"""
+    return {
+        'user_id': user.id,
+        'username': user.username,
+        'role': user.role,
+        'email': user.email,
+        'is_verified': user.is_verified,
+    }
+
+
+class ServerSession(SecureCookieSession):
+    """Session data stored under an id; tracks access and modification"""
+
+    def __init__(self, initial=None, sid=None, saved_at=0):
+        super().__init__(initial)
+        self.sid = sid
+        self.saved_at = saved_at
+        self.loaded_user_id = self.get('user_id')
+        self.accessed = False
+
+
+class ServerSessionInterface(SessionInterface):
+    """Keep session data in a store, with only the session id in the cookie"""
+
+    def __init__(self, store, hot=None, hot_ttl=5, prefix=''):
+        self.store = store
+        self.hot = hot
+        self.hot_ttl = hot_ttl
+        self.prefix = prefix
+
+    def _key(self, sid):
+        # Hashed, so the contents of the store cannot be used as cookies
+        return self.prefix + 'session:' + hashlib.sha256(sid.encode()).hexdigest()
+
+    def _generation_key(self, user_id):
+        return f'{self.prefix}session-user:{user_id}'
+
+    def generation(self, user_id):
+        return self.store.get_many([self._generation_key(user_id)])[0] or 0
+
+    def invalidate_user(self, user_id):
+        self.store.set(self._generation_key(user_id), time.time_ns())
+
+    def _write(self, app, sid, data):
+        user_id = data.get('user_id')
+        record = {
+            'data': data,
+            'saved_at': time.time(),
+            'generation': self.generation(user_id) if user_id is not None else 0,
+        }
+        self.store.set(self._key(sid), record, app.permanent_session_lifetime.total_seconds())
+        if self.hot is not None:
+            self.hot.set(self._key(sid), record, self.hot_ttl)
+        return record
+
+    def _delete(self, sid):
+        self.store.delete(self._key(sid))
+        if self.hot is not None:
+            self.hot.delete(self._key(sid))
+
+    def _load(self, app, sid):
+        key = self._key(sid)
+        if self.hot is not None:
+            record = self.hot.get_many([key])[0]
+            if record is not None:
+                return record
+
+        record = self.store.get_many([key])[0]
+        if record is None:
+            return None
+        user_id = record['data'].get('user_id')
+        if user_id is not None and record['generation'] != self.generation(user_id):
+            # The user was changed or deleted since this session was saved
+            user = db.session.get(User, user_id)
+            if user is None or user.deleted_at is not None:
+                self._delete(sid)
+                return None
+            record = self._write(app, sid, dict(record['data'], **user_fields(user)))
+        elif self.hot is not None:
+            self.hot.set(key, record, self.hot_ttl)
+        return record
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or not SESSION_ID.fullmatch(sid):
+            return ServerSession()
+        record = self._load(app, sid)
+        if record is None:
+            return ServerSession()
+        return ServerSession(record['data'], sid=sid, saved_at=record['saved_at'])
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.sid is not None:
+                self._delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path, secure=secure, samesite=samesite,
+                                       httponly=httponly)
+            return
+
+        # A new session, or a different user logging in, gets a new id
+        rotate = session.sid is None or session.get('user_id') != session.loaded_user_id
+        # Extend the lifetime of sessions in use, at most every half lifetime
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        stale = time.time() - session.saved_at > lifetime / 2
+        if not (rotate or session.modified or stale):
+            return
+
+        if rotate:
+            if session.sid is not None:
+                self._delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+        self._write(app, session.sid, dict(session))
+
+        if rotate or (session.permanent and app.config['SESSION_REFRESH_EACH_REQUEST']):
+            response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=httponly, domain=domain, path=path, secure=secure, samesite=samesite)
+
+
+def make_store(app):
+    """Create the session store selected by SESSION_TYPE, with its LRU"""
+    config = app.config
+    session_type = config.get('SESSION_TYPE', 'cookie')
+    if session_type == 'memory':
+        return LRUCache(config.get('SESSION_MEMORY_ENTRIES', 100000)), None
+    hot = LRUCache(config.get('SESSION_LRU_ENTRIES', 1024)) if config.get('SESSION_LRU_TTL') else None
+    if session_type == 'sqlite':
+        path = config.get('SESSION_SQLITE_PATH') or os.path.join(app.instance_path, 'sessions.sqlite')
+        return SQLiteCache(path, config.get('SESSION_SQLITE_ENTRIES', 100000)), hot
+    if session_type == 'redis':
+        url = config.get('SESSION_REDIS_URL') or config.get('CACHE_REDIS_URL')
+        if not url:
+            raise ValueError('SESSION_TYPE = "redis" requires SESSION_REDIS_URL or CACHE_REDIS_URL')
+        return RedisCache(url), hot
+    raise ValueError(f'Unknown SESSION_TYPE {session_type!r}')
+
+
+def init_sessions(app):
+    """Install the server-side session interface unless SESSION_TYPE is 'cookie'"""
+    if app.config.get('SESSION_TYPE', 'cookie') == 'cookie':
+        return
+    store, hot = make_store(app)
+    app.session_interface = ServerSessionInterface(
+        store, hot, app.config.get('SESSION_LRU_TTL', 5), app.config.get('CACHE_KEY_PREFIX', '')
+    )
+
+
+def invalidate_user_sessions(user_id):
+    """Make every session of a user reload its user fields (or end, if the user was deleted)"""
+    if isinstance(current_app.session_interface, ServerSessionInterface):
+        current_app.session_interface.invalidate_user(user_id)
@@ -0,0 +1,477 @@
+"""
+Dashboard and report statistics.
+
+With STATS_COUNTERS enabled the dashboards and reports read precomputed
+rows from the stat_counters table. The counters are kept current from the
+session's flush events as users, jobs and applications are created,
+changed or deleted; writes that bypass the ORM (bulk UPDATE/INSERT) call
+increment() themselves. `flask stats rebuild` recomputes every counter
+from the base tables and reports any drift.
+
+Without counters each dashboard is computed in a single round trip with
+conditional aggregation, optionally cached for DASHBOARD_CACHE_TTL seconds.
+"""
+import sqlite3
+from collections import Counter
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.cache import cache
+from app.models import db, User, Job, JobApplication, StatCounter
+
+
+stats_cli = AppGroup('stats', help='Statistics counter commands.')
+
+
+def count_where(condition):
+    """Count the rows matching a condition inside an aggregate query.
+
+    Renders COUNT(*) FILTER (WHERE ...) where the database supports it and
+    falls back to SUM(CASE WHEN ... THEN 1 ELSE 0 END) elsewhere.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql' or (dialect == 'sqlite' and sqlite3.sqlite_version_info >= (3, 30)):
+        return db.func.count().filter(condition)
+    return db.func.coalesce(db.func.sum(db.case((condition, 1), else_=0)), 0)
+
+
+def cached(key, compute):
+    """Return compute() through the application cache for DASHBOARD_CACHE_TTL seconds"""
+    ttl = current_app.config.get('DASHBOARD_CACHE_TTL', 0)
+    if not ttl:
+        return compute()
+    return cache.get_or_set(('stats', key), compute, timeout=ttl)
+
+
+def _one_row(*subqueries):
+    """Select every column of several single-row aggregate subqueries at once"""
+    from_clause = subqueries[0]
+    for subquery in subqueries[1:]:
+        from_clause = from_clause.join(subquery, db.true())
+    columns = [column for subquery in subqueries for column in subquery.c]
+    return dict(db.session.execute(db.select(*columns).select_from(from_clause)).mappings().one())
+
+
+def compute_admin_stats():
+    """Site-wide user, job and application counts in one query"""
+    users = db.select(
+        db.func.count().label('total_users'),
+        count_where(User.is_verified.is_(True)).label('verified_users'),
+        count_where(User.is_verified.is_(False)).label('unverified_users'),
+        count_where(User.role == 'doctor').label('doctors'),
+        count_where(User.role == 'hospital').label('hospitals')
+    ).select_from(User).where(User.deleted_at.is_(None)).subquery()
+
+    jobs = db.select(
+        db.func.count().label('total_jobs'),
+        count_where(Job.status == 'active').label('active_jobs')
+    ).select_from(Job).subquery()
+
+    applications = db.select(
+        db.func.count().label('total_applications')
+    ).select_from(JobApplication).subquery()
+
+    return _one_row(users, jobs, applications)
+
+
+def compute_hospital_stats(hospital_id):
+    """Job and application counts for one hospital in one query"""
+    jobs = db.select(
+        db.func.count().label('total_jobs'),
+        count_where(Job.status == 'active').label('active_jobs')
+    ).where(Job.hospital_id == hospital_id).subquery()
+
+    applications = db.select(
+        db.func.count().label('total_applications'),
+        count_where(JobApplication.status == 'pending').label('pending_applications')
+    ).select_from(JobApplication).join(Job).where(Job.hospital_id == hospital_id).subquery()
+
+    return _one_row(jobs, applications)
+
+
+def compute_report_stats():
+    """Group-by breakdowns for admin.reports"""
+    job_stats = {
+        'by_status': db.session.query(Job.status, db.func.count(Job.id)).group_by(Job.status).all(),
+        'by_specialization': db.session.query(Job.specialization, db.func.count(Job.id)).group_by(Job.specialization).all()
+    }
+    app_stats = {
+        'by_status': db.session.query(JobApplication.status, db.func.count(JobApplication.id)).group_by(JobApplication.status).all()
+    }
+    users = db.session.query(User).filter(User.deleted_at.is_(None))
+    user_stats = {
+        'by_role': users.with_entities(User.role, db.func.count(User.id)).group_by(User.role).all(),
+        'by_verification': users.with_entities(User.is_verified, db.func.count(User.id)).group_by(User.is_verified).all()
+    }
+    return job_stats, app_stats, user_stats
+
+
+# --- Counters -------------------------------------------------------------
+#
+# A counter is identified by (scope, scope_id, name). Each tracked row
+# contributes +1 to the counters returned by its key function; a change to
+# a tracked column moves the row from its old counters to its new ones.
+
+def _user_keys(values):
+    # Deactivated users are no longer counted, so purging them changes nothing
+    if values.get('deleted_at') is not None:
+        return []
+    verified = 'true' if values['is_verified'] else 'false'
+    return [
+        ('global', 0, 'users.total'),
+        ('global', 0, f"users.role.{values['role']}"),
+        ('global', 0, f'users.verified.{verified}'),
+    ]
+
+
+def _job_keys(values):
+    return [
+        ('global', 0, 'jobs.total'),
+        ('global', 0, f"jobs.status.{values['status']}"),
+        ('global', 0, f"jobs.specialization.{values['specialization']}"),
+        ('hospital', values['hospital_id'], 'jobs.total'),
+        ('hospital', values['hospital_id'], f"jobs.status.{values['status']}"),
+    ]
+
+
+def _application_keys(values):
+    keys = [
+        ('global', 0, 'applications.total'),
+        ('global', 0, f"applications.status.{values['status']}"),
+    ]
+    if values['hospital_id'] is not None:
+        keys += [
+            ('hospital', values['hospital_id'], 'applications.total'),
+            ('hospital', values['hospital_id'], f"applications.status.{values['status']}"),
+        ]
+    return keys
+
+
+# model: (tracked attributes, key function)
+TRACKED = {
+    User: (('role', 'is_verified', 'deleted_at'), _user_keys),
+    Job: (('hospital_id', 'status', 'specialization'), _job_keys),
+    JobApplication: (('job_id', 'status'), _application_keys),
+}
+
+
+def application_keys(hospital_id, status):
+    """Counter keys of an application; for writers that bypass the ORM"""
+    return _application_keys({'hospital_id': hospital_id, 'status': status})
+
+
+def job_keys(hospital_id, status, specialization):
+    """Counter keys of a job; for writers that bypass the ORM"""
+    return _job_keys({'hospital_id': hospital_id, 'status': status, 'specialization': specialization})
+
+
+def user_keys(role, is_verified):
+    """Counter keys of a user; for writers that bypass the ORM"""
+    return _user_keys({'role': role, 'is_verified': is_verified})
+
+
+def increment(connection, deltas):
+    """Add {(scope, scope_id, name): delta} to the counters atomically"""
+    rows = [
+        {'scope': scope, 'scope_id': scope_id, 'name': name, 'value': delta}
+        for (scope, scope_id, name), delta in sorted(deltas.items()) if delta
+    ]
+    if not rows:
+        return
+
+    table = StatCounter.__table__
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert(table) if dialect == 'postgresql' else sqlite.insert(table)
+        connection.execute(insert.on_conflict_do_update(
+            index_elements=['scope', 'scope_id', 'name'],
+            set_={'value': table.c.value + insert.excluded.value}
+        ), rows)
+        return
+
+    for row in rows:
+        updated = connection.execute(table.update().where(
+            table.c.scope == row['scope'],
+            table.c.scope_id == row['scope_id'],
+            table.c.name == row['name']
+        ).values(value=table.c.value + row['value'])).rowcount
+        if not updated:
+            connection.execute(table.insert(), row)
+
+
+def _counters_enabled():
+    return current_app.config.get('STATS_COUNTERS', False)
+
+
+def count_inserted(keys):
+    """Count a row inserted without the ORM (e.g. models.insert_ignore)"""
+    if _counters_enabled():
+        increment(db.session.connection(), Counter(keys))
+
+
+def count_updated(changes):
+    """Move rows updated without the ORM from their old counters to their new ones.
+
+    ``changes`` is an iterable of (old keys, new keys) pairs, one per row.
+    """
+    if not _counters_enabled():
+        return
+    deltas = Counter()
+    for old_keys, new_keys in changes:
+        deltas.subtract(old_keys)
+        deltas.update(new_keys)
+    increment(db.session.connection(), deltas)
+
+
+def count_deleted(model, condition):
+    """Take the rows of a model matching a condition off their counters.
+
+    For writers that delete without the ORM (bulk DELETE); call it in the
+    same transaction, before the rows are deleted.
+    """
+    if not _counters_enabled() or model not in TRACKED:
+        return
+    attributes, key_function = TRACKED[model]
+    columns = [getattr(model, attribute) for attribute in attributes]
+    query = db.select(*columns, db.func.count()).where(condition).group_by(*columns)
+    if model is JobApplication:
+        query = query.add_columns(Job.hospital_id).outerjoin(Job, JobApplication.job_id == Job.id).group_by(
+            Job.hospital_id
+        )
+
+    deltas = Counter()
+    for row in db.session.execute(query):
+        values = dict(zip(attributes, row))
+        if model is JobApplication:
+            values['hospital_id'] = row[-1]
+        for key in key_function(values):
+            deltas[key] -= row[len(attributes)]
+    increment(db.session.connection(), deltas)
+
+
+def _values(obj, attributes, old=False):
+    """Tracked attribute values of an object, before or after the flush"""
+    state = inspect(obj)
+    values = {}
+    for attribute in attributes:
+        history = state.attrs[attribute].history
+        if old and history.deleted:
+            values[attribute] = history.deleted[0]
+        else:
+            values[attribute] = state.dict.get(attribute)
+    return values
+
+
+@event.listens_for(db.session, 'before_flush')
+def _load_deleted(session, flush_context, instances):
+    # Make sure deleted rows have their tracked values loaded while the rows
+    # still exist; they are needed after the flush to decrement counters.
+    if not _counters_enabled():
+        return
+    for obj in session.deleted:
+        if type(obj) in TRACKED:
+            for attribute in TRACKED[type(obj)][0]:
+                getattr(obj, attribute)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _update_counters(session, flush_context):
+    if not _counters_enabled():
+        return
+
+    changes = []  # (model, old values or None, new values or None)
+    for obj in session.new:
+        if type(obj) in TRACKED:
+            changes.append((type(obj), None, _values(obj, TRACKED[type(obj)][0])))
+    for obj in session.deleted:
+        if type(obj) in TRACKED:
+            changes.append((type(obj), _values(obj, TRACKED[type(obj)][0], old=True), None))
+    for obj in session.dirty:
+        if type(obj) in TRACKED and session.is_modified(obj):
+            attributes = TRACKED[type(obj)][0]
+            old, new = _values(obj, attributes, old=True), _values(obj, attributes)
+            if old != new:
+                changes.append((type(obj), old, new))
+    if not changes:
+        return
+
+    # Applications count towards their job's hospital; use jobs already in
+    # the session (including ones deleted in this flush) before asking the
+    # database.
+    job_hospitals = {
+        obj.id: obj.hospital_id
+        for obj in list(session.identity_map.values()) + list(session.deleted)
+        if isinstance(obj, Job)
+    }
+    missing = {
+        values['job_id']
+        for model, old, new in changes if model is JobApplication
+        for values in (old, new) if values and values['job_id'] not in job_hospitals
+    }
+    if missing:
+        rows = session.connection().execute(
+            db.select(Job.id, Job.hospital_id).where(Job.id.in_(missing))
+        )
+        job_hospitals.update(dict(rows.all()))
+
+    deltas = Counter()
+    for model, old, new in changes:
+        key_function = TRACKED[model][1]
+        for values, sign in ((old, -1), (new, 1)):
+            if values is None:
+                continue
+            if model is JobApplication:
+                values = dict(values, hospital_id=job_hospitals.get(values['job_id']))
+            for key in key_function(values):
+                deltas[key] += sign
+
+    increment(session.connection(), deltas)
+
+
+# Load the previous value of tracked columns when they are assigned, even if
+# the object was expired, so the counter move can be computed.
+for _model, (_attributes, _) in TRACKED.items():
+    for _attribute in _attributes:
+        event.listen(getattr(_model, _attribute), 'set', lambda *args: None, active_history=True)
+
+
+def compute_counters():
+    """Recompute every counter from the base tables"""
+    counts = Counter()
+
+    rows = db.session.query(User.role, User.is_verified, db.func.count()).filter(User.deleted_at.is_(None)).group_by(
+        User.role, User.is_verified
+    )
+    for role, is_verified, count in rows:
+        for key in user_keys(role, is_verified):
+            counts[key] += count
+
+    rows = db.session.query(Job.hospital_id, Job.status, Job.specialization, db.func.count()).group_by(
+        Job.hospital_id, Job.status, Job.specialization
+    )
+    for hospital_id, status, specialization, count in rows:
+        for key in job_keys(hospital_id, status, specialization):
+            counts[key] += count
+
+    rows = db.session.query(Job.hospital_id, JobApplication.status, db.func.count()).join(
+        Job, JobApplication.job_id == Job.id
+    ).group_by(Job.hospital_id, JobApplication.status)
+    for hospital_id, status, count in rows:
+        for key in application_keys(hospital_id, status):
+            counts[key] += count
+
+    return counts
+
+
+def read_counters(scope='global', scope_id=0, names=None):
+    """Return {name: value} for the counters of one scope"""
+    query = db.select(StatCounter.name, StatCounter.value).where(
+        StatCounter.scope == scope, StatCounter.scope_id == scope_id
+    )
+    if names is not None:
+        query = query.where(StatCounter.name.in_(list(names)))
+    return dict(db.session.execute(query).all())
+
+
+def _breakdown(counters, prefix, convert=str):
+    """[(value, count)] for the non-zero counters named prefix.<value>"""
+    return sorted(
+        (convert(name[len(prefix):]), count)
+        for name, count in counters.items() if name.startswith(prefix) and count
+    )
+
+
+ADMIN_COUNTERS = {
+    'total_users': 'users.total',
+    'verified_users': 'users.verified.true',
+    'unverified_users': 'users.verified.false',
+    'doctors': 'users.role.doctor',
+    'hospitals': 'users.role.hospital',
+    'total_jobs': 'jobs.total',
+    'active_jobs': 'jobs.status.active',
+    'total_applications': 'applications.total',
+}
+
+HOSPITAL_COUNTERS = {
+    'total_jobs': 'jobs.total',
+    'active_jobs': 'jobs.status.active',
+    'total_applications': 'applications.total',
+    'pending_applications': 'applications.status.pending',
+}
+
+
+def admin_dashboard_stats():
+    """Statistics for admin.dashboard"""
+    if _counters_enabled():
+        counters = read_counters(names=ADMIN_COUNTERS.values())
+        return {stat: counters.get(name, 0) for stat, name in ADMIN_COUNTERS.items()}
+    return cached('admin', compute_admin_stats)
+
+
+def hospital_dashboard_stats(hospital_id):
+    """Statistics for hospital.dashboard"""
+    if _counters_enabled():
+        counters = read_counters('hospital', hospital_id, names=HOSPITAL_COUNTERS.values())
+        return {stat: counters.get(name, 0) for stat, name in HOSPITAL_COUNTERS.items()}
+    return cached(('hospital', hospital_id), lambda: compute_hospital_stats(hospital_id))
+
+
+def report_stats():
+    """(job_stats, app_stats, user_stats) for admin.reports"""
+    if not _counters_enabled():
+        return compute_report_stats()
+
+    counters = read_counters()
+    job_stats = {
+        'by_status': _breakdown(counters, 'jobs.status.'),
+        'by_specialization': _breakdown(counters, 'jobs.specialization.')
+    }
+    app_stats = {
+        'by_status': _breakdown(counters, 'applications.status.')
+    }
+    user_stats = {
+        'by_role': _breakdown(counters, 'users.role.'),
+        'by_verification': _breakdown(counters, 'users.verified.', lambda value: value == 'true')
+    }
+    return job_stats, app_stats, user_stats
+
+
+@stats_cli.command('rebuild')
+@click.option('--dry-run', is_flag=True, help='Only report drift, do not write.')
+def rebuild(dry_run):
+    """Recompute all statistics counters from scratch"""
+    if db.engine.dialect.name == 'postgresql' and not dry_run:
+        # Hold off concurrent increments until the new values are committed
+        db.session.execute(db.text('LOCK TABLE stat_counters IN SHARE ROW EXCLUSIVE MODE'))
+
+    expected = compute_counters()
+    current = {
+        (scope, scope_id, name): value
+        for scope, scope_id, name, value in db.session.execute(
+            db.select(StatCounter.scope, StatCounter.scope_id, StatCounter.name, StatCounter.value)
+        )
+    }
+
+    drift = sorted(key for key in set(expected) | set(current) if expected.get(key, 0) != current.get(key, 0))
+    for scope, scope_id, name in drift:
+        click.echo(f'{scope}:{scope_id} {name}: {current.get((scope, scope_id, name), 0)} -> '
+                   f'{expected.get((scope, scope_id, name), 0)}')
+
+    if dry_run:
+        db.session.rollback()
+        click.echo(f'{len(drift)} counter(s) drifted')
+        return
+
+    rows = [
+        {'scope': scope, 'scope_id': scope_id, 'name': name, 'value': value}
+        for (scope, scope_id, name), value in sorted(expected.items()) if value
+    ]
+    db.session.execute(db.delete(StatCounter))
+    if rows:
+        db.session.execute(db.insert(StatCounter), rows)
+    db.session.commit()
+    click.echo(f'Rebuilt {len(expected)} counter(s), {len(drift)} had drifted')
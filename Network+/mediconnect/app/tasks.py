@@ -0,0 +1,260 @@
+"""
+Background tasks.
+
+Side effects that need not hold up a request (notifications, report
+refreshes, exports) are queued in the tasks table and run by `flask worker`,
+so no broker is needed. Tasks are registered with the @task decorator and
+queued with ``f.enqueue(**payload)`` inside the request's transaction: they
+are only visible to workers once the request commits, and vanish with a
+rollback.
+
+A worker claims the oldest due task with one UPDATE ... RETURNING (FOR
+UPDATE SKIP LOCKED on PostgreSQL), runs it in an application context and
+marks it done. A failing task is retried with exponential backoff until it
+has been attempted max_attempts times, then marked failed. A task whose
+worker died is claimed again once its lease of TASK_LEASE_SECONDS expires,
+so handlers must be safe to run more than once.
+
+An idempotency key makes enqueue a no-op while a task with the same key
+exists (see `flask tasks purge`).
+"""
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from sqlalchemy.exc import OperationalError
+
+from app.models import db, Task, insert_ignore
+
+
+tasks_cli = AppGroup('tasks', help='Background task queue commands.')
+
+TaskSpec = namedtuple('TaskSpec', 'function max_attempts backoff')
+
+# name: TaskSpec
+TASKS = {}
+
+
+def task(name, max_attempts=None, backoff=None):
+    """Register a function as a background task.
+
+    ``max_attempts`` and ``backoff`` (seconds before the first retry,
+    doubled for every further one) default to TASK_MAX_ATTEMPTS and
+    TASK_RETRY_BACKOFF. The payload must be JSON-serializable keyword
+    arguments.
+    """
+    def decorator(f):
+        TASKS[name] = TaskSpec(f, max_attempts, backoff)
+
+        def queue(idempotency_key=None, delay=0, **payload):
+            return enqueue(name, payload, idempotency_key=idempotency_key, delay=delay)
+        f.enqueue = queue
+        return f
+    return decorator
+
+
+def enqueue(name, payload=None, idempotency_key=None, delay=0):
+    """Queue a task in the current transaction; the caller commits.
+
+    Returns the task id, or None if a task with the same idempotency key
+    is already queued or was run.
+    """
+    spec = TASKS[name]
+    row = insert_ignore(Task, {
+        'name': name,
+        'payload': payload or {},
+        'status': 'queued',
+        'idempotency_key': idempotency_key,
+        'max_attempts': spec.max_attempts or current_app.config.get('TASK_MAX_ATTEMPTS', 5),
+        'run_at': datetime.utcnow() + timedelta(seconds=delay),
+    }, Task.id)
+    return row.id if row else None
+
+
+def claim(worker_id):
+    """Lock the oldest due task for a worker and return it, or None"""
+    now = datetime.utcnow()
+    expired = now - timedelta(seconds=current_app.config.get('TASK_LEASE_SECONDS', 300))
+    due = db.select(Task.id).where(db.or_(
+        db.and_(Task.status == 'queued', Task.run_at <= now),
+        db.and_(Task.status == 'running', Task.locked_at < expired)
+    )).order_by(Task.run_at, Task.id).limit(1).with_for_update(skip_locked=True).scalar_subquery()
+
+    row = db.session.execute(
+        db.update(Task).where(Task.id == due).values(
+            status='running',
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=Task.attempts + 1
+        ).returning(Task.id, Task.name, Task.payload, Task.attempts, Task.max_attempts),
+        execution_options={'synchronize_session': False}
+    ).first()
+    db.session.commit()
+    return row
+
+
+def _finish(task_id, worker_id, **values):
+    db.session.execute(
+        db.update(Task).where(Task.id == task_id, Task.locked_by == worker_id).values(**values),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+
+
+def retry_delay(spec, attempts):
+    """Seconds before the next attempt: exponential backoff with jitter"""
+    backoff = spec.backoff if spec and spec.backoff is not None else current_app.config.get('TASK_RETRY_BACKOFF', 30)
+    delay = min(backoff * 2 ** (attempts - 1), current_app.config.get('TASK_RETRY_BACKOFF_MAX', 3600))
+    return delay * random.uniform(1, 1.2)
+
+
+def execute(row, worker_id):
+    """Run a claimed task and record the outcome"""
+    spec = TASKS.get(row.name)
+    try:
+        if spec is None:
+            raise LookupError(f'No task registered as {row.name!r}')
+        if row.attempts > row.max_attempts:
+            raise RuntimeError('Lease expired on the last attempt')
+        spec.function(**row.payload)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        error = f'{type(e).__name__}: {e}'
+        if spec is not None and row.attempts < row.max_attempts:
+            current_app.logger.warning('Task %s (%s) failed, retrying: %s', row.id, row.name, error)
+            _finish(row.id, worker_id, status='queued', locked_by=None, last_error=error,
+                    run_at=datetime.utcnow() + timedelta(seconds=retry_delay(spec, row.attempts)))
+        else:
+            current_app.logger.error('Task %s (%s) failed: %s', row.id, row.name, error)
+            _finish(row.id, worker_id, status='failed', last_error=error, finished_at=datetime.utcnow())
+        return False
+
+    _finish(row.id, worker_id, status='done', finished_at=datetime.utcnow())
+    return True
+
+
+def work(app, worker_id, stop, poll_interval, once=False):
+    """Claim and run tasks until stopped (or, with once, until none are due)"""
+    with app.app_context():
+        while not stop.is_set():
+            try:
+                row = claim(worker_id)
+            except OperationalError as e:
+                # e.g. SQLite busy while another worker writes
+                db.session.rollback()
+                app.logger.warning('Could not claim a task: %s', e)
+                row = None
+            if row is None:
+                if once:
+                    return
+                stop.wait(poll_interval)
+                continue
+            execute(row, worker_id)
+            db.session.remove()
+
+
+def run_workers(app, threads, stop, poll_interval, once=False):
+    """Run worker threads in this process until stopped"""
+    prefix = f'{socket.gethostname()}:{os.getpid()}'
+    workers = [
+        threading.Thread(target=work, args=(app, f'{prefix}:{index}', stop, poll_interval, once), daemon=True)
+        for index in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        while worker.is_alive():
+            worker.join(0.5)
+
+
+def _process_main(app, threads, poll_interval, once):
+    # Connections inherited from the parent must not be shared
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    run_workers(app, threads, stop, poll_interval, once)
+
+
+@click.command('worker')
+@click.option('--threads', default=2, show_default=True, help='Worker threads per process.')
+@click.option('--processes', default=1, show_default=True, help='Worker processes (forked).')
+@click.option('--poll-interval', type=float, help='Seconds to wait when no task is due [TASK_POLL_INTERVAL].')
+@click.option('--once', is_flag=True, help='Exit once no task is due.')
+@with_appcontext
+def worker_command(threads, processes, poll_interval, once):
+    """Run background tasks from the queue."""
+    app = current_app._get_current_object()
+    if poll_interval is None:
+        poll_interval = app.config.get('TASK_POLL_INTERVAL', 1.0)
+    click.echo(f'Worker: {processes} process(es) x {threads} thread(s), tasks: {", ".join(sorted(TASKS)) or "none"}')
+
+    if processes <= 1:
+        _process_main(app, threads, poll_interval, once)
+        return
+
+    context = multiprocessing.get_context('fork')
+    children = [context.Process(target=_process_main, args=(app, threads, poll_interval, once))
+                for _ in range(processes)]
+    for child in children:
+        child.start()
+
+    def forward(signum, frame):
+        for child in children:
+            if child.is_alive():
+                child.terminate()
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for child in children:
+        child.join()
+
+
+@tasks_cli.command('status')
+def status():
+    """Show the number of tasks per name and status."""
+    rows = db.session.query(Task.name, Task.status, db.func.count()).group_by(Task.name, Task.status).order_by(
+        Task.name, Task.status
+    ).all()
+    if not rows:
+        click.echo('No tasks.')
+    for name, task_status, count in rows:
+        click.echo(f'{name:<40} {task_status:<10} {count}')
+
+
+@tasks_cli.command('retry')
+@click.option('--name', help='Only tasks with this name.')
+def retry(name):
+    """Queue failed tasks again."""
+    query = db.update(Task).where(Task.status == 'failed')
+    if name:
+        query = query.where(Task.name == name)
+    result = db.session.execute(
+        query.values(status='queued', attempts=0, locked_by=None, finished_at=None, run_at=datetime.utcnow()),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    click.echo(f'Requeued {result.rowcount} task(s).')
+
+
+@tasks_cli.command('purge')
+@click.option('--days', default=7, show_default=True, help='Delete finished tasks older than this.')
+def purge(days):
+    """Delete old done and failed tasks (their idempotency keys become free)."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    result = db.session.execute(
+        db.delete(Task).where(Task.status.in_(('done', 'failed')), Task.finished_at < cutoff),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    click.echo(f'Deleted {result.rowcount} task(s).')
@@ -0,0 +1,73 @@
+"""
+Template compilation cache and streamed rendering.
+
+Compiled templates are kept as bytecode in TEMPLATE_CACHE_DIR (default
+instance/jinja_cache), so a new worker loads them instead of compiling
+every template again. `flask templates compile` fills the cache at deploy
+time and fails on templates that do not compile.
+
+render_page() streams large list pages with stream_template: the response
+starts as soon as the first TEMPLATE_STREAM_BUFFER characters are rendered
+and the page is never held in memory as a whole. Pages with flashed
+messages waiting are rendered in full, because the session cookie is sent
+before a streamed body and could not record that the messages were shown.
+"""
+import os
+
+import click
+from flask import Response, current_app, render_template, session, stream_template
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache
+
+
+templates_cli = AppGroup('templates', help='Template commands.')
+
+
+def init_templates(app):
+    """Attach the bytecode cache to the app's Jinja environment"""
+    if not app.config.get('TEMPLATE_BYTECODE_CACHE'):
+        return
+    directory = app.config.get('TEMPLATE_CACHE_DIR') or os.path.join(app.instance_path, 'jinja_cache')
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory, pattern='mediconnect-%s.cache')
+
+
+def buffered(chunks, size):
+    """Join small rendered fragments into chunks of at least ``size`` characters"""
+    parts, length = [], 0
+    for chunk in chunks:
+        parts.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(parts)
+            parts, length = [], 0
+    if parts:
+        yield ''.join(parts)
+
+
+def render_page(template_name, **context):
+    """Render a (large) page, streamed when STREAM_TEMPLATES is enabled"""
+    if not current_app.config.get('STREAM_TEMPLATES') or '_flashes' in session:
+        return render_template(template_name, **context)
+    chunks = stream_template(template_name, **context)
+    return Response(buffered(chunks, current_app.config.get('TEMPLATE_STREAM_BUFFER', 8192)), mimetype='text/html')
+
+
+@templates_cli.command('compile')
+def compile_templates():
+    """Compile every template into the bytecode cache."""
+    env = current_app.jinja_env
+    if env.bytecode_cache is None:
+        click.echo('TEMPLATE_BYTECODE_CACHE is off; only checking that the templates compile.')
+
+    failed = 0
+    names = env.list_templates()
+    for name in names:
+        try:
+            env.get_template(name)
+        except Exception as e:
+            failed += 1
+            click.echo(f'{name}: {e}', err=True)
+    click.echo(f'Compiled {len(names) - failed} of {len(names)} templates.')
+    if failed:
+        raise SystemExit(1)
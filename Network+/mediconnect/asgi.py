@@ -0,0 +1,9 @@
+"""
+ASGI entry point for MediConnect
+
+    uvicorn asgi:application --workers 2
+"""
+from app.asgi import AsyncApp
+from run import app
+
+application = AsyncApp(app)
@@ -0,0 +1,108 @@
+"""
+Cold-start benchmark.
+
+Starts the application in fresh Python processes, the way a gunicorn worker
+does, and measures for each run:
+
+- import: importing run.py (module imports plus create_app)
+- first_response: the first request served by the new app
+- total: wall time of the whole process, interpreter startup included
+
+Usage (from the mediconnect directory):
+
+    python benchmarks/cold_start.py --runs 10
+    python benchmarks/cold_start.py --env development --path /auth/login
+    python benchmarks/cold_start.py --max-ms 1500    # exit 1 on regression
+
+Each run uses a scratch SQLite database and cache file, so runs with a
+config that creates the schema at startup (development) include that work.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executed in the child process; prints its timings as JSON
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+from run import app
+imported = time.perf_counter()
+response = app.test_client().get(sys.argv[1])
+responded = time.perf_counter()
+print(json.dumps({
+    'import': (imported - start) * 1000,
+    'first_response': (responded - imported) * 1000,
+    'status': response.status_code,
+}))
+'''
+
+
+def run_once(env, path):
+    """Time one cold start in a new interpreter"""
+    with tempfile.TemporaryDirectory() as scratch:
+        environ = dict(
+            os.environ,
+            FLASK_ENV=env,
+            SECRET_KEY=os.environ.get('SECRET_KEY', 'cold-start-benchmark'),
+            DATABASE_URL='sqlite:///' + os.path.join(scratch, 'bench.db'),
+            CACHE_SQLITE_PATH=os.path.join(scratch, 'cache.sqlite'),
+        )
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', CHILD, path],
+            cwd=ROOT, env=environ, capture_output=True, text=True, check=True
+        ).stdout
+        total = (time.perf_counter() - start) * 1000
+    result = json.loads(output.strip().splitlines()[-1])
+    result['total'] = total
+    return result
+
+
+def summarize(runs):
+    return {
+        metric: {
+            'median_ms': round(statistics.median(run[metric] for run in runs), 1),
+            'max_ms': round(max(run[metric] for run in runs), 1),
+        }
+        for metric in ('import', 'first_response', 'total')
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='number of cold starts (default 5)')
+    parser.add_argument('--env', default='production', help='FLASK_ENV of the started app (default production)')
+    parser.add_argument('--path', default='/', help='URL of the first request (default /)')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--max-ms', type=float, help='fail when the median total exceeds this many milliseconds')
+    args = parser.parse_args()
+
+    # One warm-up run so the timed ones read .pyc files and a warm page cache
+    status = run_once(args.env, args.path)['status']
+    runs = [run_once(args.env, args.path) for _ in range(args.runs)]
+    summary = summarize(runs)
+
+    if args.json:
+        print(json.dumps({'env': args.env, 'path': args.path, 'runs': args.runs,
+                          'status': status, 'results': summary}, indent=2))
+    else:
+        print(f'{args.runs} cold starts, FLASK_ENV={args.env}, GET {args.path} -> {status}')
+        for metric, values in summary.items():
+            print(f'  {metric:<15} median {values["median_ms"]:8.1f} ms   max {values["max_ms"]:8.1f} ms')
+
+    if args.max_ms is not None and summary['total']['median_ms'] > args.max_ms:
+        print(f'Median cold start {summary["total"]["median_ms"]} ms exceeds {args.max_ms} ms', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
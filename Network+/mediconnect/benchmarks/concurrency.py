@@ -0,0 +1,368 @@
+"""
+Concurrent-connection benchmark: WSGI (gunicorn) against ASGI (uvicorn).
+
+Seeds a scratch database with the synthetic dataset of app/seed.py, then
+serves the app in each server setup and drives the read-heavy routes of the
+ASGI mode (job browsing, admin lists, dashboards) from many concurrent
+keep-alive connections, as logged-in doctors, hospitals and admins. Every
+connection requests the routes in turn. For each setup and number of
+connections it reports throughput, latency percentiles and errors.
+
+Server setups (--servers):
+
+- ``sync``: gunicorn sync workers, the current deployment (one request at a
+  time per worker)
+- ``gthread``: gunicorn with --threads per worker
+- ``asgi``: gunicorn with uvicorn workers serving asgi:application
+  (app/asgi.py)
+
+A local SQLite file answers in microseconds, which hides what the ASGI mode
+is for; --db-latency-ms adds a delay to every statement on the database
+connection (in the driver's thread, like a network round trip) to emulate a
+remote database. Pass --database-url to measure against a real one.
+
+Usage (from the mediconnect directory; needs gunicorn, uvicorn, aiosqlite):
+
+    python benchmarks/concurrency.py --connections 1,32,256 --duration 10
+    python benchmarks/concurrency.py --db-latency-ms 5 --servers sync,asgi
+
+Every run is saved as JSON in benchmarks/results/ (--output).
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(ROOT, 'benchmarks', 'results')
+
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from routes import git_commit, percentile  # noqa: E402
+
+# name: (role, path)
+ROUTES = {
+    'browse_jobs': ('doctor', '/doctor/browse-jobs'),
+    'browse_jobs_search': ('doctor', '/doctor/browse-jobs?' + urlencode({'search': 'cardiology', 'location': 'Boston'})),
+    'recommended_jobs': ('doctor', '/doctor/recommended-jobs'),
+    'admin_users': ('admin', '/admin/users'),
+    'admin_jobs': ('admin', '/admin/jobs'),
+    'admin_applications': ('admin', '/admin/applications'),
+    'admin_dashboard': ('admin', '/admin/dashboard'),
+    'hospital_dashboard': ('hospital', '/hospital/dashboard'),
+}
+
+
+class SlowCursor(sqlite3.Cursor):
+    """Cursor that waits BENCH_DB_LATENCY_MS before each statement.
+
+    The wait happens in the thread running the statement (aiosqlite's own
+    thread for the asyncio engine), like a network round trip.
+    """
+
+    latency = 0.0
+
+    def execute(self, *args):
+        time.sleep(self.latency)
+        return super().execute(*args)
+
+    def executemany(self, *args):
+        time.sleep(self.latency)
+        return super().executemany(*args)
+
+
+class SlowConnection(sqlite3.Connection):
+    def cursor(self, factory=SlowCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+
+def _emulate_latency():
+    """Delay every statement on the benchmark database by BENCH_DB_LATENCY_MS"""
+    latency = float(os.environ.get('BENCH_DB_LATENCY_MS') or 0) / 1000
+    database = os.environ.get('BENCH_DB_PATH')
+    if not latency or not database:
+        return
+    SlowCursor.latency = latency
+    connect = sqlite3.connect
+
+    def connect_with_latency(path, *args, **kwargs):
+        if os.fspath(path) == database:
+            kwargs.setdefault('factory', SlowConnection)
+        return connect(path, *args, **kwargs)
+
+    # SQLAlchemy's pysqlite dialect connects through sqlite3.dbapi2
+    sqlite3.connect = sqlite3.dbapi2.connect = connect_with_latency
+
+
+def wsgi_app():
+    """gunicorn factory: the app of run.py"""
+    _emulate_latency()
+    sys.path.insert(0, ROOT)
+    from run import app
+    return app
+
+
+def asgi_app():
+    """gunicorn factory: the application of asgi.py"""
+    _emulate_latency()
+    sys.path.insert(0, ROOT)
+    from asgi import application
+    return application
+
+
+def server_command(kind, port, workers, threads):
+    bind = f'127.0.0.1:{port}'
+    pythonpath = f'{os.path.join(ROOT, "benchmarks")},{ROOT}'
+    if kind == 'sync':
+        return [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', bind,
+                '--pythonpath', pythonpath, 'concurrency:wsgi_app()']
+    if kind == 'gthread':
+        return [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--threads', str(threads),
+                '--bind', bind, '--pythonpath', pythonpath, 'concurrency:wsgi_app()']
+    return [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--worker-class', 'uvicorn.workers.UvicornWorker',
+            '--bind', bind, '--pythonpath', pythonpath, 'concurrency:asgi_app()']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(process, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with status {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'server did not listen on port {port} within {timeout} s')
+
+
+async def read_response(reader):
+    """Status and headers of one HTTP/1.1 response; the body is read and dropped"""
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    status = int(head[0].split(' ', 2)[1])
+    headers = {}
+    for line in head[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip().lower()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.read()
+        headers['connection'] = 'close'
+    return status, headers
+
+
+async def login(port, username, password):
+    """Session cookie of a logged-in user"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = urlencode({'username': username, 'password': password})
+    writer.write((f'POST /auth/login HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n'
+                  f'Content-Type: application/x-www-form-urlencoded\r\nContent-Length: {len(body)}\r\n\r\n{body}').encode())
+    head = (await reader.read()).split(b'\r\n\r\n', 1)[0].decode('latin-1')
+    writer.close()
+    for line in head.split('\r\n'):
+        if line.lower().startswith('set-cookie: session='):
+            return line.split(':', 1)[1].strip().split(';', 1)[0]
+    raise RuntimeError(f'login as {username} failed: {head.splitlines()[0]}')
+
+
+async def drive(port, requests, connections, duration, timeout):
+    """Keep ``connections`` connections busy for ``duration`` seconds"""
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+
+    async def connection(offset):
+        reader = writer = None
+        index = offset
+        while time.perf_counter() < deadline:
+            request = requests[index % len(requests)]
+            index += 1
+            start = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(request)
+                status, headers = await asyncio.wait_for(read_response(reader), timeout)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                errors.append(type(e).__name__)
+                if writer is not None:
+                    writer.close()
+                reader = writer = None
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status >= 400:
+                errors.append(status)
+            if headers.get('connection') == 'close':
+                writer.close()
+                reader = writer = None
+        if writer is not None:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(connection(offset) for offset in range(connections)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def measure(port, scenario, names, connections, duration, warmup, timeout):
+    cookies = {role: await login(port, username, scenario['password']) for role, username in scenario['users'].items()}
+    requests = [
+        f'GET {ROUTES[name][1]} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookies[ROUTES[name][0]]}\r\n\r\n'.encode()
+        for name in names
+    ]
+    if warmup:
+        await drive(port, requests, connections, warmup, timeout)
+    latencies, errors, wall = await drive(port, requests, connections, duration, timeout)
+    return {
+        'connections': connections,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput_rps': round(len(latencies) / wall, 1) if wall else 0,
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(max(latencies), 2) if latencies else 0,
+    }
+
+
+def print_table(run):
+    print(f'{run["workers"]} worker(s), {run["threads"]} threads (gthread/asgi), db latency {run["db_latency_ms"]} ms, '
+          f'commit {run["commit"]}, dataset {run["dataset"]}')
+    print(f'{"server":<8} {"conns":>6} {"req":>7} {"err":>5} {"rps":>8} {"p50":>9} {"p95":>9} {"p99":>9}')
+    for server, results in run['servers'].items():
+        for result in results:
+            print(f'{server:<8} {result["connections"]:>6} {result["requests"]:>7} {result["errors"]:>5} '
+                  f'{result["throughput_rps"]:>8} {result["p50_ms"]:>9} {result["p95_ms"]:>9} {result["p99_ms"]:>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--servers', default='sync,gthread,asgi', help='comma-separated server setups')
+    parser.add_argument('--workers', type=int, default=2, help='worker processes per server')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gthread worker (ASGI_THREADS for asgi)')
+    parser.add_argument('--connections', default='1,32,256', help='comma-separated concurrent connection counts')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds measured per server and connection count')
+    parser.add_argument('--warmup', type=float, default=1.0, help='untimed seconds before each measurement')
+    parser.add_argument('--timeout', type=float, default=30.0, help='seconds before a request counts as failed')
+    parser.add_argument('--routes', help=f'comma-separated routes to cycle through (default: all of {", ".join(ROUTES)})')
+    parser.add_argument('--db-latency-ms', type=float, default=0.0, help='delay added to every SQLite statement')
+    parser.add_argument('--env', default='development', help='FLASK_ENV of the app (default development)')
+    parser.add_argument('--database-url', help='database to seed and use (default: a scratch SQLite file)')
+    parser.add_argument('--hospitals', type=int, default=20)
+    parser.add_argument('--jobs-per-hospital', type=int, default=25)
+    parser.add_argument('--doctors', type=int, default=500)
+    parser.add_argument('--applications-per-doctor', type=int, default=8)
+    parser.add_argument('--output', default=RESULTS, help='directory for the results (default benchmarks/results)')
+    args = parser.parse_args()
+
+    servers = args.servers.split(',')
+    unknown = [server for server in servers if server not in ('sync', 'gthread', 'asgi')]
+    if unknown:
+        parser.error(f'unknown server(s): {", ".join(unknown)}')
+    names = args.routes.split(',') if args.routes else list(ROUTES)
+    unknown = [name for name in names if name not in ROUTES]
+    if unknown:
+        parser.error(f'unknown route(s): {", ".join(unknown)}; available: {", ".join(ROUTES)}')
+    levels = [int(level) for level in args.connections.split(',')]
+
+    # The configuration is read from the environment when config.py is
+    # imported; the servers inherit it
+    scratch = tempfile.mkdtemp(prefix='mediconnect-bench-')
+    database = os.path.join(scratch, 'bench.db')
+    os.environ.update(
+        FLASK_ENV=args.env,
+        DATABASE_URL=args.database_url or 'sqlite:///' + database,
+        CACHE_SQLITE_PATH=os.path.join(scratch, 'cache.sqlite'),
+        SESSION_SQLITE_PATH=os.path.join(scratch, 'sessions.sqlite'),
+        TEMPLATE_CACHE_DIR=os.path.join(scratch, 'jinja_cache'),
+        ASGI_THREADS=str(args.threads),
+        SCHEMA_AUTO_CREATE='1',
+        SERVER_TIMING='0',
+        LOG_REQUEST_TIMING='0',
+        SLOW_QUERY_MS='0',
+        N_PLUS_ONE_THRESHOLD='0',
+        BENCH_DB_LATENCY_MS=str(args.db_latency_ms),
+        BENCH_DB_PATH='' if args.database_url else database,
+    )
+    os.environ.setdefault('SECRET_KEY', 'concurrency-benchmark')
+    if args.db_latency_ms and args.database_url:
+        print('--db-latency-ms only applies to the scratch SQLite database; ignored')
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    from app.models import db, Hospital, User
+    from app.seed import SEED_PASSWORD, seed_dataset
+
+    app = create_app(args.env)
+    with app.app_context():
+        start = time.perf_counter()
+        dataset = seed_dataset(hospitals=args.hospitals, jobs_per_hospital=args.jobs_per_hospital,
+                               doctors=args.doctors, applications_per_doctor=args.applications_per_doctor)
+        print(f'Seeded {dataset} in {time.perf_counter() - start:.1f} s')
+        hospital_user = db.session.execute(
+            db.select(User.username).join(Hospital, Hospital.user_id == User.id).order_by(User.id).limit(1)
+        ).scalar_one()
+        db.session.remove()
+    scenario = {'password': SEED_PASSWORD, 'users': {'doctor': 'doctor0', 'hospital': hospital_user, 'admin': 'admin0'}}
+
+    results = {}
+    for server in servers:
+        port = free_port()
+        process = subprocess.Popen(server_command(server, port, args.workers, args.threads), cwd=ROOT)
+        try:
+            wait_for_port(process, port)
+            results[server] = []
+            for connections in levels:
+                result = asyncio.run(measure(port, scenario, names, connections, args.duration, args.warmup,
+                                             args.timeout))
+                print(f'{server} x {connections}: {result["throughput_rps"]} req/s, p95 {result["p95_ms"]} ms, '
+                      f'{result["errors"]} error(s)')
+                results[server].append(result)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    run = {
+        'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'env': args.env,
+        'workers': args.workers,
+        'threads': args.threads,
+        'db_latency_ms': args.db_latency_ms,
+        'routes': names,
+        'dataset': dataset,
+        'servers': results,
+    }
+    print_table(run)
+
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f'{run["timestamp"].replace(":", "")}-concurrency.json')
+    with open(path, 'w') as f:
+        json.dump(run, f, indent=2)
+    print(f'Saved {path}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
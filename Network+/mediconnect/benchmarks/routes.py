@@ -0,0 +1,346 @@
+"""
+Route benchmark.
+
+Seeds a scratch database with the synthetic dataset of app/seed.py (skewed
+so that a few jobs get most applications), then drives the hot routes as
+logged-in doctors, hospitals and admins and reports, per route, latency
+percentiles, SQL statements per request (from the app's request
+instrumentation, which also counts streamed pages) and throughput.
+
+Two drivers are available:
+
+- ``client`` (default): the Flask test client, one per thread
+- ``http``: real HTTP requests against the app served by a local threaded
+  server, one connection per request
+
+Usage (from the mediconnect directory):
+
+    python benchmarks/routes.py --requests 200 --concurrency 4
+    python benchmarks/routes.py --driver http --doctors 2000 --routes browse_jobs,applicants
+    python benchmarks/routes.py --compare latest --fail-on-regression
+
+Every run is saved as JSON in benchmarks/results/ (--output). --compare
+compares the run with a saved one (a path, or ``latest`` for the newest
+run with the same driver) and lists routes whose p50/p95 latency grew by
+more than --tolerance percent or whose queries per request grew.
+"""
+import argparse
+import glob
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def recorded(app):
+    """(requests, SQL statements) recorded by the instrumentation so far"""
+    metrics = app.extensions['instrumentation']
+    with metrics._lock:
+        return sum(metrics.duration_count.values()), sum(metrics.statements.values())
+
+
+class Scenario:
+    """The routes to drive and the users to drive them as"""
+
+    def __init__(self, app):
+        from app.models import db, Job, JobApplication, Hospital, User
+        from app.seed import SEED_PASSWORD
+
+        with app.app_context():
+            popular_job_id, hospital_user = db.session.query(Job.id, User.username).join(
+                JobApplication, JobApplication.job_id == Job.id
+            ).join(Hospital, Job.hospital_id == Hospital.id).join(User, Hospital.user_id == User.id).group_by(
+                Job.id, User.username
+            ).order_by(db.func.count(JobApplication.id).desc()).first()
+
+        self.password = SEED_PASSWORD
+        self.users = {'doctor': 'doctor0', 'hospital': hospital_user, 'admin': 'admin0'}
+        # name: (role, method, path, form)
+        self.routes = {
+            'browse_jobs': ('doctor', 'GET', '/doctor/browse-jobs', None),
+            'browse_jobs_search': ('doctor', 'GET', '/doctor/browse-jobs?' + urlencode(
+                {'search': 'cardiology consultant', 'location': 'Boston'}), None),
+            'browse_jobs_specialization': ('doctor', 'GET', '/doctor/browse-jobs?specialization=Neurology&page=2', None),
+            'my_applications': ('doctor', 'GET', '/doctor/my-applications', None),
+            'applicants': ('hospital', 'GET', f'/hospital/job/{popular_job_id}/applicants', None),
+            'admin_dashboard': ('admin', 'GET', '/admin/dashboard', None),
+            'admin_reports': ('admin', 'GET', '/admin/reports', None),
+            'login': (None, 'POST', '/auth/login', {'username': 'doctor1', 'password': SEED_PASSWORD}),
+        }
+
+
+class ClientDriver:
+    """Requests through the Flask test client"""
+
+    def __init__(self, app, scenario):
+        self.app = app
+        self.scenario = scenario
+
+    def session(self, role):
+        client = self.app.test_client()
+        if role:
+            self.request(client, 'POST', '/auth/login',
+                         {'username': self.scenario.users[role], 'password': self.scenario.password})
+        return client
+
+    def request(self, client, method, path, form):
+        response = client.open(path, method=method, data=form)
+        response.close()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class HTTPDriver:
+    """Requests over HTTP to a local threaded server"""
+
+    def __init__(self, app, scenario):
+        from werkzeug.serving import make_server
+
+        self.scenario = scenario
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def session(self, role):
+        client = {'cookie': None}
+        if role:
+            self.request(client, 'POST', '/auth/login',
+                         {'username': self.scenario.users[role], 'password': self.scenario.password})
+        return client
+
+    def request(self, client, method, path, form):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        headers = {}
+        body = None
+        if client['cookie']:
+            headers['Cookie'] = client['cookie']
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            cookie = response.getheader('Set-Cookie')
+            if cookie and cookie.startswith('session='):
+                client['cookie'] = cookie.split(';', 1)[0]
+            return response.status
+        finally:
+            connection.close()
+
+    def close(self):
+        self.server.shutdown()
+
+
+def run_route(app, driver, route, requests, concurrency, warmup):
+    """Drive one route and summarize latencies, statuses and query counts"""
+    role, method, path, form = route
+    latencies, errors = [], []
+    lock = threading.Lock()
+    remaining = [requests]
+    # Only the timed requests run between the two snapshots of the totals
+    before = []
+    warmed_up = threading.Barrier(concurrency, action=lambda: before.extend(recorded(app)))
+
+    def worker():
+        client = driver.session(role)
+        for _ in range(warmup):
+            driver.request(client if role else driver.session(None), method, path, form)
+        warmed_up.wait()
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            # Anonymous routes (login) start from a fresh session every time
+            current = client if role else driver.session(None)
+            start = time.perf_counter()
+            status = driver.request(current, method, path, form)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed * 1000)
+                if status >= 400:
+                    errors.append(status)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    # A streamed response is recorded when the server closes it, which can
+    # be just after the client has read it
+    deadline = time.monotonic() + 5
+    while recorded(app)[0] - before[0] < len(latencies) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    count, statements = recorded(app)
+    count -= before[0]
+
+    return {
+        'method': method,
+        'path': path,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput_rps': round(len(latencies) / wall, 1) if wall else 0,
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p90_ms': round(percentile(latencies, 0.90), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(max(latencies), 2) if latencies else 0,
+        'mean_ms': round(statistics.fmean(latencies), 2) if latencies else 0,
+        'queries_per_request': round((statements - before[1]) / count, 2) if count else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(run, baseline, tolerance):
+    """Routes of a run that regressed against a baseline run"""
+    regressions = []
+    for name, result in run['routes'].items():
+        before = baseline['routes'].get(name)
+        if not before:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            if before[metric] and result[metric] > before[metric] * (1 + tolerance / 100):
+                regressions.append(f'{name}: {metric} {before[metric]} -> {result[metric]}')
+        if (before['queries_per_request'] is not None and result['queries_per_request'] is not None
+                and result['queries_per_request'] > before['queries_per_request']):
+            regressions.append(f'{name}: queries/request {before["queries_per_request"]} -> '
+                               f'{result["queries_per_request"]}')
+    return regressions
+
+
+def print_table(run):
+    print(f'{run["driver"]} driver, concurrency {run["concurrency"]}, commit {run["commit"]}, dataset {run["dataset"]}')
+    print(f'{"route":<28} {"req":>5} {"err":>4} {"rps":>8} {"p50":>8} {"p90":>8} {"p95":>8} {"p99":>8} {"queries":>8}')
+    for name, result in run['routes'].items():
+        queries = '-' if result['queries_per_request'] is None else result['queries_per_request']
+        print(f'{name:<28} {result["requests"]:>5} {result["errors"]:>4} {result["throughput_rps"]:>8} '
+              f'{result["p50_ms"]:>8} {result["p90_ms"]:>8} {result["p95_ms"]:>8} {result["p99_ms"]:>8} {queries:>8}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--driver', choices=('client', 'http'), default='client')
+    parser.add_argument('--env', default='development', help='FLASK_ENV of the app (default development)')
+    parser.add_argument('--database-url', help='database to seed and use (default: a scratch SQLite file)')
+    parser.add_argument('--hospitals', type=int, default=20)
+    parser.add_argument('--jobs-per-hospital', type=int, default=25)
+    parser.add_argument('--doctors', type=int, default=500)
+    parser.add_argument('--applications-per-doctor', type=int, default=8)
+    parser.add_argument('--routes', help='comma-separated route names (default: all)')
+    parser.add_argument('--requests', type=int, default=100, help='timed requests per route')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=2, help='untimed requests per thread and route')
+    parser.add_argument('--output', default=RESULTS, help='directory for the results (default benchmarks/results)')
+    parser.add_argument('--compare', help='results file to compare with, or "latest"')
+    parser.add_argument('--tolerance', type=float, default=20.0, help='allowed latency increase in percent')
+    parser.add_argument('--fail-on-regression', action='store_true', help='exit 1 if --compare finds regressions')
+    args = parser.parse_args()
+
+    # The configuration is read from the environment when config.py is imported
+    scratch = tempfile.mkdtemp(prefix='mediconnect-bench-')
+    os.environ.update(
+        FLASK_ENV=args.env,
+        DATABASE_URL=args.database_url or 'sqlite:///' + os.path.join(scratch, 'bench.db'),
+        CACHE_SQLITE_PATH=os.path.join(scratch, 'cache.sqlite'),
+        SCHEMA_AUTO_CREATE='1',
+        LOG_REQUEST_TIMING='0',
+        SLOW_QUERY_MS='0',
+        N_PLUS_ONE_THRESHOLD='0',
+    )
+    os.environ.setdefault('SECRET_KEY', 'route-benchmark')
+    sys.path.insert(0, ROOT)
+    from app import create_app
+    from app.models import db
+    from app.seed import seed_dataset
+
+    app = create_app(args.env)
+    app.config['SESSION_COOKIE_SECURE'] = False
+    with app.app_context():
+        start = time.perf_counter()
+        dataset = seed_dataset(hospitals=args.hospitals, jobs_per_hospital=args.jobs_per_hospital,
+                               doctors=args.doctors, applications_per_doctor=args.applications_per_doctor)
+        print(f'Seeded {dataset} in {time.perf_counter() - start:.1f} s')
+        db.session.remove()
+
+    scenario = Scenario(app)
+    names = args.routes.split(',') if args.routes else list(scenario.routes)
+    unknown = [name for name in names if name not in scenario.routes]
+    if unknown:
+        parser.error(f'unknown route(s): {", ".join(unknown)}; available: {", ".join(scenario.routes)}')
+
+    driver = (HTTPDriver if args.driver == 'http' else ClientDriver)(app, scenario)
+    try:
+        routes = {name: run_route(app, driver, scenario.routes[name], args.requests, args.concurrency, args.warmup)
+                  for name in names}
+    finally:
+        driver.close()
+
+    run = {
+        'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'driver': args.driver,
+        'env': args.env,
+        'concurrency': args.concurrency,
+        'dataset': dataset,
+        'routes': routes,
+    }
+    print_table(run)
+
+    os.makedirs(args.output, exist_ok=True)
+    previous = sorted(glob.glob(os.path.join(args.output, f'*-{args.driver}.json')))
+    path = os.path.join(args.output, f'{run["timestamp"].replace(":", "")}-{args.driver}.json')
+    with open(path, 'w') as f:
+        json.dump(run, f, indent=2)
+    print(f'Saved {path}')
+
+    if args.compare:
+        baseline_path = previous[-1] if args.compare == 'latest' and previous else args.compare
+        if baseline_path == 'latest':
+            print('No earlier results to compare with')
+            return 0
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare(run, baseline, args.tolerance)
+        print(f'Compared with {baseline_path} (commit {baseline.get("commit")}): '
+              f'{len(regressions) or "no"} regression(s)')
+        for regression in regressions:
+            print(f'  {regression}')
+        if regressions and args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
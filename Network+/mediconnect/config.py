@@ -6,18 +6,122 @@ class Config:
     """Base configuration"""
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Create missing tables with db.create_all() when the app starts
+    SCHEMA_AUTO_CREATE = os.environ.get('SCHEMA_AUTO_CREATE', '1') == '1'
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
 
+    # List pagination: 'page' (page numbers) or 'keyset' (opaque cursors)
+    PAGINATION_MODE = os.environ.get('PAGINATION_MODE', 'page')
+    PAGINATION_APPROX_TOTAL = False
+
+    # Job search backend; defaults to the one matching the database dialect
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND')
+
+    # Seconds to cache dashboard statistics (0 disables)
+    DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', 0))
+
+    # Serve dashboards and reports from the incrementally maintained
+    # stat_counters table instead of aggregating on every request
+    STATS_COUNTERS = os.environ.get('STATS_COUNTERS', '1') != '0'
+
+    # Server-side cache (app/cache.py): 'null', 'lru', 'sqlite' or 'redis'
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'lru')
+    CACHE_DEFAULT_TIMEOUT = int(os.environ.get('CACHE_DEFAULT_TIMEOUT', 300))
+    CACHE_KEY_PREFIX = 'mediconnect:'
+    CACHE_LRU_ENTRIES = 1024
+    CACHE_SQLITE_PATH = os.environ.get('CACHE_SQLITE_PATH')  # defaults to instance/cache.sqlite
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+
+    # HTTP caching: seconds a proxy may serve anonymous pages, and a value
+    # mixed into ETags so a deploy with changed templates invalidates them
+    HTTP_CACHE_MAX_AGE = int(os.environ.get('HTTP_CACHE_MAX_AGE', 60))
+    ETAG_SALT = os.environ.get('ETAG_SALT') or os.environ.get('RENDER_GIT_COMMIT', '')
+
+    # PostgreSQL engine profile (app/pool.py); pool sizes are per worker
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))  # seconds to wait for a connection
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', -1))  # seconds, -1 keeps connections
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '0') == '1'
+    DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 0))  # milliseconds, 0 disables
+    DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', '0') == '1'
+
+    # Read replicas for read-only requests (app/replicas.py): comma-separated
+    # URLs, and how long a user reads from the primary after writing
+    SQLALCHEMY_REPLICA_URLS = [url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+    DB_REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
+
+    # Password hashing (app/passwords.py). Hashes made with another method
+    # are upgraded on login. Workers/pending are per gunicorn worker.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread')  # 'thread' or 'process'
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))  # 0 hashes inline
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 16))
+
+    # Failed logins allowed per username / client address within the window
+    LOGIN_MAX_ATTEMPTS = int(os.environ.get('LOGIN_MAX_ATTEMPTS', 5))
+    LOGIN_MAX_ATTEMPTS_PER_IP = int(os.environ.get('LOGIN_MAX_ATTEMPTS_PER_IP', 50))
+    LOGIN_ATTEMPT_WINDOW = int(os.environ.get('LOGIN_ATTEMPT_WINDOW', 900))  # seconds
+    LOGIN_THROTTLE_STORE = os.environ.get('LOGIN_THROTTLE_STORE', 'database')  # or 'redis' (CACHE_REDIS_URL)
+
+    # Background tasks (app/tasks.py), run by `flask worker`
+    TASK_POLL_INTERVAL = float(os.environ.get('TASK_POLL_INTERVAL', 1.0))  # seconds between polls when idle
+    TASK_LEASE_SECONDS = int(os.environ.get('TASK_LEASE_SECONDS', 300))  # reclaim tasks of dead workers after
+    TASK_MAX_ATTEMPTS = int(os.environ.get('TASK_MAX_ATTEMPTS', 5))
+    TASK_RETRY_BACKOFF = int(os.environ.get('TASK_RETRY_BACKOFF', 30))  # seconds, doubled per retry
+    TASK_RETRY_BACKOFF_MAX = int(os.environ.get('TASK_RETRY_BACKOFF_MAX', 3600))
+
+    # Instrumentation (app/instrumentation.py)
+    SERVER_TIMING = os.environ.get('SERVER_TIMING', '1') == '1'  # send a Server-Timing header
+    SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', 250))  # log slower statements, 0 disables
+    N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 10))  # same statement per request, 0 disables
+    LOG_REQUEST_TIMING = os.environ.get('LOG_REQUEST_TIMING', '0') == '1'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # bearer token for scraping /admin/metrics
+
+    # Sessions (app/sessions.py): 'sqlite', 'redis', 'memory' or 'cookie'
+    SESSION_TYPE = os.environ.get('SESSION_TYPE', 'sqlite')
+    SESSION_SQLITE_PATH = os.environ.get('SESSION_SQLITE_PATH')  # defaults to instance/sessions.sqlite
+    SESSION_SQLITE_ENTRIES = int(os.environ.get('SESSION_SQLITE_ENTRIES', 100000))
+    SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL')  # defaults to CACHE_REDIS_URL
+    SESSION_LRU_ENTRIES = int(os.environ.get('SESSION_LRU_ENTRIES', 1024))
+    SESSION_LRU_TTL = int(os.environ.get('SESSION_LRU_TTL', 5))  # seconds, 0 disables the in-process LRU
+
+    # Recommended jobs (app/recommendations.py)
+    RECOMMENDATIONS_PER_DOCTOR = int(os.environ.get('RECOMMENDATIONS_PER_DOCTOR', 20))
+    RECOMMENDATION_MIN_SCORE = float(os.environ.get('RECOMMENDATION_MIN_SCORE', 0.5))  # 0 to 1
+    RECOMMENDATION_BATCH_SIZE = int(os.environ.get('RECOMMENDATION_BATCH_SIZE', 500))  # doctors scored at once
+    RECOMMENDATION_JOB_CHUNK = int(os.environ.get('RECOMMENDATION_JOB_CHUNK', 2048))  # jobs per doctor batch
+
+    # Templates (app/templating.py): compiled bytecode is cached on disk and
+    # filled at deploy time by `flask templates compile`
+    TEMPLATE_BYTECODE_CACHE = os.environ.get('TEMPLATE_BYTECODE_CACHE', '1') == '1'
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR')  # defaults to instance/jinja_cache
+    STREAM_TEMPLATES = os.environ.get('STREAM_TEMPLATES', '1') == '1'  # stream the large list pages
+    TEMPLATE_STREAM_BUFFER = int(os.environ.get('TEMPLATE_STREAM_BUFFER', 8192))  # characters per chunk
+
+    # Archival (app/archive.py): closed jobs move to the archive tables this
+    # long after they were closed; deactivated users are purged in batches
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 180))
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 100))  # jobs, or rows when purging
+
+    # ASGI mode (app/asgi.py, served by `uvicorn asgi:application`)
+    ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL')  # defaults to DATABASE_URL with aiosqlite/asyncpg
+    ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 8))  # threads per worker for the non-async routes
+
 
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
     TESTING = False
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///mediconnect.db'
-    SQLALCHEMY_ECHO = True
+    # Echoing every statement drowns the log; per-request timing and query
+    # counts are logged instead (set SQLALCHEMY_ECHO=1 to see the SQL)
+    SQLALCHEMY_ECHO = os.environ.get('SQLALCHEMY_ECHO', '0') == '1'
+    LOG_REQUEST_TIMING = os.environ.get('LOG_REQUEST_TIMING', '1') == '1'
+    SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', 100))
 
 
 class ProductionConfig(Config):
@@ -26,6 +130,23 @@ class ProductionConfig(Config):
     TESTING = False
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'postgresql://localhost/mediconnect'
     SESSION_COOKIE_SECURE = True
+    # The schema is managed by migrations (flask db upgrade)
+    SCHEMA_AUTO_CREATE = os.environ.get('SCHEMA_AUTO_CREATE', '0') == '1'
+    DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', 15))
+    # The web and worker services must share the cache for invalidations to
+    # reach all of them, and sessions must outlive a deploy: a file on the
+    # host's disk does neither, so without Redis there is no server-side
+    # cache and sessions are signed cookies
+    CACHE_TYPE = os.environ.get('CACHE_TYPE', 'redis' if os.environ.get('CACHE_REDIS_URL') else 'null')
+    SESSION_TYPE = os.environ.get(
+        'SESSION_TYPE', 'redis' if os.environ.get('SESSION_REDIS_URL') or os.environ.get('CACHE_REDIS_URL') else 'cookie'
+    )
+    # Fail fast instead of queueing behind an exhausted pool, drop connections
+    # before the server or a load balancer times them out, and bound queries
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+    DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000))
 
 
 class TestingConfig(Config):
@@ -34,3 +155,17 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    CACHE_TYPE = 'null'
+    SESSION_TYPE = 'memory'
+    # Cheap hashes keep tests fast
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    PASSWORD_HASH_WORKERS = 0
+    TEMPLATE_BYTECODE_CACHE = False
+
+
+config = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+    'default': DevelopmentConfig
+}
@@ -0,0 +1,34 @@
+"""login attempts
+
+Revision ID: 1e46fb158478
+Revises: 1efafb6767d4
+Create Date: 2026-10-18 04:39:11.590554
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1e46fb158478'
+down_revision = '1efafb6767d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('login_attempts',
+    sa.Column('key', sa.String(length=80), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('window_start', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    with op.batch_alter_table('login_attempts', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_login_attempts_window_start'), ['window_start'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('login_attempts', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_login_attempts_window_start'))
+
+    op.drop_table('login_attempts')
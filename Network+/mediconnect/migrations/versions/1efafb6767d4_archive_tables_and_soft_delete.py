@@ -0,0 +1,72 @@
+"""archive tables and soft delete
+
+Revision ID: 1efafb6767d4
+Revises: 2480c8414650
+Create Date: 2026-10-18 04:15:29.502690
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1efafb6767d4'
+down_revision = '2480c8414650'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('archived_job_applications',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('job_id', sa.Integer(), nullable=False),
+    sa.Column('doctor_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('cover_letter', sa.Text(), nullable=True),
+    sa.Column('match_score', sa.Float(), server_default='0', nullable=False),
+    sa.Column('applied_at', sa.DateTime(), nullable=True),
+    sa.Column('reviewed_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('archived_job_applications', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_archived_job_applications_doctor_id'), ['doctor_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_archived_job_applications_job_id'), ['job_id'], unique=False)
+
+    op.create_table('archived_jobs',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('hospital_id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=200), nullable=False),
+    sa.Column('specialization', sa.String(length=120), nullable=False),
+    sa.Column('description', sa.Text(), nullable=False),
+    sa.Column('location', sa.String(length=200), nullable=True),
+    sa.Column('salary_min', sa.Float(), nullable=True),
+    sa.Column('salary_max', sa.Float(), nullable=True),
+    sa.Column('experience_required', sa.Integer(), nullable=True),
+    sa.Column('job_type', sa.String(length=50), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('archived_jobs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_archived_jobs_hospital_id'), ['hospital_id'], unique=False)
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('deleted_at')
+
+    with op.batch_alter_table('archived_jobs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_archived_jobs_hospital_id'))
+
+    op.drop_table('archived_jobs')
+    with op.batch_alter_table('archived_job_applications', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_archived_job_applications_job_id'))
+        batch_op.drop_index(batch_op.f('ix_archived_job_applications_doctor_id'))
+
+    op.drop_table('archived_job_applications')
@@ -0,0 +1,31 @@
+"""application match score
+
+Revision ID: 2480c8414650
+Revises: e5b93d7efdce
+Create Date: 2026-10-18 03:47:03.017940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2480c8414650'
+down_revision = 'e5b93d7efdce'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('job_applications', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('match_score', sa.Float(), server_default='0', nullable=False))
+        batch_op.create_index('ix_job_applications_job_id_match_score_id', ['job_id', 'match_score', 'id'], unique=False)
+        batch_op.create_index('ix_job_applications_job_id_status_match_score_id', ['job_id', 'status', 'match_score', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('job_applications', schema=None) as batch_op:
+        batch_op.drop_index('ix_job_applications_job_id_status_match_score_id')
+        batch_op.drop_index('ix_job_applications_job_id_match_score_id')
+        batch_op.drop_column('match_score')
+
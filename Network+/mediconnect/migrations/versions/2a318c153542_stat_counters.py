@@ -0,0 +1,55 @@
+"""stat counters
+
+Revision ID: 2a318c153542
+Revises: 70d9595c92e2
+Create Date: 2026-10-18 05:12:41.208533
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2a318c153542'
+down_revision = '70d9595c92e2'
+branch_labels = None
+depends_on = None
+
+
+# Initial counter values, matching the keys maintained by app/stats.py
+POPULATE = [
+    "SELECT 'global', 0, 'users.total', COUNT(*) FROM users",
+    "SELECT 'global', 0, 'users.role.' || role, COUNT(*) FROM users GROUP BY role",
+    """SELECT 'global', 0, CASE WHEN is_verified THEN 'users.verified.true' ELSE 'users.verified.false' END, COUNT(*)
+       FROM users GROUP BY CASE WHEN is_verified THEN 'users.verified.true' ELSE 'users.verified.false' END""",
+    "SELECT 'global', 0, 'jobs.total', COUNT(*) FROM jobs",
+    "SELECT 'global', 0, 'jobs.status.' || status, COUNT(*) FROM jobs GROUP BY status",
+    "SELECT 'global', 0, 'jobs.specialization.' || specialization, COUNT(*) FROM jobs GROUP BY specialization",
+    "SELECT 'hospital', hospital_id, 'jobs.total', COUNT(*) FROM jobs GROUP BY hospital_id",
+    "SELECT 'hospital', hospital_id, 'jobs.status.' || status, COUNT(*) FROM jobs GROUP BY hospital_id, status",
+    "SELECT 'global', 0, 'applications.total', COUNT(*) FROM job_applications",
+    "SELECT 'global', 0, 'applications.status.' || status, COUNT(*) FROM job_applications GROUP BY status",
+    """SELECT 'hospital', jobs.hospital_id, 'applications.total', COUNT(*)
+       FROM job_applications JOIN jobs ON jobs.id = job_applications.job_id GROUP BY jobs.hospital_id""",
+    """SELECT 'hospital', jobs.hospital_id, 'applications.status.' || job_applications.status, COUNT(*)
+       FROM job_applications JOIN jobs ON jobs.id = job_applications.job_id
+       GROUP BY jobs.hospital_id, job_applications.status""",
+]
+
+
+def upgrade():
+    op.create_table('stat_counters',
+    sa.Column('scope', sa.String(length=20), nullable=False),
+    sa.Column('scope_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=200), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('scope', 'scope_id', 'name')
+    )
+
+    for select in POPULATE:
+        op.execute(f'INSERT INTO stat_counters (scope, scope_id, name, value) {select}')
+    op.execute('DELETE FROM stat_counters WHERE value = 0')
+
+
+def downgrade():
+    op.drop_table('stat_counters')
@@ -0,0 +1,54 @@
+"""route indexes
+
+Revision ID: 70d9595c92e2
+Revises: c201f88ac05c
+Create Date: 2026-10-18 03:03:33.617151
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '70d9595c92e2'
+down_revision = 'c201f88ac05c'
+branch_labels = None
+depends_on = None
+
+
+# (table, index name, columns, partial index condition)
+INDEXES = [
+    ('users', 'ix_users_created_at_id', ['created_at', 'id'], None),
+    ('users', 'ix_users_role_created_at_id', ['role', 'created_at', 'id'], None),
+    ('jobs', 'ix_jobs_created_at_id', ['created_at', 'id'], None),
+    ('jobs', 'ix_jobs_status_created_at_id', ['status', 'created_at', 'id'], None),
+    ('jobs', 'ix_jobs_active_created_at_id', ['created_at', 'id'], "status = 'active'"),
+    ('jobs', 'ix_jobs_hospital_id_created_at_id', ['hospital_id', 'created_at', 'id'], None),
+    ('jobs', 'ix_jobs_hospital_id_status', ['hospital_id', 'status'], None),
+    ('job_applications', 'ix_job_applications_applied_at_id', ['applied_at', 'id'], None),
+    ('job_applications', 'ix_job_applications_status_applied_at_id', ['status', 'applied_at', 'id'], None),
+    ('job_applications', 'ix_job_applications_job_id_applied_at_id', ['job_id', 'applied_at', 'id'], None),
+    ('job_applications', 'ix_job_applications_doctor_id_applied_at_id', ['doctor_id', 'applied_at', 'id'], None),
+    ('job_applications', 'ix_job_applications_pending_job_id', ['job_id'], "status = 'pending'"),
+]
+
+
+def upgrade():
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+
+    # On PostgreSQL build the indexes without locking writes to the tables;
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    with op.get_context().autocommit_block():
+        for table, name, columns, where in INDEXES:
+            op.create_index(
+                name, table, columns,
+                postgresql_where=sa.text(where) if where else None,
+                sqlite_where=sa.text(where) if where else None,
+                postgresql_concurrently=postgresql,
+                if_not_exists=True
+            )
+
+
+def downgrade():
+    for table, name, columns, where in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,26 @@
+"""application status version
+
+Revision ID: 9404614454ee
+Revises: 1e46fb158478
+Create Date: 2026-10-18 04:42:11.992471
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9404614454ee'
+down_revision = '1e46fb158478'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('job_applications', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('status_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('job_applications', schema=None) as batch_op:
+        batch_op.drop_column('status_version')
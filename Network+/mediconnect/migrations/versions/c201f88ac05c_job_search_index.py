@@ -0,0 +1,73 @@
+"""job search index
+
+Revision ID: c201f88ac05c
+Revises: 830849cfce71
+Create Date: 2026-10-18 03:01:49.109435
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c201f88ac05c'
+down_revision = '830849cfce71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        op.execute("""
+            ALTER TABLE jobs ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+                setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(specialization, '')), 'B') ||
+                setweight(to_tsvector('english', coalesce(location, '')), 'C') ||
+                setweight(to_tsvector('english', coalesce(description, '')), 'D')
+            ) STORED
+        """)
+        op.execute('CREATE INDEX ix_jobs_search_vector ON jobs USING GIN (search_vector)')
+
+    elif dialect == 'sqlite':
+        op.execute("""
+            CREATE VIRTUAL TABLE jobs_fts USING fts5(
+                title, specialization, location, description,
+                content='jobs', content_rowid='id', tokenize='porter unicode61'
+            )
+        """)
+        op.execute("""
+            CREATE TRIGGER jobs_fts_insert AFTER INSERT ON jobs BEGIN
+                INSERT INTO jobs_fts(rowid, title, specialization, location, description)
+                VALUES (new.id, new.title, new.specialization, new.location, new.description);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER jobs_fts_delete AFTER DELETE ON jobs BEGIN
+                INSERT INTO jobs_fts(jobs_fts, rowid, title, specialization, location, description)
+                VALUES ('delete', old.id, old.title, old.specialization, old.location, old.description);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER jobs_fts_update AFTER UPDATE OF title, specialization, location, description ON jobs BEGIN
+                INSERT INTO jobs_fts(jobs_fts, rowid, title, specialization, location, description)
+                VALUES ('delete', old.id, old.title, old.specialization, old.location, old.description);
+                INSERT INTO jobs_fts(rowid, title, specialization, location, description)
+                VALUES (new.id, new.title, new.specialization, new.location, new.description);
+            END
+        """)
+        op.execute("INSERT INTO jobs_fts(jobs_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+
+    if dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_jobs_search_vector')
+        op.execute('ALTER TABLE jobs DROP COLUMN IF EXISTS search_vector')
+
+    elif dialect == 'sqlite':
+        op.execute('DROP TRIGGER IF EXISTS jobs_fts_update')
+        op.execute('DROP TRIGGER IF EXISTS jobs_fts_delete')
+        op.execute('DROP TRIGGER IF EXISTS jobs_fts_insert')
+        op.execute('DROP TABLE IF EXISTS jobs_fts')
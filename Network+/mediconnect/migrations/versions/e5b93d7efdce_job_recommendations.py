@@ -0,0 +1,41 @@
+"""job recommendations
+
+Revision ID: e5b93d7efdce
+Revises: ff27ca8cd4f6
+Create Date: 2026-10-18 03:44:14.730495
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b93d7efdce'
+down_revision = 'ff27ca8cd4f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job_recommendations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('doctor_id', sa.Integer(), nullable=False),
+    sa.Column('job_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['doctor_id'], ['doctors.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['job_id'], ['jobs.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('doctor_id', 'job_id', name='unique_doctor_job_recommendation')
+    )
+    with op.batch_alter_table('job_recommendations', schema=None) as batch_op:
+        batch_op.create_index('ix_job_recommendations_doctor_id_score_job_id', ['doctor_id', 'score', 'job_id'], unique=False)
+        batch_op.create_index('ix_job_recommendations_job_id', ['job_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('job_recommendations', schema=None) as batch_op:
+        batch_op.drop_index('ix_job_recommendations_job_id')
+        batch_op.drop_index('ix_job_recommendations_doctor_id_score_job_id')
+
+    op.drop_table('job_recommendations')
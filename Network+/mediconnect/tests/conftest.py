@@ -0,0 +1,20 @@
+import pytest
+
+from app import create_app
+from app.models import db
+
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def login(client, username, password='password'):
+    response = client.post('/auth/login', data={'username': username, 'password': password})
+    assert response.status_code == 302
+    return client
@@ -0,0 +1,25 @@
+import pytest
+
+from app.explain import check_routes
+from app.models import db
+from app.seed import seed_dataset
+
+
+@pytest.fixture
+def seeded(app):
+    seed_dataset()
+    db.session.execute(db.text('ANALYZE'))
+    return app
+
+
+def test_list_routes_use_index_scans(seeded):
+    failures = check_routes()
+    assert failures == [], [(endpoint, url, tables) for endpoint, url, tables, _ in failures]
+
+
+def test_a_missing_index_is_reported(seeded):
+    db.session.execute(db.text('DROP INDEX ix_job_applications_doctor_id_applied_at_id'))
+    db.session.execute(db.text('ANALYZE'))
+
+    failures = check_routes()
+    assert ('doctor.my_applications', ['job_applications']) in [(endpoint, tables) for endpoint, _, tables, _ in failures]
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.cache import LRUCache, cache
+from app.models import db, User, LoginAttempt
+from app.passwords import login_throttle
+
+
+@pytest.fixture
+def client(app):
+    user = User(username='doctor', email='doctor@example.com', role='doctor', is_verified=True)
+    user.set_password('password')
+    db.session.add(user)
+    db.session.commit()
+    app.config.update(LOGIN_MAX_ATTEMPTS=3, LOGIN_MAX_ATTEMPTS_PER_IP=10)
+    return app.test_client()
+
+
+def attempt(client, password, address='10.0.0.1'):
+    return client.post('/auth/login', data={'username': 'doctor', 'password': password},
+                       environ_base={'REMOTE_ADDR': address})
+
+
+def test_failures_are_counted_once_each(client):
+    for _ in range(7):
+        login_throttle.failed('Doctor', '10.0.0.1')
+
+    counts = dict(db.session.execute(db.select(LoginAttempt.key, LoginAttempt.count)).all())
+    assert sorted(counts.values()) == [7, 7]
+
+
+def test_locked_out_after_max_attempts(client):
+    for _ in range(3):
+        assert attempt(client, 'wrong').status_code == 302
+
+    response = attempt(client, 'password')
+    assert response.status_code == 429
+    assert 0 < int(response.headers['Retry-After']) <= 900
+
+
+def test_page_cache_churn_keeps_the_counters(app, client):
+    app.extensions['cache'] = LRUCache(max_entries=2)
+    for _ in range(3):
+        attempt(client, 'wrong')
+        for page in range(5):
+            cache.set(('page', page), 'body')
+    cache.clear()
+
+    assert attempt(client, 'password').status_code == 429
+
+
+def test_address_limit(client):
+    for _ in range(10):
+        login_throttle.failed(f'user{_}', '10.0.0.2')
+
+    assert attempt(client, 'password', '10.0.0.2').status_code == 429
+    assert attempt(client, 'password', '10.0.0.3').status_code == 302
+
+
+def test_success_clears_the_username(client):
+    for _ in range(2):
+        attempt(client, 'wrong')
+    assert attempt(client, 'password').status_code == 302
+
+    assert login_throttle.retry_after('doctor', '10.0.0.4') == 0
+    assert db.session.scalar(db.select(db.func.count()).select_from(LoginAttempt)) == 1
+
+
+def test_expired_window_starts_again(client):
+    for _ in range(3):
+        login_throttle.failed('doctor', '10.0.0.1')
+    db.session.execute(db.update(LoginAttempt).values(window_start=datetime.utcnow() - timedelta(seconds=901)))
+    db.session.commit()
+
+    assert login_throttle.retry_after('doctor', '10.0.0.1') == 0
+    login_throttle.failed('doctor', '10.0.0.1')
+    assert db.session.scalars(db.select(LoginAttempt.count)).all() == [1, 1]
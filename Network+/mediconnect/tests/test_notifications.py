@@ -0,0 +1,97 @@
+import pytest
+from sqlalchemy import event
+
+from app.hospital.routes import review_applications
+from app.models import db, User, Doctor, Hospital, Job, JobApplication, Task
+from app.notifications import queue_status_notifications
+from app.stats import compute_counters, read_counters
+from tests.conftest import login
+
+
+@pytest.fixture
+def application(app):
+    hospital_user = User(username='hospital', email='hospital@example.com', role='hospital', is_verified=True)
+    hospital_user.set_password('password')
+    doctor_user = User(username='doctor', email='doctor@example.com', role='doctor', is_verified=True)
+    doctor_user.set_password('password')
+    db.session.add_all([hospital_user, doctor_user])
+    db.session.flush()
+
+    hospital = Hospital(user_id=hospital_user.id, hospital_name='General')
+    doctor = Doctor(user_id=doctor_user.id, full_name='Doctor', specialization='Cardiology')
+    db.session.add_all([hospital, doctor])
+    db.session.flush()
+
+    job = Job(hospital_id=hospital.id, title='Cardiologist', specialization='Cardiology', description='Heart work')
+    db.session.add(job)
+    db.session.flush()
+
+    application = JobApplication(job_id=job.id, doctor_id=doctor.id, status='pending')
+    db.session.add(application)
+    db.session.commit()
+    return application.id
+
+
+@pytest.fixture
+def client(app, application):
+    return login(app.test_client(), 'hospital')
+
+
+def queued_statuses():
+    tasks = Task.query.filter_by(name='notify_application_status').order_by(Task.id)
+    return [task.payload['status'] for task in tasks]
+
+
+def test_every_status_change_is_notified(client, application):
+    for status in ('accepted', 'rejected', 'accepted'):
+        client.post(f'/hospital/application/{application}/review', data={'status': status})
+
+    assert queued_statuses() == ['accepted', 'rejected', 'accepted']
+
+
+def test_unchanged_status_is_not_notified(client, application):
+    client.post(f'/hospital/application/{application}/review', data={'status': 'accepted'})
+    client.post(f'/hospital/application/{application}/review', data={'status': 'accepted'})
+
+    assert queued_statuses() == ['accepted']
+
+
+def test_bulk_review_notifies_repeated_statuses(client, application):
+    for status in ('accepted', 'rejected', 'accepted'):
+        client.post('/hospital/applications/review', json={'items': [{'id': application, 'status': status}]})
+
+    assert queued_statuses() == ['accepted', 'rejected', 'accepted']
+
+
+def test_double_submitted_review_is_notified_once(client, application):
+    hospital_id = db.session.get(JobApplication, application).job.hospital_id
+    duplicates = []
+
+    def submit_duplicate(conn, cursor, statement, parameters, context, executemany):
+        # The same review, submitted again, lands between the first one's
+        # read and its UPDATE
+        if statement.startswith('UPDATE job_applications') and not duplicates:
+            duplicates.append(None)
+            duplicates[0] = review_applications(hospital_id, {application: 'accepted'})
+
+    event.listen(db.engine, 'before_cursor_execute', submit_duplicate)
+    try:
+        results = review_applications(hospital_id, {application: 'accepted'})
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', submit_duplicate)
+    db.session.commit()
+
+    assert results == duplicates[0] == {application: 'updated'}
+    assert queued_statuses() == ['accepted']
+    assert db.session.get(JobApplication, application).status_version == 1
+    stored = {name: value for name, value in read_counters('hospital', hospital_id).items() if value}
+    assert stored == {name: value for (scope, scope_id, name), value in compute_counters().items()
+                      if (scope, scope_id) == ('hospital', hospital_id) and value}
+
+
+def test_requeued_change_is_notified_once(client, application):
+    client.post(f'/hospital/application/{application}/review', data={'status': 'accepted'})
+    queue_status_notifications([(application, 'accepted', 1)])
+    db.session.commit()
+
+    assert queued_statuses() == ['accepted']
@@ -0,0 +1,104 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from werkzeug.exceptions import BadRequest
+
+from app.models import db, User, Hospital, Job
+from app.pagination import decode_cursor, encode_cursor, keyset_paginate
+from tests.conftest import login
+
+
+@pytest.fixture
+def jobs(app):
+    """23 jobs over 5 creation times, so most pages start or end inside a tie"""
+    user = User(username='hospital', email='hospital@example.com', role='hospital', is_verified=True)
+    user.set_password('password')
+    hospital = Hospital(user=user, hospital_name='General')
+    start = datetime(2024, 1, 1)
+    db.session.add_all([
+        Job(hospital=hospital, title=f'Job {i}', specialization='Cardiology', description='Work',
+            created_at=start + timedelta(days=i % 5))
+        for i in range(23)
+    ])
+    db.session.commit()
+    # The order keyset_paginate must reproduce
+    return [job.id for job in Job.query.order_by(Job.created_at.desc(), Job.id.desc())]
+
+
+def page(cursor=None, per_page=4):
+    return keyset_paginate(Job.query, Job.created_at, Job.id, cursor=cursor, per_page=per_page)
+
+
+def ids(result):
+    return [job.id for job in result.items]
+
+
+def test_walks_every_row_once_across_ties(jobs):
+    seen, result = [], page()
+    assert not result.has_prev
+    while True:
+        seen += ids(result)
+        if not result.has_next:
+            break
+        result = page(result.next_cursor)
+
+    assert seen == jobs
+
+
+def test_walks_back_to_the_first_page(jobs):
+    forward = [page()]
+    while forward[-1].has_next:
+        forward.append(page(forward[-1].next_cursor))
+
+    backward = [forward[-1]]
+    while backward[-1].has_prev:
+        backward.append(page(backward[-1].prev_cursor))
+
+    assert [ids(result) for result in reversed(backward)] == [ids(result) for result in forward]
+    assert sum((ids(result) for result in reversed(backward)), []) == jobs
+
+
+def test_direction_changes(jobs):
+    first = page()
+    second = page(first.next_cursor)
+    third = page(second.next_cursor)
+
+    back = page(third.prev_cursor)
+    assert ids(back) == ids(second)
+    assert back.has_prev and back.has_next
+    assert ids(page(back.next_cursor)) == ids(third)
+    assert ids(page(back.prev_cursor)) == ids(first)
+    assert not page(back.prev_cursor).has_prev
+
+
+def test_numeric_sort_values_round_trip():
+    token = encode_cursor('next', 0.75, 12)
+    assert decode_cursor(token) == ('next', 0.75, 12)
+
+
+def token(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('cursor', [
+    'not-a-cursor!',
+    base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+    token(['next', '2024-01-01T00:00:00']),
+    token(['sideways', '2024-01-01T00:00:00', 1]),
+    token(['next', '2024-01-01T00:00:00', '1']),
+    token(['next', 'yesterday', 1]),
+    token(['next', True, 1]),
+    token(['next', [1], 1]),
+    token({'direction': 'next'}),
+])
+def test_malformed_cursors_are_rejected(app, cursor):
+    with pytest.raises(BadRequest):
+        decode_cursor(cursor)
+
+
+def test_malformed_cursor_is_a_bad_request(app, jobs):
+    client = login(app.test_client(), 'hospital')
+    assert client.get('/hospital/my-jobs?cursor=not-a-cursor!').status_code == 400
+    assert client.get('/hospital/my-jobs?cursor=' + token(['prev', 'x', 1])).status_code == 400
@@ -0,0 +1,45 @@
+import random
+from collections import namedtuple
+
+import pytest
+
+from app import recommendations
+from app.recommendations import score, top_matches
+
+DoctorRow = namedtuple('DoctorRow', 'id specialization experience_years location')
+JobRow = namedtuple('JobRow', 'id specialization experience_required location')
+
+
+@pytest.fixture
+def rows():
+    rng = random.Random(7)
+    specializations = ['Cardiology', 'cardiology ', 'Neurology', 'Surgery', None, '']
+    locations = ['Boston', 'boston', 'Chicago', None]
+    doctors = [DoctorRow(i, rng.choice(specializations), rng.choice([None, 0, 2, 5, 10]), rng.choice(locations))
+               for i in range(1, 120)]
+    jobs = [JobRow(i, rng.choice(specializations), rng.choice([None, 0, 3, 8, 12]), rng.choice(locations))
+            for i in range(1, 900)]
+    return doctors, jobs
+
+
+def scores_by_doctor(matches):
+    result = {}
+    for doctor_id, _, value in matches:
+        result.setdefault(doctor_id, []).append(value)
+    return {doctor_id: sorted(values) for doctor_id, values in result.items()}
+
+
+@pytest.mark.parametrize('k, min_score, job_chunk', [(20, 0.5, 2048), (5, 0.3, 7), (1, 0.5, 64), (50, 0.0, 100)])
+def test_chunked_numpy_scoring_matches_python(monkeypatch, rows, k, min_score, job_chunk):
+    pytest.importorskip('numpy')
+    doctors, jobs = rows
+    chunked = list(top_matches(doctors, jobs, k, min_score, job_chunk))
+    monkeypatch.setattr(recommendations, 'numpy', None)
+    expected = list(top_matches(doctors, jobs, k, min_score))
+
+    # Equal scores may be broken by a different job; the scores kept are the same
+    assert scores_by_doctor(chunked) == scores_by_doctor(expected)
+    jobs_by_id = {job.id: job for job in jobs}
+    assert all(value == round(score(doctors[doctor_id - 1], jobs_by_id[job_id]), 4)
+               for doctor_id, job_id, value in chunked)
+    assert len({(doctor_id, job_id) for doctor_id, job_id, _ in chunked}) == len(chunked)
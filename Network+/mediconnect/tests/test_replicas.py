@@ -0,0 +1,106 @@
+import time
+
+import pytest
+from sqlalchemy import event
+
+from app import create_app
+from app.models import db, User, Doctor, Job
+from app.replicas import PIN_SESSION_KEY
+from config import TestingConfig
+from tests.conftest import login
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """An app with a SQLite primary and a SQLite replica holding the same rows.
+
+    No application context is left pushed, so every request gets its own
+    session rather than reading from a shared identity map.
+    """
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path / "primary.db"}')
+    monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_REPLICA_URLS', [f'sqlite:///{tmp_path / "replica.db"}'])
+    app = create_app('testing')
+    with app.app_context():
+        primary, replica = db.engines[None], db.engines['replica_0']
+        db.metadata.create_all(primary)
+        db.metadata.create_all(replica)
+
+        user = User(username='doctor', email='doctor@example.com', role='doctor', is_verified=True)
+        user.set_password('password')
+        db.session.add(Doctor(user=user, full_name='Doctor', specialization='Cardiology'))
+        db.session.commit()
+        with primary.connect() as source, replica.begin() as target:
+            for table in db.metadata.sorted_tables:
+                rows = [row._asdict() for row in source.execute(table.select())]
+                if rows:
+                    target.execute(table.insert(), rows)
+        db.session.remove()
+    yield app
+    # init_app registered a metadata for the bind on the shared db object
+    db.metadatas.pop('replica_0', None)
+
+
+@pytest.fixture
+def engines_used(app):
+    """Records 'primary' or 'replica' for every statement executed"""
+    used = []
+    with app.app_context():
+        for name, engine in (('primary', db.engines[None]), ('replica', db.engines['replica_0'])):
+            event.listen(engine, 'before_cursor_execute', lambda *args, name=name: used.append(name))
+    return used
+
+
+def test_reads_in_read_only_requests_use_the_replica(app, engines_used):
+    for method in ('GET', 'HEAD', 'OPTIONS'):
+        with app.test_request_context('/', method=method):
+            db.session.execute(db.select(User)).all()
+            db.session.remove()
+    assert engines_used == ['replica'] * 3
+
+
+def test_reads_in_other_requests_use_the_primary(app, engines_used):
+    with app.test_request_context('/', method='POST'):
+        db.session.execute(db.select(User)).all()
+        db.session.remove()
+    # CLI commands and background work
+    with app.app_context():
+        db.session.execute(db.select(User)).all()
+    assert engines_used == ['primary', 'primary']
+
+
+def test_writes_use_the_primary(app, engines_used):
+    with app.test_request_context('/', method='GET'):
+        db.session.execute(db.update(User).values(is_verified=False))
+        doctor = Doctor.query.one()
+        doctor.location = 'Boston'
+        db.session.flush()
+        db.session.rollback()
+
+    # The UPDATE, the SELECT of the doctor, then the flushed UPDATE
+    assert engines_used == ['primary', 'replica', 'primary']
+
+
+def test_reads_follow_writes_to_the_primary(app, engines_used):
+    client = login(app.test_client(), 'doctor')
+    with client.session_transaction() as session:
+        session.pop(PIN_SESSION_KEY, None)
+
+    engines_used.clear()
+    assert client.get('/doctor/profile').status_code == 200
+    assert set(engines_used) == {'replica'}
+
+    engines_used.clear()
+    client.post('/doctor/profile', data={'full_name': 'Doctor Who', 'specialization': 'Cardiology'})
+    assert set(engines_used) == {'primary'}
+
+    # Read your writes: the next pages come from the primary
+    engines_used.clear()
+    client.get('/doctor/profile')
+    assert set(engines_used) == {'primary'}
+
+    # ... until the pin expires
+    with client.session_transaction() as session:
+        session[PIN_SESSION_KEY] = time.time() - 1
+    engines_used.clear()
+    client.get('/doctor/profile')
+    assert set(engines_used) == {'replica'}
@@ -0,0 +1,144 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.archive import archive_batch, purge
+from app.models import db, User, Doctor, Hospital, Job, JobApplication, StatCounter
+from app.seed import seed_dataset
+from app.stats import compute_admin_stats, compute_counters, read_counters
+from tests.conftest import login
+
+
+@pytest.fixture
+def seeded(app):
+    seed_dataset(hospitals=3, jobs_per_hospital=4, doctors=6, applications_per_doctor=3)
+    return app
+
+
+def assert_counters_match():
+    """The stored counters of every scope equal a recount of the base tables"""
+    expected = compute_counters()
+    scopes = {(scope, scope_id) for scope, scope_id, _ in expected} | set(
+        db.session.execute(db.select(StatCounter.scope, StatCounter.scope_id).distinct()).all()
+    )
+    for scope, scope_id in scopes:
+        stored = {name: value for name, value in read_counters(scope, scope_id).items() if value}
+        recount = {name: value for (s, i, name), value in expected.items() if (s, i) == (scope, scope_id) and value}
+        assert stored == recount, (scope, scope_id)
+
+
+def hospital_user(index=0):
+    return User.query.filter_by(username=f'hospital{index}').one()
+
+
+def doctor_user(index=0):
+    return User.query.filter_by(username=f'doctor{index}').one()
+
+
+def test_seeded_rows_are_counted(seeded):
+    assert read_counters()['jobs.total'] == 12
+    assert_counters_match()
+
+
+def test_orm_updates(seeded):
+    first, second = hospital_user(0).hospital, hospital_user(1).hospital
+    job = first.jobs[0]
+    job.status = 'closed' if job.status == 'active' else 'active'
+    job.specialization = 'Neurology'
+
+    application = JobApplication.query.filter(JobApplication.job_id.in_([j.id for j in first.jobs])).first()
+    application.status = 'accepted'
+    # Moves the application to another hospital's counters
+    application.job = next(j for j in second.jobs if application.doctor_id not in [a.doctor_id for a in j.applications])
+
+    user = doctor_user(0)
+    user.is_verified = not user.is_verified
+    db.session.commit()
+
+    assert_counters_match()
+
+
+def test_orm_deletes(seeded):
+    db.session.delete(hospital_user(0).hospital.jobs[0])
+    db.session.delete(JobApplication.query.first())
+    db.session.delete(User.query.filter_by(username='admin0').one())
+    db.session.commit()
+
+    assert_counters_match()
+
+
+def test_insert_ignore_paths(seeded):
+    client = seeded.test_client()
+    form = {'username': 'newdoctor', 'email': 'new@example.com', 'password': 'password',
+            'confirm_password': 'password', 'role': 'doctor'}
+    client.post('/auth/register', data=form)
+    # Taken username: nothing is inserted or counted
+    client.post('/auth/register', data=dict(form, email='other@example.com'))
+    assert User.query.filter_by(username='newdoctor').count() == 1
+    assert_counters_match()
+
+    login(client, 'doctor0')
+    doctor = doctor_user(0).doctor
+    job = Job.query.filter(~Job.applications.any(JobApplication.doctor_id == doctor.id)).first()
+    client.post(f'/doctor/apply-job/{job.id}', data={'cover_letter': 'Hello'})
+    client.post(f'/doctor/apply-job/{job.id}', data={'cover_letter': 'Hello again'})
+    assert JobApplication.query.filter_by(job_id=job.id, doctor_id=doctor.id).count() == 1
+    assert_counters_match()
+
+
+def test_review_applications(seeded):
+    hospital = hospital_user(0).hospital
+    applications = JobApplication.query.join(Job).filter(Job.hospital_id == hospital.id).order_by(JobApplication.id).all()
+    assert len(applications) >= 2
+    client = login(seeded.test_client(), 'hospital0')
+
+    client.post(f'/hospital/application/{applications[0].id}/review', data={'status': 'accepted'})
+    assert_counters_match()
+
+    client.post('/hospital/applications/review', json={'items': [
+        {'id': application.id, 'status': status}
+        for application, status in zip(applications, ['rejected', 'reviewed', 'accepted', 'reviewed'])
+    ]})
+    assert_counters_match()
+
+
+def test_archive(seeded):
+    jobs = Job.query.order_by(Job.id).limit(3).all()
+    for job in jobs:
+        job.status = 'closed'
+    db.session.commit()
+    db.session.execute(db.update(Job).where(Job.id.in_([job.id for job in jobs])).values(
+        updated_at=datetime.utcnow() - timedelta(days=400)
+    ))
+    db.session.commit()
+
+    archived, _ = archive_batch(datetime.utcnow() - timedelta(days=180), 100)
+    db.session.commit()
+
+    assert archived >= 3
+    assert_counters_match()
+
+
+def test_soft_delete_and_purge(seeded):
+    doctor_id, hospital_id = doctor_user(0).id, hospital_user(0).id
+    hospital_profile_id = hospital_user(0).hospital.id
+    users_before = read_counters()['users.total']
+    client = login(seeded.test_client(), 'admin0')
+    client.post(f'/admin/user/{doctor_id}/deactivate')
+    client.post(f'/admin/user/{hospital_id}/deactivate')
+    assert_counters_match()
+
+    # Deactivated users leave the counts and the user list at once, and the
+    # hospital's postings close before anything is purged
+    assert read_counters()['users.total'] == users_before - 2
+    assert compute_admin_stats()['total_users'] == users_before - 2
+    assert Job.query.filter_by(hospital_id=hospital_profile_id, status='active').count() == 0
+    page = client.get('/admin/users').get_data(as_text=True)
+    assert '<td>doctor0</td>' not in page and '<td>hospital0</td>' not in page and '<td>doctor1</td>' in page
+
+    purge(doctor_id)
+    purge(hospital_id)
+
+    assert db.session.get(User, doctor_id) is None
+    assert db.session.get(User, hospital_id) is None
+    assert_counters_match()